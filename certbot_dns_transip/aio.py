@@ -0,0 +1,259 @@
+# -*- coding: UTF-8 -*-
+# File: aio.py
+"""Asyncio backend for the Transip API, running all requests of a batch on a single event loop."""
+
+import asyncio
+import json
+import logging
+import re
+import ssl
+import time
+from urllib.parse import urlsplit
+
+from .base import TRANSIP_EXCEPTIONS
+from .cassette import AsyncCassetteSession
+from .exceptions import TransipHTTPError, TransipIOError, TransipParsingError
+from .rest import _RestTransipClient
+from .retry import entry_created, entry_deleted
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+LOGGER = logging.getLogger(__name__)
+
+
+class _AsyncHTTPSession:
+    """
+    Minimal HTTP/1.1 client with a pool of keep-alive connections to a single host.
+
+    A session belongs to the event loop it is used in, and should be closed before that loop ends.
+    """
+
+    def __init__(self, url, max_connections, options):
+        self.options = options
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() if parts.scheme == 'https' else None
+        self.base_path = parts.path.rstrip('/')
+        self._idle = []
+        self._semaphore = asyncio.Semaphore(max_connections)
+
+    async def request(self, method, path, headers, body=None):
+        """
+        Send a request, reusing an idle connection when there is one.
+
+        :param str method: The HTTP method.
+        :param str path: The path, relative to the URL of the session.
+        :param dict headers: Extra request headers.
+        :param bytes body: The request body.
+        :returns: The status code, the (lower case) response headers and the response body.
+        :rtype: `tuple`
+        """
+        async with self._semaphore:
+            while True:
+                reused = bool(self._idle)
+                reader, writer = self._idle.pop() if reused else await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.options.connect_timeout)
+                try:
+                    status, response_headers, content = await asyncio.wait_for(
+                        self._exchange(reader, writer, method, self.base_path + path, headers, body),
+                        self.options.read_timeout)
+                except asyncio.TimeoutError:
+                    writer.close()
+                    raise
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    writer.close()
+                    if reused:  # the server may have closed the idle connection, try another one
+                        continue
+                    raise
+                if not self.options.keep_alive or len(self._idle) >= self.options.pool_size or \
+                        response_headers.get('connection', '').lower() == 'close':
+                    writer.close()
+                else:
+                    self._idle.append((reader, writer))
+                return status, response_headers, content
+
+    async def _exchange(self, reader, writer, method, path, headers, body):
+        lines = ['{0} {1} HTTP/1.1'.format(method, path), 'Host: {0}'.format(self.host),
+                 'Content-Length: {0}'.format(len(body or b'')),
+                 'Connection: {0}'.format('keep-alive' if self.options.keep_alive else 'close')]
+        lines.extend('{0}: {1}'.format(name, value) for name, value in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (body or b''))
+        await writer.drain()
+
+        head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        status = int(head[0].split(' ')[1])
+        response_headers = {}
+        for line in head[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                response_headers[name.strip().lower()] = value.strip()
+
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            content = b''
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            content = b''
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if not size:
+                    while (await reader.readline()) not in (b'\r\n', b''):
+                        pass
+                    break
+                content += await reader.readexactly(size)
+                await reader.readexactly(2)
+        elif 'content-length' in response_headers:
+            content = await reader.readexactly(int(response_headers['content-length']))
+        else:
+            content = await reader.read()
+            response_headers['connection'] = 'close'
+        return status, response_headers, content
+
+    async def close(self):
+        """Close all idle connections."""
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+
+class _Headers(dict):
+    """Response headers, with the case insensitive lookup of `requests` responses."""
+
+    def get(self, key, default=None):
+        return super(_Headers, self).get(key.lower(), default)
+
+
+class _AsyncTransipClient(_RestTransipClient):
+    """
+    Transip API client that updates all domains of a batch concurrently on one event loop.
+
+    Authentication, the caches and the base domain resolution are shared with `_RestTransipClient`. The domain
+    listing and every batch of domain updates run in their own `asyncio.run`, with at most `max_workers`
+    requests at the same time. Connections can't outlive the event loop they were opened in, so the pool of
+    keep-alive connections is shared by all requests of one `asyncio.run`.
+    """
+
+    default_max_workers = 8
+
+    def __init__(self, *args, **kwargs):
+        super(_AsyncTransipClient, self).__init__(*args, **kwargs)
+        self._session = None
+
+    def _run(self, coroutine_function, *args):
+        async def run():
+            self._session = _AsyncHTTPSession(self.api_url, self.max_workers, self.http_options)
+            if self.cassette is not None:
+                self._session = AsyncCassetteSession(self._session, self.cassette)
+            try:
+                return await coroutine_function(*args)
+            finally:
+                await self._session.close()
+                self._session = None
+        return asyncio.run(run())
+
+    def _fetch_domain_names(self):
+        return self._run(self._fetch_domain_names_async)
+
+    def _for_each_zone(self, function, zones):
+        operation = getattr(self, function.__name__ + '_async')
+
+        async def run(zone):
+            try:
+                await operation(*zone)
+            except TRANSIP_EXCEPTIONS as error:
+                return error
+            return None
+
+        async def run_all():
+            return await asyncio.gather(*(run(zone) for zone in zones.items()))
+
+        return list(zip(zones, self._run(run_all)))
+
+    def _valid_token(self):
+        # getting the client renews the token when it is about to expire
+        return self.client.headers['Authorization'][len('Bearer '):]
+
+    async def _api(self, method, path, data=None, applied=None):
+        """
+        Make an API request, re-authenticating once when the access token is rejected.
+
+        Requests failing with a temporary error are retried according to the retry policy.
+
+        :param applied: For a request that is not idempotent, see `RetryPolicy.call`.
+        :raises certbot_dns_transip.exceptions.TransipError: when the request fails.
+        """
+        # the domain is left out of the name, so the metrics of all domains are counted together
+        name = '{0} {1}'.format(method, re.sub(r'^/domains/[^/]+', '/domains/{domain}', path))
+        return await self.retry_policy.call_async(name, self._api_once, name, method, path, data, applied=applied)
+
+    async def _api_once(self, name, method, path, data):
+        body = json.dumps(data).encode() if data is not None else None
+        for attempt in range(2):
+            token = self._valid_token()
+            headers = {'Authorization': 'Bearer {0}'.format(token), 'Accept': 'application/json'}
+            if body is not None:
+                headers['Content-Type'] = 'application/json'
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async()
+            started = time.perf_counter()
+            try:
+                status, response_headers, content = await self._session.request(method, path, headers, body)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as error:
+                if self.metrics is not None:
+                    self.metrics.observe(name, time.perf_counter() - started, type(error).__name__)
+                raise TransipIOError('{0} {1}: {2}'.format(method, path, error))
+            if self.metrics is not None:
+                self.metrics.observe(name, time.perf_counter() - started, None if 200 <= status < 300 else str(status))
+
+            if status == 401 and not attempt:
+                with self._auth_lock:
+                    if self._token == token:
+                        self.logger.debug('Access token was rejected, re-authenticating')
+                        self._authenticate(rejected=True)
+                continue
+            if not 200 <= status < 300:
+                try:
+                    message = json.loads(content.decode())['error']
+                except (ValueError, KeyError, TypeError):
+                    message = content.decode('utf-8', 'replace')
+                raise TransipHTTPError(message, status, _Headers(response_headers))
+            try:
+                return json.loads(content.decode()) if content else None
+            except ValueError:
+                raise TransipParsingError('Failed to parse the API response as JSON')
+        raise TransipHTTPError('Access token rejected', 401)
+
+    async def _fetch_domain_names_async(self):
+        return [domain['name'] for domain in (await self._api('GET', '/domains'))['domains']]
+
+    async def _add_zone_records_async(self, canonical_domain, new_records):
+        await self._run_steps_async(canonical_domain, self._add_zone_steps(canonical_domain, new_records))
+
+    async def _del_zone_records_async(self, canonical_domain, zone_records):
+        await self._run_steps_async(canonical_domain, self._del_zone_steps(canonical_domain, zone_records))
+
+    async def _read_zone_async(self, canonical_domain, _):
+        await self._run_steps_async(canonical_domain, self._read_zone_steps(canonical_domain))
+
+    async def _run_steps_async(self, canonical_domain, steps):
+        """Like `_run_steps`, with the `_async` variants of the hooks."""
+        result = None
+        while True:
+            try:
+                hook, *args = steps.send(result)
+            except StopIteration:
+                return
+            result = await getattr(self, hook + '_async')(canonical_domain, *args)
+
+    async def _dns_entries_async(self, canonical_domain):
+        return (await self._api('GET', '/domains/{0}/dns'.format(canonical_domain)))['dnsEntries']
+
+    async def _create_entry_async(self, canonical_domain, entry):
+        await self._api('POST', '/domains/{0}/dns'.format(canonical_domain), {'dnsEntry': entry}, applied=entry_created)
+
+    async def _replace_entries_async(self, canonical_domain, entries):
+        await self._api('PUT', '/domains/{0}/dns'.format(canonical_domain), {'dnsEntries': entries})
+
+    async def _delete_entry_async(self, canonical_domain, entry):
+        await self._api('DELETE', '/domains/{0}/dns'.format(canonical_domain), {'dnsEntry': entry},
+                        applied=entry_deleted)
@@ -0,0 +1,730 @@
+# -*- coding: UTF-8 -*-
+# File: base.py
+"""Logic shared by all backends of the Transip API client, imported when the plugin makes its first API call."""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from certbot import errors
+from certbot.plugins import dns_common
+
+from .cassette import REPLAY_TOKEN
+from .exceptions import TransipError, TransipHTTPError
+from .keys import load_private_key
+from .options import HTTPOptions
+from .retry import RetryPolicy
+from .session import create_session
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+LOGGER = logging.getLogger(__name__)
+API_URL = 'https://api.transip.nl/v6'
+TRANSIP_EXCEPTIONS = (
+    TransipError,
+    requests.exceptions.RequestException,
+)
+# tokens are requested with the API default lifetime of 30 minutes
+TOKEN_LIFETIME = 30 * 60
+# renew the token this many seconds before it would expire
+TOKEN_REFRESH_MARGIN = 60
+
+
+def _operation_name(operation):
+    """The name of an API method for logging, like `DnsEntryService.create`."""
+    name = getattr(operation, '__name__', 'request')
+    if hasattr(operation, '__self__'):
+        return '{0}.{1}'.format(type(operation.__self__).__name__, name)
+    return name
+
+
+class _TransipClientBase:
+    """
+    Encapsulates all communication with the Transip API, apart from the requests themselves.
+
+    A backend creates the API client in `_new_client` and implements the hooks that fetch domain names and
+    nameservers, and that read and change the DNS entries of a domain: `_dns_entries`, `_create_entry`,
+    `_replace_entries` and `_delete_entry`. Failed requests raise the exceptions of
+    `certbot_dns_transip.exceptions`.
+    """
+
+    default_max_workers = 1
+
+    def __init__(self, username, key_file, global_key, token_cache=None, domain_cache=None, max_workers=None,
+                 http_options=None, retry_policy=None, rate_limiter=None, api_url=None, metrics=None,
+                 cassette=None, private_key=None, profiler=None):
+        self.logger = LOGGER.getChild(self.__class__.__name__)
+        self.api_url = api_url or API_URL
+        self.username = username
+        self.key_file = key_file
+        # the RSA key itself in PEM format, used instead of the key file
+        self.private_key = private_key
+        self.global_key = global_key
+        self.token_cache = token_cache
+        self.domain_cache = domain_cache
+        self.max_workers = max_workers or self.default_max_workers
+        self.http_options = http_options or HTTPOptions()
+        self.cassette = cassette
+        self.session = create_session(self.http_options, cassette)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+        # profiles the calls made in worker threads, see `profiling.Profiler`
+        self.profiler = profiler
+        self._auth_lock = threading.Lock()
+        self._client = None
+        self._token_expires = 0
+        self._domains = None
+        self._domains_from_cache = False
+        self._base_domains = {}
+        self._nameservers = {}
+        # the DNS entries of every domain read in this run, kept up to date with the changes made since
+        self._zone_snapshots = {}
+        # whether this client makes all changes to the domains, like the broker does: only then the records of a
+        # domain may be written by replacing all its DNS entries, which would undo changes made at the same time
+        self.owns_zones = False
+
+    @property
+    def client(self):
+        """
+        The authenticated API client of the backend, shared by all calls made through this object.
+
+        The access token is renewed shortly before it expires.
+        """
+        if self._client is None or time.time() >= self._token_expires:
+            with self._auth_lock:
+                if self._client is None or time.time() >= self._token_expires:
+                    self._authenticate()
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._share_session(client)
+        self._client = client
+        self._token_expires = time.time() + TOKEN_LIFETIME - TOKEN_REFRESH_MARGIN
+
+    @property
+    def _token(self):
+        if self._client is None:
+            return None
+        return self._client.headers['Authorization'][len('Bearer '):]
+
+    def _authenticate(self, rejected=False):
+        """
+        Get a valid access token, from the token cache if one is configured, or by logging in.
+
+        :param bool rejected: Whether the current token was rejected by the API, and should not be reused.
+        """
+        if self.cassette is not None and self.cassette.replaying:
+            # the recorded responses don't need a valid token, and logins are never recorded
+            self._use_token(REPLAY_TOKEN, time.time() + TOKEN_LIFETIME)
+            return
+        if self.token_cache is None:
+            self._login()
+            return
+
+        with self.token_cache.entry(self.username, self.global_key) as entry:
+            if rejected and entry.get('token') == self._token:
+                entry.clear()
+            if entry.get('expires', 0) - TOKEN_REFRESH_MARGIN > time.time():
+                self.logger.debug('Using cached Transip API access token for user %s', self.username)
+                self._use_token(entry['token'], entry['expires'])
+                return
+            self._login()
+            entry.update(token=self._token, expires=self._token_expires + TOKEN_REFRESH_MARGIN)
+
+    def _login(self):
+        """
+        Request a new access token using the RSA key, which is only parsed for the first login of the process.
+
+        The first token creates the client, later tokens are swapped into the existing client so objects
+        obtained through it (like domains) stay usable.
+        """
+        self.logger.debug('Requesting Transip API access token for user %s', self.username)
+        private_key = load_private_key(self.key_file, self.private_key)
+        # every attempt signs a request with a new nonce, so a failed login can be retried like other calls
+        client = self.retry_policy.call('auth', self._login_once, private_key)
+        if self._client is None:
+            self.client = client
+        else:
+            self._use_token(client.headers['Authorization'][len('Bearer '):], time.time() + TOKEN_LIFETIME)
+
+    def _login_once(self, private_key):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        if self.metrics is None:
+            return self._new_client(login=self.username, private_key=private_key, global_key=self.global_key)
+        with self.metrics.timer('auth'):
+            return self._new_client(login=self.username, private_key=private_key, global_key=self.global_key)
+
+    def _new_client(self, **kwargs):
+        """
+        Create the API client of the backend.
+
+        :param kwargs: The `login` and either an `access_token`, or the `private_key` and `global_key` to log in.
+        :returns: The client, with the access token in its `headers`.
+        """
+        raise NotImplementedError()
+
+    def _share_session(self, client):
+        """Let the requests of an API client share the connections of this client."""
+
+    def _use_token(self, token, expires):
+        if self._client is None:
+            self._client = self._new_client(login=self.username, access_token=token)
+            self._share_session(self._client)
+        else:
+            self._client.headers['Authorization'] = 'Bearer {0}'.format(token)
+        self._token_expires = expires - TOKEN_REFRESH_MARGIN
+
+    def _request(self, operation, *args, applied=None, **kwargs):
+        """
+        Call an API operation, re-authenticating once when the access token is rejected.
+
+        Calls failing with a temporary error are retried according to the retry policy.
+
+        :param operation: The bound API method to call, like `self.client.domains.get` of python-transip.
+        :param applied: For an operation that is not idempotent, see `RetryPolicy.call`.
+        :returns: The result of the operation.
+        """
+        return self.retry_policy.call(_operation_name(operation), self._request_once, operation, *args,
+                                      applied=applied, **kwargs)
+
+    def _request_once(self, operation, *args, **kwargs):
+        if time.time() >= self._token_expires:
+            # operations of objects obtained earlier, like domains, don't renew the token through `client`
+            self.client  # pylint: disable=pointless-statement
+        token = self._token
+        try:
+            return self._call(operation, *args, **kwargs)
+        except TransipHTTPError as error:
+            if error.response_code != 401:
+                raise
+            with self._auth_lock:
+                # another thread may have renewed the token already
+                if self._token == token:
+                    self.logger.debug('Access token was rejected (%s), re-authenticating', error)
+                    self._authenticate(rejected=True)
+            return self._call(operation, *args, **kwargs)
+
+    def _call(self, operation, *args, **kwargs):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        if self.metrics is None:
+            return self._send(operation, *args, **kwargs)
+        with self.metrics.timer(_operation_name(operation)):
+            return self._send(operation, *args, **kwargs)
+
+    def _send(self, operation, *args, **kwargs):
+        """Call an API method, turning the errors of the API client into those of this package."""
+        return operation(*args, **kwargs)
+
+    def add_txt_record(self, domain_name, record_name, record_content):
+        """
+        Add a TXT record using the supplied information.
+
+        The record is added like by `add_txt_records`, so records added one at a time share the domain and its
+        DNS entries read for the first one.
+
+        :param str domain_name: The domain to use to associate the record with.
+        :param str record_name: The record name (typically beginning with '_acme-challenge.').
+        :param str record_content: The record content (typically the challenge validation).
+        :raises certbot.errors.PluginError: if an error occurs communicating with the Transip API
+        """
+        self.add_txt_records([(domain_name, record_name, record_content)])
+
+    def add_txt_records(self, records):
+        """
+        Add TXT records, the domains at the same time when `max_workers` allows.
+
+        The DNS entries of every domain are read once per run, and only records that are not in the domain yet
+        are sent, every record with its own create, so the records other processes add at the same time are kept.
+        When the client `owns_zones`, more records are sent at once by replacing all entries of the domain, after
+        reading them again. Domains that already have all records (like on a retry of a failed run) are not updated
+        at all.
+
+        :param list records: The (domain_name, record_name, record_content) tuples of the records to add.
+        :raises certbot.errors.PluginError: if an error occurs communicating with the Transip API
+        """
+        failures = [
+            '{0}: {1}'.format(canonical_domain, error)
+            for canonical_domain, error in self._for_each_zone(self._add_zone_records, self._group_records(records))
+            if error is not None
+        ]
+        if failures:
+            raise errors.PluginError('Error adding TXT records using the Transip API: {0}'.format('; '.join(failures)))
+
+    def try_add_txt_records(self, records):
+        """
+        Add TXT records like `add_txt_records`, with the result of every record instead of a single error.
+
+        Like with `del_txt_records`, a failure for one domain doesn't stop the records of other domains from being
+        added.
+
+        :param list records: The (domain_name, record_name, record_content) tuples of the records to add.
+        :returns: For every record in the order given, None if it was added, or the error that prevented it.
+        :rtype: `dict`
+        """
+        results = dict.fromkeys(records)
+        domains = {}
+        for record in records:
+            try:
+                domains[record] = self._find_domain(record[0])
+            except errors.PluginError as error:
+                results[record] = str(error)
+
+        zones = self._group_records(list(domains))
+        errors_by_domain = dict(self._for_each_zone(self._add_zone_records, zones))
+        for record, canonical_domain in domains.items():
+            error = errors_by_domain[canonical_domain]
+            if error is None:
+                results[record] = None
+            else:
+                results[record] = 'Error adding TXT records to {0} using the Transip API: {1}'.format(
+                    canonical_domain, error)
+        return results
+
+    def _add_zone_records(self, canonical_domain, new_records):
+        self._run_steps(canonical_domain, self._add_zone_steps(canonical_domain, new_records))
+
+    def _add_zone_steps(self, canonical_domain, new_records):
+        """
+        Add records to a domain, as the steps done by `_run_steps`.
+
+        Every step is the name of a hook for the DNS entries of the domain, with its arguments, and gets the result
+        of the hook back, so the same steps are done by the threaded and the asyncio backends.
+
+        :param str canonical_domain: The domain.
+        :param list new_records: The records to add.
+        """
+        snapshot = entries = self._zone_snapshots.get(canonical_domain)
+        if entries is None:
+            # also for a single record: the snapshot lets a rerun skip records that are there already, cleanup
+            # skip records that are gone, and later records of the domain be added without reading it again
+            entries = yield '_dns_entries',
+        missing = self._missing_records(entries, new_records)
+        if len(missing) > 1 and self.owns_zones:
+            if snapshot is not None:
+                # other tools may have changed the domain since the snapshot, so add to what is there now
+                entries = yield '_dns_entries',
+                missing = self._missing_records(entries, new_records)
+            if missing:
+                yield '_replace_entries', entries + missing
+        else:
+            # a replace would undo the changes other processes make to the domain in the meantime
+            for record in missing:
+                yield '_create_entry', record
+        self._zone_snapshots[canonical_domain] = entries + missing
+
+    def _run_steps(self, canonical_domain, steps):
+        """
+        Do the steps of a change to a domain, see `_add_zone_steps`.
+
+        :param str canonical_domain: The domain.
+        :param steps: The generator of the steps.
+        """
+        result = None
+        while True:
+            try:
+                hook, *args = steps.send(result)
+            except StopIteration:
+                return
+            result = getattr(self, hook)(canonical_domain, *args)
+
+    def _dns_entries(self, canonical_domain):
+        """
+        Get the DNS entries of a domain.
+
+        :param str canonical_domain: The domain.
+        :returns: The DNS entries, as dicts.
+        :rtype: `list`
+        """
+        raise NotImplementedError()
+
+    def _create_entry(self, canonical_domain, entry):
+        """
+        Add a DNS entry to a domain.
+
+        :param str canonical_domain: The domain.
+        :param dict entry: The DNS entry.
+        """
+        raise NotImplementedError()
+
+    def _replace_entries(self, canonical_domain, entries):
+        """
+        Replace all DNS entries of a domain.
+
+        :param str canonical_domain: The domain.
+        :param list entries: The new DNS entries, as dicts.
+        """
+        raise NotImplementedError()
+
+    def _delete_entry(self, canonical_domain, entry):
+        """
+        Remove a DNS entry from a domain.
+
+        :param str canonical_domain: The domain.
+        :param dict entry: The DNS entry.
+        """
+        raise NotImplementedError()
+
+    def _missing_records(self, entries, new_records):
+        """
+        Get the records that are not in the DNS entries of a domain yet.
+
+        :param list entries: The DNS entries (as dicts) of the domain.
+        :param list new_records: The records to add.
+        :returns: The records to send.
+        :rtype: `list`
+        """
+        existing = set(self._record_key(entry) for entry in entries)
+        missing = [record for record in new_records if self._record_key(record) not in existing]
+        if len(missing) < len(new_records):
+            self.logger.debug('Skipping %d TXT records that are already present', len(new_records) - len(missing))
+        return missing
+
+    def del_txt_record(self, domain_name, record_name, record_content):
+        """
+        Delete a TXT record using the supplied information.
+
+        Note that both the record's name and content are used to ensure that similar records
+        created concurrently (e.g., due to concurrent invocations of this plugin) are not deleted.
+
+        :param str domain_name: The domain to use to associate the record with.
+        :param str record_name: The record name (typically beginning with '_acme-challenge.').
+        :param str record_content: The record content (typically the challenge validation).
+        :raises certbot.errors.PluginError: if the record could not be deleted.
+        """
+        record = (domain_name, record_name, record_content)
+        error = self.del_txt_records([record])[record]
+        if error:
+            raise errors.PluginError(error)
+
+    def del_txt_records(self, records):
+        """
+        Delete TXT records, the domains at the same time when `max_workers` allows.
+
+        Every record gets its own delete, so the records other processes add at the same time are kept. When the
+        client `owns_zones`, the DNS entries of a domain with more records to delete are read and replaced at once
+        by the entries that don't match any of the records. Like with `del_txt_record`, records only match on both
+        name and content. Records that are already gone count as deleted.
+
+        A failure for one domain doesn't stop the records of other domains from being deleted.
+
+        :param list records: The (domain_name, record_name, record_content) tuples of the records to delete.
+        :returns: For every record, None if it was deleted, or the error that prevented its deletion.
+        :rtype: `dict`
+        """
+        results = {}
+        zones = {}
+        for record in records:
+            domain_name, record_name, record_content = record
+            try:
+                canonical_domain = self._find_domain(domain_name)
+            except errors.PluginError as error:
+                results[record] = str(error)
+                continue
+            zones.setdefault(canonical_domain, {})[record] = self._txt_record(
+                canonical_domain, record_name, record_content)
+
+        for canonical_domain, error in self._for_each_zone(self._del_zone_records, zones):
+            for record in zones[canonical_domain]:
+                if error is None:
+                    results[record] = None
+                else:
+                    results[record] = 'Error removing TXT records from {0} using the Transip API: {1}'.format(
+                        canonical_domain, error)
+        return results
+
+    def _del_zone_records(self, canonical_domain, zone_records):
+        self._run_steps(canonical_domain, self._del_zone_steps(canonical_domain, zone_records))
+
+    def _del_zone_steps(self, canonical_domain, zone_records):
+        """
+        Delete records from a domain, as the steps done by `_run_steps`.
+
+        :param str canonical_domain: The domain.
+        :param dict zone_records: The records to delete.
+        """
+        if len(zone_records) > 1 and (self.owns_zones or canonical_domain not in self._zone_snapshots):
+            # other tools may have changed the domain since the snapshot, so look at what is there now
+            self._zone_snapshots[canonical_domain] = yield '_dns_entries',
+        present = self._present_records(canonical_domain, zone_records)
+        if len(present) > 1 and self.owns_zones:
+            keys = set(self._record_key(txt_record) for txt_record in present)
+            remaining = [entry for entry in self._zone_snapshots[canonical_domain]
+                         if self._record_key(entry) not in keys]
+            yield '_replace_entries', remaining
+            self._zone_snapshots[canonical_domain] = remaining
+            return
+        # a replace would undo the changes other processes make to the domain in the meantime
+        for txt_record in present:
+            yield '_delete_entry', txt_record
+            self._forget_records(canonical_domain, [txt_record])
+
+    def _present_records(self, canonical_domain, zone_records):
+        """
+        Get the records to delete from a domain, leaving out those that are not in the snapshot of the domain.
+
+        :param str canonical_domain: The domain.
+        :param dict zone_records: The records to delete.
+        :returns: The records that may be in the domain.
+        :rtype: `list`
+        """
+        entries = self._zone_snapshots.get(canonical_domain)
+        if entries is None:
+            return list(zone_records.values())
+        existing = set(self._record_key(entry) for entry in entries)
+        present = [record for record in zone_records.values() if self._record_key(record) in existing]
+        if len(present) < len(zone_records):
+            self.logger.debug('Skipping %d TXT records that are already gone', len(zone_records) - len(present))
+        return present
+
+    def _forget_records(self, canonical_domain, records):
+        entries = self._zone_snapshots.get(canonical_domain)
+        if entries is not None:
+            keys = set(self._record_key(record) for record in records)
+            self._zone_snapshots[canonical_domain] = [entry for entry in entries if self._record_key(entry) not in keys]
+
+    def get_dns_entries(self, domain_names):
+        """
+        Read the DNS entries of domains of the account, the domains at the same time when `max_workers` allows.
+
+        The entries are kept as the snapshot of every domain, so `del_dns_entries` doesn't read the domain again.
+
+        :param list domain_names: The domains, as named in the account.
+        :returns: The DNS entries (as dicts) of every domain that was read, and the errors of the other domains.
+        :rtype: `tuple` of two `dict`
+        """
+        entries = {}
+        failures = {}
+        for canonical_domain, error in self._for_each_zone(self._read_zone, dict.fromkeys(domain_names)):
+            if error is None:
+                entries[canonical_domain] = self._zone_snapshots[canonical_domain]
+            else:
+                failures[canonical_domain] = error
+        return entries, failures
+
+    def _read_zone(self, canonical_domain, _):
+        self._run_steps(canonical_domain, self._read_zone_steps(canonical_domain))
+
+    def _read_zone_steps(self, canonical_domain):
+        """
+        Read the DNS entries of a domain into its snapshot, as the steps done by `_run_steps`.
+
+        :param str canonical_domain: The domain.
+        """
+        self._zone_snapshots[canonical_domain] = yield '_dns_entries',
+
+    def del_dns_entries(self, zones):
+        """
+        Delete DNS entries as they were read by `get_dns_entries`, like `del_txt_records` deletes records.
+
+        :param dict zones: The DNS entries (as dicts) to delete, for every domain as named in the account.
+        :returns: For every domain, None if its entries were deleted, or the error that prevented it.
+        :rtype: `dict`
+        """
+        zone_records = dict((canonical_domain, dict((self._record_key(entry), entry) for entry in entries))
+                            for canonical_domain, entries in zones.items())
+        return dict(self._for_each_zone(self._del_zone_records, zone_records))
+
+    def reset_snapshots(self):
+        """
+        Forget the DNS entries read from the domains, so the next change of a domain reads them again.
+
+        A client that lives longer than a run of certbot, like that of the broker, calls this when other tools
+        may have changed the domains in the meantime.
+        """
+        self._zone_snapshots.clear()
+
+    def _for_each_zone(self, function, zones):
+        """
+        Call a function for every domain, using at most `max_workers` threads at the same time.
+
+        :param function: Called with the domain name and the records of the domain.
+        :param dict zones: The records of every domain.
+        :returns: (domain, error) tuples in the order of `zones`, with error None when the call succeeded.
+        :rtype: `list`
+        """
+        def run(zone):
+            try:
+                if self.profiler is None:
+                    function(*zone)
+                else:
+                    self.profiler.call(function, *zone)
+            except TRANSIP_EXCEPTIONS as error:
+                return error
+            return None
+
+        if self.max_workers <= 1 or len(zones) <= 1:
+            results = [run(zone) for zone in zones.items()]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(zones))) as executor:
+                results = list(executor.map(run, zones.items()))
+        return list(zip(zones, results))
+
+    def get_nameservers(self, domain_name):
+        """
+        Get the nameservers of the domain a name is part of.
+
+        :param str domain_name: The domain name.
+        :returns: The hostnames of the nameservers.
+        :rtype: `list` of `str`
+        :raises certbot.errors.PluginError: if an error occurs communicating with the Transip API
+        """
+        canonical_domain = self._find_domain(domain_name)
+        if canonical_domain not in self._nameservers:
+            try:
+                self._nameservers[canonical_domain] = self._fetch_nameservers(canonical_domain)
+            except TRANSIP_EXCEPTIONS as error:
+                raise errors.PluginError('Error finding nameservers of {0} using the Transip API: {1}'
+                                         .format(canonical_domain, error))
+        return self._nameservers[canonical_domain]
+
+    def get_zone(self, domain_name):
+        """
+        Get the domain of the account a name is part of.
+
+        :param str domain_name: The domain name.
+        :returns: The domain.
+        :rtype: `str`
+        :raises certbot.errors.PluginError: if no matching domain is found.
+        """
+        return self._find_domain(domain_name)
+
+    def get_domain_names(self):
+        """
+        Get the names of all domains in the account, see `_get_domains`.
+
+        :returns: The domain names.
+        :rtype: `frozenset` of `str`
+        :raises certbot.errors.PluginError: if the domains could not be fetched, or there are none.
+        """
+        return self._get_domains()
+
+    def _fetch_nameservers(self, canonical_domain):
+        """Get the hostnames of the nameservers of a domain from the API."""
+        raise NotImplementedError()
+
+    def _find_domain(self, domain_name):
+        """
+        Find the domain object for a given domain name.
+
+        The longest registered domain that the name is part of is used. Results are remembered for the rest
+        of the run.
+
+        :param str domain_name: The domain name for which to find the corresponding Domain.
+        :returns: The Domain, if found.
+        :rtype: `str`
+        :raises certbot.errors.PluginError: if no matching Domain is found.
+        """
+        if domain_name in self._base_domains:
+            return self._base_domains[domain_name]
+
+        domain_name_guesses = dns_common.base_domain_name_guesses(domain_name)
+
+        known = self._domains is not None
+        domains = self._get_domains()
+        guess = self._match_domain(domain_name, domain_name_guesses, domains)
+        if guess is None and (known or self._domains_from_cache):
+            self.logger.debug('No base domain found for %s, fetching the domains again', domain_name)
+            domains = self._get_domains(refresh=True)
+            guess = self._match_domain(domain_name, domain_name_guesses, domains)
+        if guess is not None:
+            self._base_domains[domain_name] = guess
+            return guess
+
+        raise errors.PluginError('Unable to determine base domain for {0} using names: {1} and domains: {2}.'
+                                 .format(domain_name, domain_name_guesses, sorted(domains)))
+
+    def _match_domain(self, domain_name, domain_name_guesses, domains):
+        # the guesses are ordered from the full name to the top level domain, so the first hit is the longest
+        for guess in domain_name_guesses:
+            if guess in domains:
+                self.logger.debug('Found base domain for %s using name %s', domain_name, guess)
+                return guess
+        return None
+
+    def _get_domains(self, refresh=False):
+        """
+        Get the names of all domains in the account.
+
+        The names are kept for the rest of the run, and in the domain cache if one is configured.
+
+        :param bool refresh: Fetch the names from the Transip API, even when they are cached.
+        :returns: The domain names.
+        :rtype: `frozenset` of `str`
+        :raises certbot.errors.PluginError: if the domains could not be fetched, or there are none.
+        """
+        if self._domains is not None and not refresh:
+            return self._domains
+
+        domains = None
+        if self.domain_cache is not None and not refresh:
+            domains = self.domain_cache.get(self.username)
+        self._domains_from_cache = domains is not None
+        if domains is None:
+            try:
+                domains = self._fetch_domain_names()
+            except TRANSIP_EXCEPTIONS as error:
+                raise errors.PluginError('Error finding domain using the Transip API: {0}'.format(error))
+
+            if not domains:
+                raise errors.PluginError("Transip API returned no domains")
+
+            if self.domain_cache is not None:
+                self.domain_cache.store(self.username, domains)
+
+        self._domains = frozenset(domains)
+        self._base_domains = {}
+        return self._domains
+
+    def _fetch_domain_names(self):
+        """Get the names of all domains in the account from the API."""
+        raise NotImplementedError()
+
+    def _group_records(self, records):
+        """
+        Group records by the domain they are part of, and by name within the domain.
+
+        The values of a name, like those of the challenges of a domain and its wildcard, are kept together as one
+        record set, and duplicate values are sent once.
+
+        :param list records: The (domain_name, record_name, record_content) tuples of the records.
+        :returns: The TXT records (in the format used by the Transip API) for every domain, the names in order of
+            appearance.
+        :rtype: `dict`
+        :raises certbot.errors.PluginError: if no matching Domain is found for a record.
+        """
+        record_sets = {}
+        for domain_name, record_name, record_content in records:
+            canonical_domain = self._find_domain(domain_name)
+            record = self._txt_record(canonical_domain, record_name, record_content)
+            record_set = record_sets.setdefault((canonical_domain, record['name']), [])
+            if record not in record_set:
+                record_set.append(record)
+        zones = {}
+        for (canonical_domain, _), record_set in record_sets.items():
+            zones.setdefault(canonical_domain, []).extend(record_set)
+        return zones
+
+    @classmethod
+    def _txt_record(cls, domain, record_name, record_content):
+        return {
+            "name": cls._compute_record_name(domain, record_name),
+            "type": "TXT",
+            "content": record_content,
+            "expire": 1,
+        }
+
+    @staticmethod
+    def _record_key(record):
+        return record['name'], record['type'], record['content']
+
+    @staticmethod
+    def _compute_record_name(domain, full_record_name):
+        # The domain, from Transip's point of view, is automatically appended.
+        return full_record_name.rpartition("." + domain)[0]
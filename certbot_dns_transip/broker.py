@@ -0,0 +1,362 @@
+# -*- coding: UTF-8 -*-
+# File: broker.py
+"""Broker that makes the TXT record changes of many certbot processes, with a single update per domain."""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+from certbot import errors
+from certbot.plugins import dns_common
+
+from .dns_transip import BACKENDS, _client_class, _client_options
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+LOGGER = logging.getLogger(__name__)
+# seconds the broker waits for requests of other processes before updating the domains
+WINDOW = 0.5
+# seconds a process waits for the answer of the broker
+TIMEOUT = 600.0
+# the largest request the broker reads, in bytes
+MAX_REQUEST_SIZE = 1024 * 1024
+ACTIONS = ('add', 'delete')
+
+
+def _send_request(path, request, timeout):
+    """
+    Send a request to the broker listening on a Unix socket, and wait for its answer.
+
+    Requests and answers are JSON objects on a single line.
+
+    :param str path: The socket of the broker.
+    :param dict request: The request.
+    :param float timeout: The number of seconds to wait for the broker.
+    :returns: The answer.
+    :rtype: `dict`
+    :raises OSError: if the broker can't be reached.
+    :raises ValueError: if the answer is not a JSON object.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(path)
+        connection.sendall(json.dumps(request).encode() + b'\n')
+        with connection.makefile('rb') as response:
+            answer = json.loads(response.readline().decode())
+    if not isinstance(answer, dict):
+        raise ValueError('Unexpected answer of the broker')
+    return answer
+
+
+class BrokerClient:
+    """
+    Sends the TXT record changes of the plugin to the broker, or to the Transip API when no broker is running.
+
+    When the broker can't be reached, or doesn't serve the account, the rest of the run uses the client of the backend
+    directly, like without a broker.
+    """
+
+    def __init__(self, path, username, create_client, timeout=TIMEOUT):
+        """
+        :param str path: The socket of the broker.
+        :param str username: The Transip username, which should be the account of the broker.
+        :param create_client: Called without arguments to create the client used when there's no broker.
+        :param float timeout: The number of seconds to wait for the broker.
+        """
+        self.path = path
+        self.username = username
+        self.timeout = timeout
+        self._create_client = create_client
+        self._direct_client = None
+        # set when the broker could not be used, after which the rest of the run uses the direct client
+        self._direct = False
+
+    def _client(self):
+        if self._direct_client is None:
+            self._direct_client = self._create_client()
+        return self._direct_client
+
+    def _send(self, action, records):
+        """
+        Let the broker make changes.
+
+        :returns: For every record, None if the change was made, or the error that prevented it. None if the
+            broker was not used.
+        :rtype: `dict`
+        """
+        if self._direct:
+            return None
+        request = {'action': action, 'username': self.username, 'records': [list(record) for record in records]}
+        try:
+            answer = _send_request(self.path, request, self.timeout)
+            if 'error' in answer:
+                raise ValueError(answer['error'])
+            if len(answer['results']) != len(records):
+                raise ValueError('Unexpected answer of the broker')
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            LOGGER.info('Not using the broker at %s (%s), using the Transip API directly', self.path, error)
+            self._direct = True
+            return None
+        return dict(zip(records, answer['results']))
+
+    def add_txt_records(self, records):
+        """See `_TransipClientBase.add_txt_records`."""
+        records = [tuple(record) for record in records]
+        results = self._send('add', records)
+        if results is None:
+            self._client().add_txt_records(records)
+            return
+        failures = sorted(set(error for error in results.values() if error))
+        if failures:
+            raise errors.PluginError('Error adding TXT records using the broker: {0}'.format('; '.join(failures)))
+
+    def del_txt_records(self, records):
+        """See `_TransipClientBase.del_txt_records`."""
+        records = [tuple(record) for record in records]
+        results = self._send('delete', records)
+        if results is None:
+            return self._client().del_txt_records(records)
+        return results
+
+    def add_txt_record(self, domain_name, record_name, record_content):
+        """See `_TransipClientBase.add_txt_record`."""
+        self.add_txt_records([(domain_name, record_name, record_content)])
+
+    def del_txt_record(self, domain_name, record_name, record_content):
+        """See `_TransipClientBase.del_txt_record`."""
+        record = (domain_name, record_name, record_content)
+        error = self.del_txt_records([record])[record]
+        if error:
+            raise errors.PluginError(error)
+
+    def get_nameservers(self, domain_name):
+        """See `_TransipClientBase.get_nameservers`, which is always asked directly, also while using the broker."""
+        return self._client().get_nameservers(domain_name)
+
+    def get_zone(self, domain_name):
+        """See `_TransipClientBase.get_zone`, which is always asked directly, also while using the broker."""
+        return self._client().get_zone(domain_name)
+
+
+class _Request:
+    """A request of a process, waiting for its batch to be done."""
+
+    def __init__(self, action, records):
+        self.action = action
+        self.records = records
+        self.results = None
+        self.done = threading.Event()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline(MAX_REQUEST_SIZE).decode())
+            action, username = request['action'], request['username']
+            records = [tuple(record) for record in request['records']]
+            if action not in ACTIONS:
+                raise ValueError('unknown action {0!r}'.format(action))
+            if not all(len(record) == 3 and all(isinstance(part, str) for part in record) for record in records):
+                raise ValueError('records should be (domain, name, content) lists')
+        except (ValueError, KeyError, TypeError) as error:
+            answer = {'error': 'Invalid request: {0}'.format(error)}
+        else:
+            answer = self.server.broker.handle(action, username, records)
+        self.wfile.write(json.dumps(answer).encode() + b'\n')
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # connections of processes starting at the same time wait to be accepted, instead of being refused
+    request_queue_size = 128
+
+
+class Broker:
+    """
+    Makes the TXT record changes of the plugin processes using the Transip API.
+
+    The processes send their requests to a Unix socket. The requests received within `window` seconds of each
+    other form a batch, in which the records of all requests for the same domain are added (or deleted) with a
+    single update of the domain. Every process gets the results of its own records.
+
+    The broker keeps one client, so one access token and one listing of the domains, for all processes. The DNS
+    entries of the domains are read again for every batch, other tools may have changed them since.
+    """
+
+    def __init__(self, transip_client, path, window=WINDOW):
+        """
+        :param transip_client: The client of the account.
+        :type transip_client: `certbot_dns_transip.base._TransipClientBase`
+        :param str path: The Unix socket to listen on.
+        :param float window: The number of seconds to wait for requests of other processes.
+        """
+        self.transip_client = transip_client
+        # all processes make their changes through the broker, so a batch may replace the entries of a domain
+        self.transip_client.owns_zones = True
+        self.path = path
+        self.window = window
+        self._condition = threading.Condition()
+        self._pending = []
+        self._closed = False
+        self._server = None
+        self._worker = None
+
+    def start(self):
+        """
+        Listen on the socket, and start making the changes of the batches.
+
+        :raises certbot.errors.PluginError: if another broker is listening on the socket.
+        """
+        if os.path.exists(self.path):
+            try:
+                _send_request(self.path, {}, 1)
+            except OSError:
+                os.unlink(self.path)  # left behind by a broker that was killed
+            else:
+                raise errors.PluginError('Another broker is listening on {0}'.format(self.path))
+        umask = os.umask(0o177)  # only the user running certbot may connect
+        try:
+            self._server = _UnixServer(self.path, _RequestHandler)
+        finally:
+            os.umask(umask)
+        self._server.broker = self
+        self._worker = threading.Thread(target=self._run, name='broker')
+        self._worker.start()
+        LOGGER.info('Broker for Transip user %s listening on %s', self.transip_client.username, self.path)
+
+    def serve_forever(self):
+        """Answer requests until `shutdown` is called."""
+        self._server.serve_forever()
+
+    def shutdown(self):
+        """Stop `serve_forever`, from another thread."""
+        self._server.shutdown()
+
+    def close(self):
+        """Finish the pending requests, and remove the socket."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._worker is not None:
+            self._worker.join()
+        if self._server is not None:
+            self._server.server_close()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def handle(self, action, username, records):
+        """
+        Make the changes of a request in the next batch.
+
+        :param str action: Either 'add' or 'delete'.
+        :param str username: The account of the process.
+        :param list records: The (domain_name, record_name, record_content) tuples of the records.
+        :returns: The answer for the process.
+        :rtype: `dict`
+        """
+        if username != self.transip_client.username:
+            return {'error': 'the broker serves Transip user {0}'.format(self.transip_client.username)}
+        request = _Request(action, records)
+        with self._condition:
+            if self._closed:
+                return {'error': 'the broker is stopping'}
+            self._pending.append(request)
+            self._condition.notify()
+        request.done.wait()
+        return {'results': request.results}
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+            if not self._closed:
+                time.sleep(self.window)
+            with self._condition:
+                batch, self._pending = self._pending, []
+            self._process(batch)
+
+    def _process(self, batch):
+        """Make the changes of a batch, in the order of the requests."""
+        self.transip_client.reset_snapshots()
+        for action, requests in itertools.groupby(batch, key=lambda request: request.action):
+            requests = list(requests)
+            records = list(dict.fromkeys(record for request in requests for record in request.records))
+            LOGGER.info('%s %d TXT records for %d requests', 'Adding' if action == 'add' else 'Deleting',
+                        len(records), len(requests))
+            try:
+                if action == 'add':
+                    results = self.transip_client.try_add_txt_records(records)
+                else:
+                    results = self.transip_client.del_txt_records(records)
+            except Exception as error:  # pylint: disable=broad-except
+                # the processes are waiting for an answer, whatever went wrong
+                LOGGER.exception('Failed to process a batch of requests')
+                results = dict.fromkeys(records, str(error))
+            for request in requests:
+                request.results = [results[record] for record in request.records]
+                request.done.set()
+
+
+def _stop(*_):
+    sys.exit(0)
+
+
+def main(argv=None):
+    """Entry point of the `certbot-dns-transip-broker` command."""
+    parser = argparse.ArgumentParser(
+        description='Make the TXT record changes of many certbot processes using the Transip API, with a single '
+                    'update per domain. Processes use the broker when dns_transip_broker_socket is set in their '
+                    'credentials file.')
+    parser.add_argument('--credentials', required=True, help='The credentials INI file of the plugin.')
+    parser.add_argument('--socket',
+                        help='The Unix socket to listen on (default: dns_transip_broker_socket of the credentials).')
+    parser.add_argument('--window', type=float, default=WINDOW,
+                        help='The number of seconds to wait for requests of other processes before updating the '
+                             'domains (default: %(default)s).')
+    parser.add_argument('--backend', default='transip', choices=BACKENDS,
+                        help='The client used for the Transip API (default: %(default)s).')
+    parser.add_argument('--max-workers', type=int,
+                        help='The number of domains to update at the same time.')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Log the API calls.')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+    try:
+        credentials = dns_common.CredentialsConfiguration(args.credentials, lambda name: 'dns_transip_' + name)
+        credentials.require({'username': 'Transip username'})
+        path = args.socket or credentials.conf('broker_socket')
+        if not path:
+            raise ValueError('Please set dns_transip_broker_socket in the credentials file, or use --socket')
+        transip_client = _client_class(args.backend)(max_workers=args.max_workers, **_client_options(credentials))
+        broker = Broker(transip_client, path, args.window)
+        broker.start()
+    except (errors.PluginError, ValueError, OSError) as error:
+        sys.stderr.write('{0}\n'.format(error))
+        return 2
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,352 @@
+# -*- coding: UTF-8 -*-
+# File: bulk.py
+"""Renewal of many certificates at once, waiting for the propagation of all their TXT records only once."""
+
+import argparse
+import collections
+import datetime
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+from urllib.parse import urlparse
+
+import configobj
+import josepy as jose
+from acme import challenges, client as acme_client, crypto_util, errors as acme_errors, messages
+from certbot import achallenges, errors
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from . import __version__
+from .dns_transip import Authenticator
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+LOGGER = logging.getLogger(__name__)
+PLUGIN_NAME = 'dns-transip'
+CONFIG_DIR = '/etc/letsencrypt'
+SERVER = 'https://acme-v02.api.letsencrypt.org/directory'
+# certificates expiring later are not renewed, unless forced, like certbot does for lineages without
+# renew_before_expiry
+RENEW_BEFORE = datetime.timedelta(days=30)
+_INTERVAL = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(second|minute|hour|day|week)s?\s*$', re.IGNORECASE)
+# seconds the ACME server may take to validate the challenges
+TIMEOUT = 300
+
+Certificate = collections.namedtuple('Certificate', ['name', 'domains', 'server', 'account', 'credentials', 'lineage'])
+
+
+def _renew_before(name, value):
+    """
+    Parse the renew_before_expiry of a lineage, like '30 days' or '2 weeks'.
+
+    :param str name: The name of the lineage.
+    :param str value: The interval, or None when the lineage doesn't set it.
+    :rtype: `datetime.timedelta`
+    :raises certbot.errors.Error: if the interval could not be parsed.
+    """
+    if not value:
+        return RENEW_BEFORE
+    match = _INTERVAL.match(value)
+    if match is None:
+        raise errors.Error('Unable to parse renew_before_expiry {0!r} of the lineage {1}'.format(value, name))
+    return datetime.timedelta(**{match.group(2).lower() + 's': float(match.group(1))})
+
+
+def read_lineage(config_dir, name):
+    """
+    Read the certificate of a lineage, and the renewal parameters it was obtained with.
+
+    :param str config_dir: The certbot configuration directory.
+    :param str name: The name of the lineage.
+    :returns: The certificate, and when it is due for renewal: `renew_before_expiry` of the lineage (30 days by
+        default) before it expires.
+    :rtype: `tuple`
+    :raises certbot.errors.Error: if the lineage could not be read, or doesn't use the plugin.
+    """
+    path = os.path.join(config_dir, 'renewal', name + '.conf')
+    try:
+        renewal = configobj.ConfigObj(path, file_error=True, encoding='utf-8')
+        with open(renewal['cert'], 'rb') as handle:
+            cert = x509.load_pem_x509_certificate(handle.read())
+    except (OSError, KeyError, configobj.ConfigObjError, ValueError) as error:
+        raise errors.Error('Unable to read the lineage {0}: {1}'.format(name, error))
+    params = renewal.get('renewalparams', {})
+    if params.get('authenticator') != PLUGIN_NAME:
+        raise errors.Error('The lineage {0} does not use the {1} authenticator'.format(name, PLUGIN_NAME))
+    try:
+        domains = cert.extensions.get_extension_for_class(
+            x509.SubjectAlternativeName).value.get_values_for_type(x509.DNSName)
+    except x509.ExtensionNotFound:
+        domains = []
+    certificate = Certificate(name=name, domains=domains, server=params.get('server', SERVER),
+                              account=params.get('account'), credentials=params.get('dns_transip_credentials'),
+                              lineage=True)
+    return certificate, cert.not_valid_after_utc - _renew_before(name, renewal.get('renew_before_expiry'))
+
+
+def _accounts_dir(config_dir, server):
+    parsed = urlparse(server)
+    return os.path.join(config_dir, 'accounts', parsed.netloc + parsed.path)
+
+
+def default_account(config_dir, server):
+    """
+    Get the id of the only ACME account that certbot registered with a server.
+
+    :param str config_dir: The certbot configuration directory.
+    :param str server: The directory URL of the ACME server.
+    :rtype: `str`
+    :raises certbot.errors.Error: if there is no account, or more than one.
+    """
+    try:
+        accounts = sorted(os.listdir(_accounts_dir(config_dir, server)))
+    except OSError:
+        accounts = []
+    if len(accounts) != 1:
+        raise errors.Error('There are {0} accounts for {1}, please choose one with --account'.format(
+            len(accounts), server))
+    return accounts[0]
+
+
+def load_account(config_dir, server, account):
+    """
+    Load an ACME account that certbot registered.
+
+    :param str config_dir: The certbot configuration directory.
+    :param str server: The directory URL of the ACME server.
+    :param str account: The id of the account.
+    :returns: The account key and registration resource.
+    :rtype: `tuple`
+    :raises certbot.errors.Error: if the account could not be read.
+    """
+    account_dir = os.path.join(_accounts_dir(config_dir, server), account)
+    try:
+        with open(os.path.join(account_dir, 'private_key.json')) as handle:
+            key = jose.JWK.json_loads(handle.read())
+        with open(os.path.join(account_dir, 'regr.json')) as handle:
+            regr = messages.RegistrationResource.json_loads(handle.read())
+    except (OSError, jose.DeserializationError) as error:
+        raise errors.Error('Unable to read the ACME account {0}: {1}'.format(account, error))
+    return key, regr
+
+
+def _acme_client(server, key, regr):
+    net = acme_client.ClientNetwork(key, account=regr,
+                                    user_agent='certbot-dns-transip/{0}'.format(__version__.strip()))
+    return acme_client.ClientV2(acme_client.ClientV2.get_directory(server, net), net)
+
+
+def _plugin_config(credentials, **values):
+    """The configuration of the plugin, with its defaults for the options that are not given."""
+    config = argparse.Namespace()
+    prefix = PLUGIN_NAME.replace('-', '_') + '_'
+
+    def add(name, **kwargs):
+        setattr(config, prefix + name.replace('-', '_'), kwargs.get('default'))
+
+    Authenticator.add_parser_arguments(add)
+    setattr(config, prefix + 'credentials', credentials)
+    for name, value in values.items():
+        setattr(config, prefix + name, value)
+    return config
+
+
+class BulkValidator:
+    """
+    Validates the domains of many certificates, with a single propagation wait for all of them.
+
+    The orders of all certificates are created first, and the TXT records of all their dns-01 challenges are added
+    with one call to the authenticator, which updates every zone once and waits for propagation once. The
+    authorizations that become valid are reused by the ACME server for later orders of the same account, so certbot
+    can then issue the certificates without waiting again.
+    """
+
+    def __init__(self, acme, account_key, authenticator, timeout=TIMEOUT):
+        self.acme = acme
+        self.account_key = account_key
+        self.authenticator = authenticator
+        self.timeout = timeout
+        self._csr_key = None
+
+    def _csr(self, domains):
+        # the orders are never finalized, so all of them can use the same throwaway key
+        if self._csr_key is None:
+            self._csr_key = ec.generate_private_key(ec.SECP256R1()).private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+        return crypto_util.make_csr(self._csr_key, domains)
+
+    def validate(self, certificates):
+        """
+        Validate the domains of the certificates.
+
+        :param list certificates: The `Certificate` objects.
+        :returns: For every certificate name, None when all its domains are valid, or why they are not.
+        :rtype: `dict`
+        """
+        results = collections.OrderedDict()
+        orders = []
+        for certificate in certificates:
+            try:
+                orders.append((certificate, self.acme.new_order(self._csr(certificate.domains))))
+            except acme_errors.Error as error:
+                results[certificate.name] = 'Unable to create an order: {0}'.format(error)
+
+        achalls = collections.OrderedDict()
+        for certificate, orderr in orders:
+            for authzr in orderr.authorizations:
+                if authzr.body.status == messages.STATUS_VALID or authzr.uri in achalls:
+                    continue
+                challb = next((challb for challb in authzr.body.challenges
+                               if isinstance(challb.chall, challenges.DNS01)), None)
+                if challb is None:
+                    results[certificate.name] = 'No dns-01 challenge for {0}'.format(authzr.body.identifier.value)
+                    continue
+                achalls[authzr.uri] = achallenges.KeyAuthorizationAnnotatedChallenge(
+                    challb=challb, identifier=authzr.body.identifier, account_key=self.account_key)
+        LOGGER.info('Validating %d names of %d certificates', len(achalls), len(orders))
+
+        achalls = list(achalls.values())
+        try:
+            if achalls:
+                responses = self.authenticator.perform(achalls)
+                for achall, response in zip(achalls, responses):
+                    self.acme.answer_challenge(achall.challb, response)
+            deadline = datetime.datetime.now() + datetime.timedelta(seconds=self.timeout)
+            for certificate, orderr in orders:
+                if certificate.name in results:
+                    continue
+                try:
+                    self.acme.poll_authorizations(orderr, deadline)
+                    results[certificate.name] = None
+                except acme_errors.ValidationError as error:
+                    results[certificate.name] = '; '.join(
+                        '{0}: {1}'.format(authzr.body.identifier.value, _authorization_error(authzr))
+                        for authzr in error.failed_authzrs)
+                except acme_errors.Error as error:
+                    results[certificate.name] = str(error) or error.__class__.__name__
+        finally:
+            if achalls:
+                self.authenticator.cleanup(achalls)
+        return results
+
+
+def _authorization_error(authzr):
+    for challb in authzr.body.challenges:
+        if challb.error is not None:
+            return str(challb.error)
+    return authzr.body.status.name
+
+
+def _certbot_command(certificate, args):
+    command = args.certbot.split() + ['--non-interactive', '--config-dir', args.config_dir]
+    if certificate.lineage:
+        command += ['renew', '--cert-name', certificate.name]
+    else:
+        command += ['certonly', '--cert-name', certificate.name, '--authenticator', PLUGIN_NAME,
+                    '--{0}-credentials'.format(PLUGIN_NAME), certificate.credentials, '--server', certificate.server]
+        if certificate.account:
+            command += ['--account', certificate.account]
+        for domain in certificate.domains:
+            command += ['-d', domain]
+    if args.force:
+        command.append('--force-renewal')
+    return command + args.certbot_args
+
+
+def _certificates(args):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificates = []
+    for name in args.cert_name:
+        certificate, due = read_lineage(args.config_dir, name)
+        if due > now and not args.force:
+            LOGGER.info('Skipping %s, it is not due for renewal until %s', name, due.date())
+            continue
+        certificates.append(certificate._replace(credentials=args.credentials or certificate.credentials))
+    for domains in args.domains:
+        domains = [domain.strip() for domain in domains.split(',') if domain.strip()]
+        certificates.append(Certificate(name=domains[0], domains=domains, server=args.server, account=args.account,
+                                        credentials=args.credentials, lineage=False))
+    for index, certificate in enumerate(certificates):
+        if not certificate.credentials:
+            raise errors.Error('No credentials file for {0}, please use --credentials'.format(certificate.name))
+        if not certificate.account:
+            certificates[index] = certificate._replace(account=default_account(args.config_dir, certificate.server))
+    return certificates
+
+
+def main(argv=None):
+    """Entry point of the `certbot-dns-transip-bulk` command."""
+    parser = argparse.ArgumentParser(
+        description='Renew or obtain many certificates, adding the TXT records of all of them at once and waiting for '
+                    'their propagation only once. The domains are validated first, then certbot is run for every '
+                    'certificate, which reuses the valid authorizations. Arguments after -- are passed to certbot.')
+    parser.add_argument('--config-dir', default=CONFIG_DIR,
+                        help='The certbot configuration directory (default: %(default)s).')
+    parser.add_argument('--cert-name', action='append', default=[],
+                        help='The name of a lineage to renew. Can be given more than once.')
+    parser.add_argument('--domains', action='append', default=[],
+                        help='A comma separated list of domains of a certificate to obtain. The first domain names the '
+                             'certificate. Can be given more than once.')
+    parser.add_argument('--credentials',
+                        help='The credentials INI file of the plugin (default: the one of every lineage).')
+    parser.add_argument('--server', default=SERVER,
+                        help='The ACME directory URL for --domains (default: %(default)s).')
+    parser.add_argument('--account', help='The ACME account for --domains (default: the only account).')
+    parser.add_argument('--propagation-seconds', type=int, default=240,
+                        help='The number of seconds to wait for the TXT records to propagate (default: %(default)s).')
+    parser.add_argument('--propagation-mode', default='sleep', choices=('sleep', 'poll', 'adaptive'),
+                        help='How to wait for the TXT records to propagate (default: %(default)s).')
+    parser.add_argument('--force', action='store_true',
+                        help='Also renew lineages that are not due for renewal yet.')
+    parser.add_argument('--validate-only', action='store_true',
+                        help="Only validate the domains, don't run certbot.")
+    parser.add_argument('--certbot', default='certbot', help='The certbot command (default: %(default)s).')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Log the API calls.')
+    parser.add_argument('certbot_args', nargs='*', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    if not args.cert_name and not args.domains:
+        parser.error('Please give at least one --cert-name or --domains')
+
+    try:
+        certificates = _certificates(args)
+    except errors.Error as error:
+        sys.stderr.write('{0}\n'.format(error))
+        return 2
+
+    groups = collections.OrderedDict()
+    for certificate in certificates:
+        groups.setdefault((certificate.server, certificate.account, certificate.credentials), []).append(certificate)
+    started = time.perf_counter()
+    results = collections.OrderedDict()
+    for (server, account, credentials), group in groups.items():
+        try:
+            key, regr = load_account(args.config_dir, server, account)
+            authenticator = Authenticator(_plugin_config(credentials, propagation_seconds=args.propagation_seconds,
+                                                         propagation_mode=args.propagation_mode), PLUGIN_NAME)
+            results.update(BulkValidator(_acme_client(server, key, regr), key, authenticator).validate(group))
+        except errors.Error as error:
+            results.update((certificate.name, str(error)) for certificate in group)
+    LOGGER.info('Validated the domains of %d certificates in %.1f seconds', len(results),
+                time.perf_counter() - started)
+
+    failed = 0
+    for certificate in certificates:
+        if results.get(certificate.name) is not None:
+            failed += 1
+            sys.stderr.write('Unable to validate {0}: {1}\n'.format(certificate.name, results[certificate.name]))
+        elif not args.validate_only:
+            if subprocess.run(_certbot_command(certificate, args), check=False).returncode:
+                failed += 1
+                sys.stderr.write('Certbot failed for {0}\n'.format(certificate.name))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+# -*- coding: UTF-8 -*-
+# File: cache.py
+"""On-disk caches shared by concurrent certbot invocations."""
+
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, caches are used without locking there
+    fcntl = None
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+LOGGER = logging.getLogger(__name__)
+
+
+@contextmanager
+def locked_json_file(path):
+    """
+    Open a JSON file holding an exclusive lock, creating it with 0600 permissions if needed.
+
+    The yielded dict is written back when it was changed inside the block. Unreadable content is
+    treated as an empty cache.
+
+    :param str path: The file to open.
+    :returns: The decoded content of the file.
+    :rtype: `dict`
+    """
+    file_descriptor = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    with os.fdopen(file_descriptor, 'r+') as handle:
+        os.chmod(path, 0o600)
+        if fcntl:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            data = json.loads(handle.read() or '{}')
+        except ValueError:
+            LOGGER.warning('Ignoring corrupt cache file %s', path)
+            data = {}
+        original = json.dumps(data, sort_keys=True)
+        yield data
+        if json.dumps(data, sort_keys=True) != original:
+            handle.seek(0)
+            handle.truncate()
+            json.dump(data, handle)
+
+
+class TokenCache:
+    """Transip API access tokens kept in a file, keyed by username and key type."""
+
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def _key(username, global_key):
+        return '{0}/{1}'.format(username, 'global' if global_key else 'whitelisted')
+
+    @contextmanager
+    def entry(self, username, global_key):
+        """
+        Lock the cache and yield the token entry for a user.
+
+        The entry is a dict with `token` and `expires` (a unix timestamp) when a token was cached,
+        or an empty dict otherwise. Changes made to it are stored when the block exits. The lock is held
+        for the whole block, so concurrent processes wait for a single login instead of all logging in.
+
+        :param str username: The Transip username.
+        :param bool global_key: Whether the token may be used from any IP address.
+        """
+        key = self._key(username, global_key)
+        with locked_json_file(self.path) as tokens:
+            entry = dict(tokens.get(key, {}))
+            yield entry
+            if entry:
+                tokens[key] = entry
+            else:
+                tokens.pop(key, None)
+
+
+class DomainCache:
+    """The domain names of Transip accounts kept in a file, valid for a limited time."""
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+
+    def get(self, username):
+        """
+        Get the cached domain names of an account.
+
+        :param str username: The Transip username.
+        :returns: The domain names, or None if they were not cached or are older than the TTL.
+        :rtype: `list` of `str`
+        """
+        with locked_json_file(self.path) as inventories:
+            inventory = inventories.get(username)
+        if not inventory or inventory['fetched'] + self.ttl <= time.time():
+            return None
+        return inventory['domains']
+
+    def store(self, username, domains):
+        """
+        Store the domain names of an account.
+
+        :param str username: The Transip username.
+        :param list domains: The domain names.
+        """
+        with locked_json_file(self.path) as inventories:
+            inventories[username] = {'fetched': time.time(), 'domains': list(domains)}
+
+
+class ChallengeRegistry:
+    """
+    The challenge TXT records of Transip accounts that were seen, kept in a file.
+
+    Runs of the plugin register the records they add, with the host and process that owns them, and remove
+    them when cleaning up. The garbage collector registers the challenge records it finds without an owner,
+    to know how long they have been there.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def key(name, content):
+        """
+        The key of a record in the registry.
+
+        :param str name: The full name of the record, like `_acme-challenge.www.example.com`.
+        :param str content: The content of the record.
+        """
+        return '{0} {1}'.format(name, content)
+
+    def add(self, username, keys, owner=None):
+        """
+        Register records, keeping the time they were first registered.
+
+        :param str username: The Transip username.
+        :param list keys: The keys of the records.
+        :param dict owner: The `host` and `pid` of the run owning the records, None for records without owner.
+        """
+        now = time.time()
+        with locked_json_file(self.path) as registry:
+            records = registry.setdefault(username, {})
+            for key in keys:
+                entry = records.get(key) or {'seen': now}
+                if owner is not None:
+                    entry.update(owner)
+                records[key] = entry
+
+    def remove(self, username, keys):
+        """
+        Forget records.
+
+        :param str username: The Transip username.
+        :param list keys: The keys of the records.
+        """
+        with locked_json_file(self.path) as registry:
+            records = registry.get(username, {})
+            for key in keys:
+                records.pop(key, None)
+
+    def get(self, username):
+        """
+        Get the registered records of an account.
+
+        :param str username: The Transip username.
+        :returns: For every key, a dict with the time it was first `seen`, and the `host` and `pid` of its owner.
+        :rtype: `dict`
+        """
+        with locked_json_file(self.path) as registry:
+            return dict(registry.get(username, {}))
@@ -0,0 +1,205 @@
+# -*- coding: UTF-8 -*-
+# File: cassette.py
+"""Recording of Transip API responses to a cassette file, and replaying them offline."""
+
+import asyncio
+import gzip
+import json
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+LOGGER = logging.getLogger(__name__)
+RECORD = 'record'
+REPLAY = 'replay'
+# the access token used when replaying, the real token is never recorded
+REPLAY_TOKEN = 'replay-token'
+# response fields holding secrets, replaced when recording
+REDACTED_FIELDS = frozenset(['authCode', 'token'])
+REDACTED = 'REDACTED'
+# response headers needed to replay a response, all others are left out
+RECORDED_HEADERS = frozenset(['content-type', 'retry-after', 'x-rate-limit-limit', 'x-rate-limit-remaining',
+                              'x-rate-limit-reset'])
+
+
+def _redact(value):
+    if isinstance(value, dict):
+        return dict((key, REDACTED if key in REDACTED_FIELDS and item else _redact(item))
+                    for key, item in value.items())
+    if isinstance(value, list):
+        return [_redact(item) for item in value]
+    return value
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class Cassette:
+    """
+    A file with the responses of the Transip API, one JSON object per line.
+
+    In record mode every response is written to the file, with the secrets redacted: the access token and auth
+    codes in response bodies are replaced, and request bodies and request headers are not written at all. In
+    replay mode responses are served from the file, in the order they were recorded for each method and path.
+    When a path was requested more often than it was recorded, its last response is served again. Replayed
+    responses take the recorded time multiplied by `timing`, so 0 replays as fast as possible. Files ending in
+    `.gz` are compressed.
+    """
+
+    def __init__(self, path, mode, timing=1.0):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError("The cassette mode should be either 'record' or 'replay'")
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self._lock = threading.Lock()
+        self._responses = {}
+        self._file = None
+        if mode == RECORD:
+            self._file = _open(path, 'w')
+        else:
+            with _open(path, 'r') as handle:
+                for line in handle:
+                    if line.strip():
+                        interaction = json.loads(line)
+                        self._responses.setdefault((interaction['method'], interaction['path']), []).append(
+                            interaction)
+            LOGGER.debug('Loaded %d responses from cassette %s',
+                         sum(len(responses) for responses in self._responses.values()), path)
+
+    @property
+    def replaying(self):
+        return self.mode == REPLAY
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def record(self, method, path, status, headers, content, elapsed):
+        """
+        Write a response to the cassette.
+
+        :param str method: The HTTP method of the request.
+        :param str path: The path of the request URL, including the API version.
+        :param int status: The status code of the response.
+        :param headers: The response headers.
+        :param bytes content: The response body.
+        :param float elapsed: The seconds between sending the request and receiving the response.
+        """
+        try:
+            body = _redact(json.loads(content.decode())) if content else None
+        except ValueError:
+            body = content.decode('utf-8', 'replace')
+        interaction = {
+            'method': method, 'path': path, 'status': status, 'elapsed': round(elapsed, 4), 'body': body,
+            'headers': dict((name.lower(), value) for name, value in headers.items()
+                            if name.lower() in RECORDED_HEADERS),
+        }
+        line = json.dumps(interaction, separators=(',', ':'), sort_keys=True)
+        with self._lock:
+            if self._file is None:  # closed at the end of the run
+                return
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def _next(self, method, path):
+        with self._lock:
+            responses = self._responses.get((method, path))
+            if not responses:
+                LOGGER.warning('%s %s is not in cassette %s', method, path, self.path)
+                return {'status': 404, 'headers': {'content-type': 'application/json'}, 'elapsed': 0,
+                        'body': {'error': 'Request not found in cassette'}}
+            return responses.pop(0) if len(responses) > 1 else responses[0]
+
+    def replay(self, method, path):
+        """
+        Get the next recorded response to a request, after waiting the scaled time it took.
+
+        :param str method: The HTTP method of the request.
+        :param str path: The path of the request URL, including the API version.
+        :returns: The status code, the (lower case) response headers and the response body.
+        :rtype: `tuple`
+        """
+        interaction = self._next(method, path)
+        if self.timing and interaction['elapsed']:
+            time.sleep(interaction['elapsed'] * self.timing)
+        return self._response(interaction)
+
+    async def replay_async(self, method, path):
+        """Like `replay`, without blocking the event loop while waiting."""
+        interaction = self._next(method, path)
+        if self.timing and interaction['elapsed']:
+            await asyncio.sleep(interaction['elapsed'] * self.timing)
+        return self._response(interaction)
+
+    @staticmethod
+    def _response(interaction):
+        body = interaction['body']
+        if body is None:
+            content = b''
+        elif isinstance(body, str):
+            content = body.encode()
+        else:
+            content = json.dumps(body).encode()
+        return interaction['status'], dict(interaction['headers']), content
+
+
+class CassetteAdapter(HTTPAdapter):
+    """Transport adapter for `requests` that records responses to, or replays them from, a cassette."""
+
+    def __init__(self, cassette, **kwargs):
+        super(CassetteAdapter, self).__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, *args, **kwargs):  # pylint: disable=arguments-differ
+        path = urlsplit(request.url).path
+        if not self.cassette.replaying:
+            started = time.perf_counter()
+            response = super(CassetteAdapter, self).send(request, *args, **kwargs)
+            self.cassette.record(request.method, path, response.status_code, response.headers, response.content,
+                                 time.perf_counter() - started)
+            return response
+
+        status, headers, content = self.cassette.replay(request.method, path)
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = content  # pylint: disable=protected-access
+        response._content_consumed = True  # pylint: disable=protected-access
+        response.url = request.url
+        response.request = request
+        response.encoding = 'utf-8'
+        return response
+
+
+class AsyncCassetteSession:
+    """Wraps an asyncio HTTP session of the asyncio backend, recording to or replaying from a cassette."""
+
+    def __init__(self, session, cassette):
+        self.session = session
+        self.cassette = cassette
+
+    async def request(self, method, path, headers, body=None):
+        """See `certbot_dns_transip.aio._AsyncHTTPSession.request`."""
+        full_path = self.session.base_path + path
+        if self.cassette.replaying:
+            return await self.cassette.replay_async(method, full_path)
+        started = time.perf_counter()
+        status, response_headers, content = await self.session.request(method, path, headers, body)
+        self.cassette.record(method, full_path, status, response_headers, content, time.perf_counter() - started)
+        return status, response_headers, content
+
+    async def close(self):
+        await self.session.close()
@@ -0,0 +1,104 @@
+# -*- coding: UTF-8 -*-
+# File: client.py
+"""Client for the Transip API using python-transip, imported when the plugin makes its first API call."""
+
+import threading
+
+import transip
+from transip.v6.objects import DnsEntry
+
+from .base import API_URL, _TransipClientBase
+from .exceptions import TransipError, TransipHTTPError, TransipIOError, TransipParsingError
+from .retry import entry_created, entry_deleted
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+
+class _TransIP(transip.TransIP):
+    """`transip.TransIP` using another API URL, like that of a local mock server, also for logging in."""
+
+    def __init__(self, api_url, **kwargs):
+        self._api_url = api_url
+        super(_TransIP, self).__init__(**kwargs)
+
+    def _set_auth_info(self):
+        # called by __init__ to log in, after it has set the default URL
+        self._url = self._api_url
+        super(_TransIP, self)._set_auth_info()
+
+
+def _translate(error, headers):
+    """
+    Get the exception of this package for an exception of python-transip.
+
+    :param transip.exceptions.TransIPError error: The exception.
+    :param headers: The headers of the last response, which python-transip doesn't keep.
+    :returns: The exception to raise.
+    :rtype: `certbot_dns_transip.exceptions.TransipError`
+    """
+    if isinstance(error, transip.exceptions.TransIPHTTPError):
+        return TransipHTTPError(error.message, error.response_code, headers)
+    if isinstance(error, transip.exceptions.TransIPIOError):
+        return TransipIOError(error.message)
+    if isinstance(error, transip.exceptions.TransIPParsingError):
+        return TransipParsingError(error.message)
+    return TransipError(error.message)
+
+
+class _TransipClient(_TransipClientBase):
+    """Transip API client using python-transip, with the domains and DNS entries as its objects."""
+
+    def __init__(self, *args, **kwargs):
+        super(_TransipClient, self).__init__(*args, **kwargs)
+        self.session.hooks['response'].append(self._remember_response)
+        self._last_response = threading.local()
+        self._zone_domains = {}
+
+    def _new_client(self, **kwargs):
+        try:
+            if self.api_url == API_URL:
+                return transip.TransIP(**kwargs)
+            return _TransIP(self.api_url, **kwargs)
+        except transip.exceptions.TransIPError as error:
+            raise _translate(error, getattr(self._last_response, 'headers', {})) from error
+
+    def _share_session(self, client):
+        # all requests after the login share the connections of this client
+        client.session = self.session
+
+    def _send(self, operation, *args, **kwargs):
+        try:
+            return operation(*args, **kwargs)
+        except transip.exceptions.TransIPError as error:
+            raise _translate(error, getattr(self._last_response, 'headers', {})) from error
+
+    def _remember_response(self, response, *_, **__):
+        self._last_response.headers = response.headers
+
+    def _zone_domain(self, canonical_domain):
+        """Get a domain from the API once per run."""
+        domain = self._zone_domains.get(canonical_domain)
+        if domain is None:
+            domain = self._zone_domains[canonical_domain] = self._request(self.client.domains.get, canonical_domain)
+        return domain
+
+    def _dns_entries(self, canonical_domain):
+        return [entry.attrs for entry in self._request(self._zone_domain(canonical_domain).dns.list)]
+
+    def _create_entry(self, canonical_domain, entry):
+        self._request(self._zone_domain(canonical_domain).dns.create, entry, applied=entry_created)
+
+    def _replace_entries(self, canonical_domain, entries):
+        domain = self._zone_domain(canonical_domain)
+        self._request(domain.dns.replace, [DnsEntry(domain.dns, entry) for entry in entries])
+
+    def _delete_entry(self, canonical_domain, entry):
+        self._request(self._zone_domain(canonical_domain).dns.delete, entry, applied=entry_deleted)
+
+    def _fetch_nameservers(self, canonical_domain):
+        domain = self._request(self.client.domains.get, canonical_domain)
+        return [nameserver.hostname for nameserver in self._request(domain.nameservers.list)]
+
+    def _fetch_domain_names(self):
+        return [item.name for item in self._request(self.client.domains.list)]
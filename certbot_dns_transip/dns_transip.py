@@ -4,24 +4,34 @@
 
 import logging
 import os
-from tempfile import mktemp
-from distutils.util import strtobool
+import socket
+import time
 
-import transip
 from certbot import errors
+from certbot.display import util as display_util
 from certbot.plugins import dns_common
 
+from . import propagation
+from .cache import ChallengeRegistry, DomainCache, TokenCache
+from .metrics import Metrics
+from .options import MAX_RETRIES, RETRY_BUDGET, HTTPOptions
+from .ratelimit import RateLimiter
+from .stats import FLOOR, PERCENTILE, PropagationStats
+
 __author__ = '''Wim Fournier <wim@fournier.nl>'''
 __docformat__ = 'plaintext'
 __date__ = '''14-07-2017'''
 
 LOGGER = logging.getLogger(__name__)
-TRANSIP_EXCEPTIONS = (
-    transip.exceptions.TransIPError,
-    transip.exceptions.TransIPHTTPError,
-    transip.exceptions.TransIPIOError,
-    transip.exceptions.TransIPParsingError
-)
+# seconds the domain names in the domain cache are used before fetching them again
+DOMAIN_CACHE_TTL = 60 * 60
+# requests per minute allowed by the shared rate limiter, when no limit is configured
+RATE_LIMIT = 300
+BACKENDS = ('transip', 'rest', 'asyncio')
+# enables profiling when set to a directory for the profiles, like dns_transip_profile_dir in the credentials file
+PROFILE_DIR_ENV = 'CERTBOT_DNS_TRANSIP_PROFILE_DIR'
+# the number of functions in the logged summary of a profile, when no number is configured
+PROFILE_TOP = 25
 
 
 class Authenticator(dns_common.DNSAuthenticator):
@@ -39,12 +49,46 @@ class Authenticator(dns_common.DNSAuthenticator):
         super(Authenticator, self).__init__(*args, **kwargs)
         self.credentials = None
         self.logger = LOGGER.getChild(self.__class__.__name__)
-        self.temp_file = None
+        self._transip_client = None
+        self._metrics = None
+        self._cassette = None
+        self._profiler = None
+        self._profile_top = PROFILE_TOP
 
     @classmethod
     def add_parser_arguments(cls, add, **_):  # pylint: disable=arguments-differ
         super(Authenticator, cls).add_parser_arguments(add, default_propagation_seconds=240)
         add('credentials', help='Transip credentials INI file.')
+        add('propagation-mode', default='sleep', choices=('sleep', 'poll', 'adaptive'),
+            help='Either sleep for the propagation seconds, or poll the Transip nameservers until the TXT records '
+                 'are visible, waiting at most the propagation seconds. In adaptive mode, the plugin waits as long '
+                 'as the domains took to propagate before instead of the propagation seconds, and longer while the '
+                 'records are not visible yet, which needs dns_transip_propagation_stats in the credentials file.')
+        add('propagation-floor', default=FLOOR, type=int,
+            help='The minimum number of seconds to wait in adaptive mode.')
+        add('propagation-percentile', default=PERCENTILE, type=float,
+            help='The percentile of the earlier propagation times of a domain to wait in adaptive mode.')
+        add('poll-interval', default=10, type=int,
+            help='The number of seconds between checks for the TXT records in poll mode.')
+        add('max-workers', default=None, type=int,
+            help='The number of domains to update at the same time (default: 1, or 8 for the asyncio backend).')
+        add('backend', default='transip', choices=BACKENDS,
+            help='Use the python-transip library, the built-in REST client, or the built-in asyncio client to talk '
+                 'to the Transip API.')
+        add('pool-size', default=HTTPOptions().pool_size, type=int,
+            help='The maximum number of connections to the Transip API kept open.')
+        add('connect-timeout', default=HTTPOptions().connect_timeout, type=float,
+            help='The number of seconds to wait for a connection to the Transip API.')
+        add('read-timeout', default=HTTPOptions().read_timeout, type=float,
+            help='The number of seconds to wait for a response of the Transip API.')
+        add('no-keep-alive', default=False, action='store_true',
+            help='Use a new connection for every request to the Transip API.')
+        add('max-retries', default=MAX_RETRIES, type=int,
+            help='The number of times a request that failed with a temporary error is retried.')
+        add('retry-budget', default=RETRY_BUDGET, type=float,
+            help='The total number of seconds to spend waiting between retries.')
+        add('metrics', default=False, action='store_true',
+            help='Time the Transip API calls, and log a summary after removing the TXT records.')
 
     def more_info(self):
         """Returns info about this plugin."""
@@ -52,148 +96,326 @@ class Authenticator(dns_common.DNSAuthenticator):
                'the Transip API.'
 
     def _setup_credentials(self):
+        # either dns_transip_key_file or dns_transip_rsa_key is needed too, see `_client_options`
         self.credentials = self._configure_credentials(
             'credentials',
             'Transip credentials INI file',
             {
-                'key_file': 'RSA key file'
-                            '(convert with openssl rsa -in transip.key -out decrypted_key)',
                 'username': 'Transip username',
             }
         )
 
-    def _perform(self, domain, validation_name, validation):
-        self.logger.debug('_perform: running adding txt record %s.%s', domain, validation_name)
-        self._get_transip_client().add_txt_record(domain, validation_name, validation)
-
-    def _cleanup(self, domain, validation_name, validation):
-        self.logger.debug('_cleanup: removing adding txt record %s.%s', domain, validation_name)
-        try:
-            self._get_transip_client().del_txt_record(domain, validation_name, validation)
-        except Exception:
-            if self.temp_file:
-                os.unlink(self.temp_file)
-            raise
+    def perform(self, achalls):
+        """
+        Perform the challenges, adding the TXT records of all challenges in the same domain at once.
 
-    def _get_transip_client(self):
-        username = self.credentials.conf('username')
-        global_key = False
+        :param list achalls: The annotated dns-01 challenges.
+        :returns: The challenge responses.
+        :rtype: `list`
+        """
+        self._setup_credentials()
+        self._attempt_cleanup = True
+        self._profiler = self._create_profiler()
+        if self._profiler is not None:
+            return self._profiler.call(self._add_records, achalls)
+        return self._add_records(achalls)
+
+    def _add_records(self, achalls):
+        records = []
+        for achall in achalls:
+            domain = achall.identifier.value
+            records.append((domain, achall.validation_domain_name(domain), achall.validation(achall.account_key)))
+        self.logger.debug('perform: adding %d txt records', len(records))
+        registry = self._challenge_registry()
+        if registry is not None:
+            registry.add(self.credentials.conf('username'), self._registry_keys(records),
+                         owner={'host': socket.gethostname(), 'pid': os.getpid()})
+        self._get_transip_client().add_txt_records(records)
+
+        started = time.perf_counter()
+        if self.conf('propagation-mode') in ('poll', 'adaptive'):
+            self._wait_for_propagation(records)
+        else:
+            self._notify('Waiting %d seconds for DNS changes to propagate' % self.conf('propagation-seconds'))
+            time.sleep(self.conf('propagation-seconds'))
+        if self._metrics is not None:
+            self._metrics.observe('propagation', time.perf_counter() - started)
+        return [achall.response(achall.account_key) for achall in achalls]
+
+    def _notify(self, message):
+        # certbot sets up its display before running the plugin, certbot-dns-transip-bulk runs it without one
         try:
-            global_key = bool(strtobool(self.credentials.conf('global_key')))
+            display_util.notify(message)
         except ValueError:
-            raise ValueError("dns_transip_global_key should have either 'yes' or 'no' as value")
-        except AttributeError:  # global_key was not present in the config, use default
-            pass
-
-        if not self.credentials.conf('key_file'):
-            if self.credentials.conf('rsa_key'):
-                key_file = mktemp()
-                os.chmod(key_file, 600)
-                with key_file as key:
-                    key.write(self.credentials.conf('rsa_key'))
-            else:
-                raise ValueError('Please specify either an RSA key, or an RSA key file')
-        else:
-            key_file = self.credentials.conf('key_file')
-        self.logger.debug('Creating Transip API client for user %s', username)
-        return _TransipClient(username=username, key_file=key_file, global_key=global_key)
+            self.logger.info(message)
 
-
-class _TransipClient:
-    """Encapsulates all communication with the Transip API."""
-
-    def __init__(self, username, key_file, global_key):
-        self.logger = LOGGER.getChild(self.__class__.__name__)
-        self.client = transip.TransIP(login=username, private_key_file=key_file, global_key=global_key)
-
-    def add_txt_record(self, domain_name, record_name, record_content):
+    def _wait_for_propagation(self, records):
         """
-        Add a TXT record using the supplied information.
+        Wait until the records are visible on the nameservers of their domains, or the propagation seconds pass.
 
-        :param str domain_name: The domain to use to associate the record with.
-        :param str record_name: The record name (typically beginning with '_acme-challenge.').
-        :param str record_content: The record content (typically the challenge validation).
-        :raises certbot.errors.PluginError: if an error occurs communicating with the Transip API
+        With a propagation stats file, the time the records of every domain took to become visible is recorded.
+        In adaptive mode, the plugin then also waits as long as the domains took before, see
+        `PropagationStats.wait_seconds`, like sleep mode does for the propagation seconds.
         """
-        canonical_domain = self._find_domain(domain_name)
-
-        try:
-            domain = self.client.domains.get(canonical_domain)
-        except TRANSIP_EXCEPTIONS as error:
-            raise errors.PluginError('Error finding domain using the Transip API: {0}'.format(error))
-
-        new_record = {
-            "name": self._compute_record_name(canonical_domain, record_name),
-            "type": "TXT",
-            "content": record_content,
-            "expire": 1,
-        }
-
-        try:
-            domain.dns.create(new_record)
-        except TRANSIP_EXCEPTIONS as error:
-            raise errors.PluginError('Error finding domain using the Transip API: {0}'.format(error))
-
-    def del_txt_record(self, domain_name, record_name, record_content):
+        started = time.time()
+        transip_client = self._get_transip_client()
+        stats = self._propagation_stats()
+        expected = {}
+        zones = {}
+        for domain, validation_name, validation in records:
+            nameservers = tuple(transip_client.get_nameservers(domain))
+            expected.setdefault((validation_name, nameservers), set()).add(validation)
+            if stats is not None:
+                zones.setdefault(transip_client.get_zone(domain), set()).add((validation_name, nameservers))
+
+        ceiling = self.conf('propagation-seconds')
+        wait = 0
+        if self.conf('propagation-mode') == 'adaptive':
+            wait = stats.wait_seconds(zones, self.conf('propagation-percentile'), self.conf('propagation-floor'),
+                                      ceiling)
+            self.logger.debug('Waiting %.1f seconds for %d domains to propagate', wait, len(zones))
+            self._notify('Waiting %d seconds for DNS changes to propagate' % wait)
+        else:
+            self._notify('Waiting up to %d seconds for DNS changes to propagate' % ceiling)
+        visible = {}
+        # records that are not visible when the wait is over are waited for like in poll mode
+        if not propagation.wait_for_txt_records(expected, ceiling, self.conf('poll-interval'), visible=visible):
+            self.logger.warning('Not all TXT records are visible on the Transip nameservers after %d seconds',
+                                ceiling)
+        remaining = started + wait - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
+
+        if stats is not None:
+            # records that never became visible count as taking the propagation seconds, so the next wait of
+            # adaptive mode is the propagation seconds again
+            stats.record(dict((zone, max(visible[key] - started if key in visible else ceiling for key in keys))
+                              for zone, keys in zones.items()))
+
+    def _propagation_stats(self):
+        path = self.credentials.conf('propagation_stats')
+        if not path:
+            if self.conf('propagation-mode') == 'adaptive':
+                raise errors.PluginError('The adaptive propagation mode needs dns_transip_propagation_stats in the '
+                                         'credentials file')
+            return None
+        return PropagationStats(path)
+
+    def cleanup(self, achalls):
         """
-        Delete a TXT record using the supplied information.
-
-        Note that both the record's name and content are used to ensure that similar records
-        created concurrently (e.g., due to concurrent invocations of this plugin) are not deleted.
-
-        Failures are logged, but not raised.
+        Remove the TXT records of the challenges, removing all records in the same domain at once.
 
-        :param str domain_name: The domain to use to associate the record with.
-        :param str record_name: The record name (typically beginning with '_acme-challenge.').
-        :param str record_content: The record content (typically the challenge validation).
+        :param list achalls: The annotated dns-01 challenges.
+        :raises certbot.errors.PluginError: if any of the records could not be removed.
         """
-        canonical_domain = self._find_domain(domain_name)
-
+        if not self._attempt_cleanup:
+            return
+        if self._profiler is None:
+            self._remove_records(achalls)
+            return
         try:
-            domain = self.client.domains.get(canonical_domain)
-        except TRANSIP_EXCEPTIONS as error:
-            raise errors.PluginError('Error finding domain using the Transip API: {0}'.format(error))
-
-        delete_record = {
-            "name": self._compute_record_name(canonical_domain, record_name),
-            "type": "TXT",
-            "content": record_content,
-            "expire": 1,
-        }
-
+            self._profiler.call(self._remove_records, achalls)
+        finally:
+            self._report_profile()
+
+    def _remove_records(self, achalls):
+        records = []
+        for achall in achalls:
+            domain = achall.identifier.value
+            records.append((domain, achall.validation_domain_name(domain), achall.validation(achall.account_key)))
+        self.logger.debug('cleanup: removing %d txt records', len(records))
         try:
-            domain.dns.delete(delete_record)
-        except TRANSIP_EXCEPTIONS as error:
-            raise errors.PluginError('Error finding domain using the Transip API: {0}'.format(error))
+            results = self._get_transip_client().del_txt_records(records)
+        finally:
+            registry = self._challenge_registry()
+            if registry is not None:
+                # records that could not be removed are left to the garbage collector
+                registry.remove(self.credentials.conf('username'), self._registry_keys(records))
+            self._report_metrics()
+            if self._cassette is not None:
+                self._cassette.close()
+
+        failed = 0
+        for (_, validation_name, _), error in results.items():
+            if error:
+                failed += 1
+                self.logger.warning('cleanup: failed to remove txt record %s: %s', validation_name, error)
+            else:
+                self.logger.debug('cleanup: removed txt record %s', validation_name)
+        if failed:
+            raise errors.PluginError('Failed to remove {0} of {1} txt records'.format(failed, len(results)))
 
-    def _find_domain(self, domain_name):
-        """
-        Find the domain object for a given domain name.
+    def _challenge_registry(self):
+        path = self.credentials.conf('challenge_registry') if self.credentials else None
+        return ChallengeRegistry(path) if path else None
 
-        :param str domain_name: The domain name for which to find the corresponding Domain.
-        :returns: The Domain, if found.
-        :rtype: `str`
-        :raises certbot.errors.PluginError: if no matching Domain is found.
-        """
-        domain_name_guesses = dns_common.base_domain_name_guesses(domain_name)
+    @staticmethod
+    def _registry_keys(records):
+        return [ChallengeRegistry.key(validation_name, validation) for _, validation_name, validation in records]
+
+    def _report_metrics(self):
+        """Log a summary of the metrics of this run, and write them to the metrics file if one is configured."""
+        if self._metrics is None:
+            return
+        self.logger.info('Transip API: %s', self._metrics.summary())
+        path = self.credentials.conf('metrics_file')
+        if path:
+            try:
+                self._metrics.write(path, self.credentials.conf('metrics_format') or None)
+            except OSError as error:
+                self.logger.warning('Unable to write metrics to %s: %s', path, error)
+
+    def _profile_dir(self):
+        return os.environ.get(PROFILE_DIR_ENV) or self.credentials.conf('profile_dir')
+
+    def _create_profiler(self):
+        if self._profiler is not None or not self._profile_dir():
+            return self._profiler
+        try:
+            self._profile_top = int(self.credentials.conf('profile_top') or PROFILE_TOP)
+        except ValueError:
+            raise ValueError('dns_transip_profile_top should be a number')
+        from .profiling import Profiler  # pylint: disable=import-outside-toplevel
+        return Profiler()
 
+    def _report_profile(self):
+        """Write the profile of this run to the profile directory, and log the functions that took the longest."""
         try:
-            domains = [item.name for item in self.client.domains.list()]
-        except TRANSIP_EXCEPTIONS as error:
-            raise errors.PluginError('Error finding domain using the Transip API: {0}'.format(error))
+            path = self._profiler.write(self._profile_dir())
+        except OSError as error:
+            self.logger.warning('Unable to write the profile to %s: %s', self._profile_dir(), error)
+            return
+        if path is None:
+            self.logger.warning('Nothing was profiled, another profiler may be active')
+            return
+        self.logger.info('Profile written to %s, the %d functions that took the longest:\n%s', path,
+                         self._profile_top, self._profiler.summary(self._profile_top))
+
+    def _perform(self, domain, validation_name, validation):
+        self.logger.debug('_perform: running adding txt record %s.%s', domain, validation_name)
+        self._get_transip_client().add_txt_record(domain, validation_name, validation)
 
-        if not domains:
-            raise errors.PluginError("Transip API returned no domains")
+    def _cleanup(self, domain, validation_name, validation):
+        self.logger.debug('_cleanup: removing adding txt record %s.%s', domain, validation_name)
+        self._get_transip_client().del_txt_record(domain, validation_name, validation)
 
-        for guess in domain_name_guesses:
-            if guess in domains:
-                self.logger.debug('Found base domain for %s using name %s', domain_name, guess)
-                return guess
+    def _get_transip_client(self):
+        if self._transip_client is None:
+            path = self.credentials.conf('broker_socket')
+            if path:
+                from .broker import BrokerClient  # pylint: disable=import-outside-toplevel,cyclic-import
+                self._transip_client = BrokerClient(path, self.credentials.conf('username'),
+                                                    self._create_transip_client)
+            else:
+                self._transip_client = self._create_transip_client()
+        return self._transip_client
+
+    def _create_transip_client(self):
+        # the client and its dependencies are only imported when the plugin is used, so that certbot starts quickly
+        # pylint: disable=import-outside-toplevel,cyclic-import
+        from .cassette import Cassette
+        from .retry import RetryPolicy
+
+        options = _client_options(self.credentials)
+        if self.credentials.conf('metrics_format') not in (None, '', 'prometheus', 'json'):
+            raise ValueError("dns_transip_metrics_format should be either 'prometheus' or 'json'")
+        if self.conf('metrics') or self.credentials.conf('metrics_file'):
+            self._metrics = Metrics()
+        if self.credentials.conf('cassette'):
+            try:
+                timing = float(self.credentials.conf('cassette_timing') or 1)
+            except ValueError:
+                raise ValueError('dns_transip_cassette_timing should be a number')
+            self._cassette = Cassette(self.credentials.conf('cassette'),
+                                      self.credentials.conf('cassette_mode') or 'record', timing)
+        self.logger.debug('Creating Transip API client for user %s', options['username'])
+        return _client_class(self.conf('backend'))(max_workers=self.conf('max-workers'),
+                            http_options=HTTPOptions(pool_size=self.conf('pool-size'),
+                                                     connect_timeout=self.conf('connect-timeout'),
+                                                     read_timeout=self.conf('read-timeout'),
+                                                     keep_alive=not self.conf('no-keep-alive')),
+                            retry_policy=RetryPolicy(retries=self.conf('max-retries'),
+                                                     budget=self.conf('retry-budget'), metrics=self._metrics),
+                            metrics=self._metrics,
+                            cassette=self._cassette,
+                            profiler=self._profiler,
+                            **options)
+
+
+def _client_class(backend):
+    """
+    Get the client class of a backend, importing it only when it is used.
 
-        raise errors.PluginError('Unable to determine base domain for {0} using names: {1} and domains: {2}.'
-                                 .format(domain_name, domain_name_guesses, domains))
+    :param str backend: One of `BACKENDS`.
+    :returns: The client class.
+    :rtype: `type`
+    """
+    # pylint: disable=import-outside-toplevel,cyclic-import
+    if backend == 'asyncio':
+        from .aio import _AsyncTransipClient
+        return _AsyncTransipClient
+    if backend == 'rest':
+        from .rest import _RestTransipClient
+        return _RestTransipClient
+    from .client import _TransipClient
+    return _TransipClient
+
+
+def _strtobool(value):
+    """Like `distutils.util.strtobool`, without importing distutils (which is slow, and gone in Python 3.12)."""
+    value = value.lower()
+    if value in ('y', 'yes', 't', 'true', 'on', '1'):
+        return True
+    if value in ('n', 'no', 'f', 'false', 'off', '0'):
+        return False
+    raise ValueError('invalid truth value {0!r}'.format(value))
+
+
+def _client_options(credentials):
+    """
+    Get the arguments of `_TransipClientBase` that are set in a credentials file.
 
-    @staticmethod
-    def _compute_record_name(domain, full_record_name):
-        # The domain, from Transip's point of view, is automatically appended.
-        return full_record_name.rpartition("." + domain)[0]
+    :param credentials: The credentials file.
+    :type credentials: `certbot.plugins.dns_common.CredentialsConfiguration`
+    :returns: The keyword arguments for the client.
+    :rtype: `dict`
+    """
+    username = credentials.conf('username')
+    global_key = False
+    try:
+        global_key = _strtobool(credentials.conf('global_key'))
+    except ValueError:
+        raise ValueError("dns_transip_global_key should have either 'yes' or 'no' as value")
+    except AttributeError:  # global_key was not present in the config, use default
+        pass
+
+    key_file = credentials.conf('key_file') or None
+    # an RSA key in the credentials file is kept in memory, it is never written to a file
+    private_key = credentials.conf('rsa_key') or None
+    if not key_file and not private_key:
+        raise ValueError('Please specify either an RSA key, or an RSA key file '
+                         '(convert with openssl rsa -in transip.key -out decrypted_key)')
+    if key_file and private_key:
+        raise ValueError('Please specify either dns_transip_key_file or dns_transip_rsa_key, not both')
+    token_cache = None
+    if credentials.conf('token_cache'):
+        token_cache = TokenCache(credentials.conf('token_cache'))
+    domain_cache = None
+    if credentials.conf('domain_cache'):
+        try:
+            ttl = int(credentials.conf('domain_cache_ttl') or DOMAIN_CACHE_TTL)
+        except ValueError:
+            raise ValueError('dns_transip_domain_cache_ttl should be a number of seconds')
+        domain_cache = DomainCache(credentials.conf('domain_cache'), ttl)
+    rate_limiter = None
+    if credentials.conf('rate_limit_file'):
+        try:
+            requests_per_minute = float(credentials.conf('rate_limit') or RATE_LIMIT)
+            if not requests_per_minute > 0:
+                raise ValueError(requests_per_minute)
+        except ValueError:
+            raise ValueError('dns_transip_rate_limit should be a number of requests per minute')
+        rate_limiter = RateLimiter(credentials.conf('rate_limit_file'), username, requests_per_minute)
+    return dict(username=username, key_file=key_file, private_key=private_key, global_key=global_key,
+                token_cache=token_cache, domain_cache=domain_cache, rate_limiter=rate_limiter,
+                api_url=credentials.conf('api_url'))
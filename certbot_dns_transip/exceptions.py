@@ -0,0 +1,43 @@
+# -*- coding: UTF-8 -*-
+# File: exceptions.py
+"""Errors of the Transip API, raised by every backend of the client."""
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+
+class TransipError(Exception):
+    """A Transip API call failed."""
+
+    def __init__(self, message=''):
+        super(TransipError, self).__init__(message)
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+class TransipHTTPError(TransipError):
+    """
+    The Transip API responded with an error status.
+
+    The retry policy looks at the `headers` of the response, when they are known.
+    """
+
+    def __init__(self, message='', response_code=None, headers=None):
+        super(TransipHTTPError, self).__init__(message)
+        self.response_code = response_code
+        self.headers = headers
+
+    def __str__(self):
+        if self.response_code:
+            return '{0}: {1}'.format(self.response_code, self.message)
+        return self.message
+
+
+class TransipIOError(TransipError):
+    """The connection to the Transip API failed."""
+
+
+class TransipParsingError(TransipError):
+    """The response of the Transip API could not be parsed."""
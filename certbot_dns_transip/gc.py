@@ -0,0 +1,193 @@
+# -*- coding: UTF-8 -*-
+# File: gc.py
+"""Removal of challenge TXT records left behind by failed runs of the plugin, in all domains of an account."""
+
+import argparse
+import logging
+import os
+import socket
+import sys
+import time
+
+from certbot import errors
+from certbot.plugins import dns_common
+
+from .base import TRANSIP_EXCEPTIONS
+from .cache import ChallengeRegistry
+from .dns_transip import BACKENDS, _client_class, _client_options
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+LOGGER = logging.getLogger(__name__)
+CHALLENGE_LABEL = '_acme-challenge'
+# seconds a challenge record may exist before it is removed
+MAX_AGE = 24 * 60 * 60
+
+
+def _is_challenge(entry):
+    return entry['type'] == 'TXT' and (entry['name'] == CHALLENGE_LABEL or
+                                       entry['name'].startswith(CHALLENGE_LABEL + '.'))
+
+
+def _full_name(zone, name):
+    return zone if name == '@' else '{0}.{1}'.format(name, zone)
+
+
+def _in_zones(name, zones):
+    return any(name == zone or name.endswith('.' + zone) for zone in zones)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # it exists, but belongs to someone else
+        return True
+    return True
+
+
+class GarbageCollector:
+    """
+    Finds the challenge TXT records in all domains of an account, and removes the stale ones.
+
+    A challenge record is stale when it has been seen for longer than `max_age` seconds, or when the run that
+    added it on this host has ended. With `unowned`, records that no run has registered are stale right away.
+    How long a record has been seen is kept in the challenge registry. Runs of the plugin register their
+    records there too, when the registry is configured in their credentials file.
+    """
+
+    def __init__(self, transip_client, registry, max_age=MAX_AGE, unowned=False, dry_run=False):
+        self.transip_client = transip_client
+        self.registry = registry
+        self.max_age = max_age
+        self.unowned = unowned
+        self.dry_run = dry_run
+        self.hostname = socket.gethostname()
+        self._registered = {}
+        self.stale = {}
+        self.seen = {}
+
+    def _stale_reason(self, key, now):
+        """
+        Decide if a challenge record is stale.
+
+        :param str key: The registry key of the record.
+        :param float now: The time of the scan.
+        :returns: Why the record is stale, or None when it should be kept.
+        :rtype: `str`
+        """
+        entry = self._registered.get(key) or {'seen': now}
+        if now - entry['seen'] >= self.max_age:
+            return 'seen {0:.0f} seconds ago'.format(now - entry['seen'])
+        if entry.get('host') == self.hostname and entry.get('pid') and not _process_alive(entry['pid']):
+            return 'run {0} has ended'.format(entry['pid'])
+        if 'pid' not in entry and self.unowned:
+            return 'not owned by any run'
+        return None
+
+    def _scan_zone(self, zone, entries, now):
+        stale = {}
+        seen = []
+        for entry in entries:
+            if not _is_challenge(entry):
+                continue
+            key = ChallengeRegistry.key(_full_name(zone, entry['name']), entry['content'])
+            seen.append(key)
+            reason = self._stale_reason(key, now)
+            if reason is not None:
+                stale[key] = (entry, reason)
+        self.seen[zone] = seen
+        self.stale[zone] = stale
+
+    def run(self, zones=None):
+        """
+        Scan domains for stale challenge records, and remove them unless this is a dry run.
+
+        :param list zones: The domains to scan, all domains of the account by default.
+        :returns: The domains that could not be scanned or updated, with their errors.
+        :rtype: `dict`
+        """
+        username = self.transip_client.username
+        self._registered = self.registry.get(username)
+        if zones is None:
+            zones = sorted(self.transip_client.get_domain_names())
+        now = time.time()
+        entries, failures = self.transip_client.get_dns_entries(zones)
+        for zone in zones:
+            if zone in entries:
+                self._scan_zone(zone, entries[zone], now)
+        if not self.dry_run:
+            # the entries were just read, so they are deleted without reading the domains again
+            results = self.transip_client.del_dns_entries(dict(
+                (zone, [entry for entry, _ in stale.values()]) for zone, stale in self.stale.items() if stale))
+            failures.update((zone, error) for zone, error in results.items() if error is not None)
+
+        # remember when records were first seen, and forget the records without owner that are gone
+        seen = set(key for keys in self.seen.values() for key in keys)
+        removed = set()
+        if not self.dry_run:
+            removed = set(key for zone, stale in self.stale.items() if zone not in failures for key in stale)
+        scanned = [zone for zone in self.seen if zone not in failures]
+        gone = [key for key, entry in self._registered.items()
+                if 'pid' not in entry and key not in seen and _in_zones(key.split(' ')[0], scanned)]
+        self.registry.add(username, sorted(seen - removed - set(self._registered)))
+        self.registry.remove(username, sorted(removed.union(gone)))
+        return failures
+
+    def report(self, failures, output=None):
+        """Write what was (or would be) removed, and the domains that failed, to `output` or stdout."""
+        output = output or sys.stdout
+        action = 'Would remove' if self.dry_run else 'Removed'
+        for zone in sorted(self.stale):
+            for key, (entry, reason) in sorted(self.stale[zone].items()):
+                if zone not in failures:
+                    output.write('{0} {1} TXT {2} from {3}: {4}\n'.format(
+                        action, _full_name(zone, entry['name']), entry['content'], zone, reason))
+        for zone, error in sorted(failures.items()):
+            output.write('Failed to clean up {0}: {1}\n'.format(zone, error))
+        output.write('{0} {1} of {2} challenge records in {3} domains\n'.format(
+            action, sum(len(stale) for zone, stale in self.stale.items() if zone not in failures),
+            sum(len(keys) for keys in self.seen.values()), len(self.seen)))
+
+
+def main(argv=None):
+    """Entry point of the `certbot-dns-transip-gc` command."""
+    parser = argparse.ArgumentParser(
+        description='Remove the _acme-challenge TXT records left behind by failed certbot runs from all domains '
+                    'of a Transip account.')
+    parser.add_argument('--credentials', required=True,
+                        help='The credentials INI file of the plugin. It should set dns_transip_challenge_registry.')
+    parser.add_argument('--max-age', type=float, default=MAX_AGE,
+                        help='Remove challenge records that have been seen for more than this many seconds '
+                             '(default: %(default)s).')
+    parser.add_argument('--unowned', action='store_true',
+                        help='Also remove challenge records that were not added by a run using the registry.')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='The number of domains to scan at the same time (default: %(default)s).')
+    parser.add_argument('--backend', default='transip', choices=BACKENDS,
+                        help='The client used for the Transip API (default: %(default)s).')
+    parser.add_argument('--domain', action='append', dest='domains',
+                        help='Only scan this domain. Can be given more than once.')
+    parser.add_argument('--dry-run', action='store_true', help='Only report the records that would be removed.')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Log the API calls.')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    try:
+        credentials = dns_common.CredentialsConfiguration(args.credentials, lambda name: 'dns_transip_' + name)
+        credentials.require({'username': 'Transip username', 'challenge_registry': 'challenge registry file'})
+        transip_client = _client_class(args.backend)(max_workers=args.concurrency, **_client_options(credentials))
+        collector = GarbageCollector(transip_client, ChallengeRegistry(credentials.conf('challenge_registry')),
+                                     max_age=args.max_age, unowned=args.unowned, dry_run=args.dry_run)
+        failures = collector.run(args.domains)
+    except (errors.PluginError, ValueError) + TRANSIP_EXCEPTIONS as error:
+        sys.stderr.write('{0}\n'.format(error))
+        return 2
+    collector.report(failures)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+# -*- coding: UTF-8 -*-
+# File: keys.py
+"""The RSA keys of Transip accounts, parsed once per process and kept in memory for signing logins."""
+
+import base64
+import hashlib
+import os
+import threading
+
+from certbot import errors
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+_KEYS = {}
+_LOCK = threading.Lock()
+
+
+def load_private_key(key_file=None, pem=None):
+    """
+    Get the RSA key of an account, from a file or from the PEM text itself.
+
+    A key is only read and parsed the first time it is asked for, later calls get the same key object. Keys
+    given as PEM text never touch the filesystem.
+
+    :param str key_file: The file with the key in PEM format.
+    :param str pem: The key in PEM format, used instead of `key_file`.
+    :returns: The key.
+    :rtype: `cryptography.hazmat.primitives.asymmetric.rsa.RSAPrivateKey`
+    :raises certbot.errors.PluginError: if the key can't be read, or is not an unencrypted RSA key.
+    """
+    if pem is not None:
+        cache_key = 'pem:' + hashlib.sha256(pem.encode()).hexdigest()
+        source = 'the RSA key in the credentials file'
+    else:
+        cache_key = 'file:' + os.path.abspath(key_file)
+        source = 'RSA key file {0}'.format(key_file)
+    with _LOCK:
+        key = _KEYS.get(cache_key)
+        if key is None:
+            try:
+                if pem is not None:
+                    data = pem.encode()
+                else:
+                    with open(key_file, 'rb') as handle:
+                        data = handle.read()
+                key = serialization.load_pem_private_key(data, password=None)
+            except (OSError, ValueError, TypeError) as error:
+                raise errors.PluginError('Unable to read {0}: {1}'.format(source, error))
+            if not isinstance(key, rsa.RSAPrivateKey):
+                raise errors.PluginError('{0} is not an RSA key'.format(source[0].upper() + source[1:]))
+            _KEYS[cache_key] = key
+    return key
+
+
+def sign(key, message):
+    """
+    Sign a message the way the Transip API expects, with SHA512 and PKCS #1 v1.5 padding.
+
+    :param key: The RSA key.
+    :param bytes message: The message.
+    :returns: The signature, base64 encoded.
+    :rtype: `str`
+    """
+    return base64.b64encode(key.sign(message, padding.PKCS1v15(), hashes.SHA512())).decode()
@@ -0,0 +1,185 @@
+# -*- coding: UTF-8 -*-
+# File: metrics.py
+"""Timing and counting of Transip API calls, with export to Prometheus textfile or JSON files."""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+# upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+PREFIX = 'certbot_dns_transip'
+
+
+def _error_label(error):
+    """The HTTP status of a failed API call, or the name of the exception when there is none."""
+    return str(getattr(error, 'response_code', '') or type(error).__name__)
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+class _Operation:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.max = 0.0
+        self.errors = {}
+        self.retries = 0
+
+    def observe(self, seconds, error):
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+                break
+        self.count += 1
+        self.seconds += seconds
+        self.max = max(self.max, seconds)
+        if error is not None:
+            self.errors[error] = self.errors.get(error, 0) + 1
+
+    def as_dict(self):
+        return {'count': self.count, 'seconds': self.seconds, 'max': self.max, 'errors': dict(self.errors),
+                'retries': self.retries,
+                'buckets': dict((str(bound), count) for bound, count in zip(BUCKETS, self._cumulative()))}
+
+    def _cumulative(self):
+        total, cumulative = 0, []
+        for count in self.buckets:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+
+class Metrics:
+    """
+    Latency histograms, call counts, error counts and retry counts per operation, for one certbot run.
+
+    Operations are API calls like `DomainService.list`, and the phases of the plugin like `propagation`.
+    Clients skip all measuring when they have no `Metrics`, so it costs nothing when it's disabled.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def _operation(self, name):
+        operation = self._operations.get(name)
+        if operation is None:
+            operation = self._operations[name] = _Operation()
+        return operation
+
+    def observe(self, name, seconds, error=None):
+        """
+        Record a finished operation.
+
+        :param str name: The name of the operation.
+        :param float seconds: How long it took.
+        :param str error: The HTTP status or the exception it failed with, None if it succeeded.
+        """
+        with self._lock:
+            self._operation(name).observe(seconds, error)
+
+    def count_retry(self, name):
+        """Record that an operation is retried."""
+        with self._lock:
+            self._operation(name).retries += 1
+
+    @contextmanager
+    def timer(self, name):
+        """Time the block as an operation, failed when it raises."""
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as exception:
+            error = _error_label(exception)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, error)
+
+    def as_dict(self):
+        """The metrics, as a dict that can be serialized to JSON."""
+        with self._lock:
+            return {'started': self.started, 'duration': time.time() - self.started,
+                    'operations': dict((name, operation.as_dict()) for name, operation in self._operations.items())}
+
+    def summary(self):
+        """
+        Describe the run in one line, like `5 operations in 1.20 seconds (...), 1 retries, 0 errors`.
+
+        :rtype: `str`
+        """
+        operations = self.as_dict()['operations']
+        calls = sum(operation['count'] for operation in operations.values())
+        details = ', '.join('{0} {1}x {2:.2f}s'.format(name, operation['count'], operation['seconds'])
+                            for name, operation in sorted(operations.items(), key=lambda item: -item[1]['seconds']))
+        return '{0} operations in {1:.2f} seconds ({2}), {3} retries, {4} errors'.format(
+            calls, sum(operation['seconds'] for operation in operations.values()), details,
+            sum(operation['retries'] for operation in operations.values()),
+            sum(sum(operation['errors'].values()) for operation in operations.values()))
+
+    def prometheus(self):
+        """
+        The metrics in the Prometheus text exposition format.
+
+        :rtype: `str`
+        """
+        metrics = self.as_dict()
+        lines = [
+            '# HELP {0}_operation_duration_seconds Duration of Transip API calls and plugin phases.'.format(PREFIX),
+            '# TYPE {0}_operation_duration_seconds histogram'.format(PREFIX),
+        ]
+        for name, operation in sorted(metrics['operations'].items()):
+            label = _label(name)
+            for bound, count in operation['buckets'].items():
+                lines.append('{0}_operation_duration_seconds_bucket{{operation="{1}",le="{2}"}} {3}'.format(
+                    PREFIX, label, bound, count))
+            lines.append('{0}_operation_duration_seconds_bucket{{operation="{1}",le="+Inf"}} {2}'.format(
+                PREFIX, label, operation['count']))
+            lines.append('{0}_operation_duration_seconds_sum{{operation="{1}"}} {2}'.format(
+                PREFIX, label, operation['seconds']))
+            lines.append('{0}_operation_duration_seconds_count{{operation="{1}"}} {2}'.format(
+                PREFIX, label, operation['count']))
+        lines.extend(['# HELP {0}_operation_errors_total Failed Transip API calls.'.format(PREFIX),
+                      '# TYPE {0}_operation_errors_total counter'.format(PREFIX)])
+        for name, operation in sorted(metrics['operations'].items()):
+            for error, count in sorted(operation['errors'].items()):
+                lines.append('{0}_operation_errors_total{{operation="{1}",error="{2}"}} {3}'.format(
+                    PREFIX, _label(name), _label(error), count))
+        lines.extend(['# HELP {0}_operation_retries_total Retried Transip API calls.'.format(PREFIX),
+                      '# TYPE {0}_operation_retries_total counter'.format(PREFIX)])
+        for name, operation in sorted(metrics['operations'].items()):
+            if operation['retries']:
+                lines.append('{0}_operation_retries_total{{operation="{1}"}} {2}'.format(
+                    PREFIX, _label(name), operation['retries']))
+        lines.extend(['# HELP {0}_run_timestamp_seconds Start of the last certbot run.'.format(PREFIX),
+                      '# TYPE {0}_run_timestamp_seconds gauge'.format(PREFIX),
+                      '{0}_run_timestamp_seconds {1}'.format(PREFIX, metrics['started'])])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, metrics_format=None):
+        """
+        Write the metrics to a file, replacing it at once so collectors never read a partial file.
+
+        :param str path: The file to write.
+        :param str metrics_format: `prometheus` or `json`, by default `json` for files ending in `.json`.
+        """
+        if metrics_format is None:
+            metrics_format = 'json' if path.endswith('.json') else 'prometheus'
+        if metrics_format == 'json':
+            content = json.dumps(self.as_dict(), indent=2, sort_keys=True)
+        else:
+            content = self.prometheus()
+        temporary = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(temporary, 'w') as handle:
+            handle.write(content)
+        os.replace(temporary, path)
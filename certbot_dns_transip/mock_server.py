@@ -0,0 +1,172 @@
+# -*- coding: UTF-8 -*-
+# File: mock_server.py
+"""A local stand-in for the parts of the Transip v6 REST API used by the plugin, for tests and benchmarks."""
+
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+TOKEN = 'stub-token'
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # clients that time out close their connection before the response is sent
+
+
+class MockTransipServer:
+    """
+    Serves domains and DNS entries from memory on a local port.
+
+    Any signed login is accepted and answered with `token`. The server keeps a log of the requests, and counts
+    the connections it accepted and the bytes it received and sent. It can add `latency` to every request,
+    fail a fraction `error_rate` of the API requests with a 503, and fail requests with scripted responses.
+    The account is padded with generated domains up to `account_size` domains.
+
+    Point the plugin at `url` with `dns_transip_api_url` in the credentials file.
+    """
+
+    def __init__(self, domains, latency=0.0, error_rate=0.0, account_size=None, seed=None):
+        self.zones = dict((name, []) for name in domains)
+        for index in range(len(self.zones), account_size or 0):
+            self.zones['account-domain{0}.example'.format(index)] = []
+        self.nameservers = ['ns0.transip.net', 'ns1.transip.nl', 'ns2.transip.eu']
+        self.latency = latency
+        self.error_rate = error_rate
+        self.token = TOKEN
+        self.requests = []
+        self.connections = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        # (status, headers) of responses to send before handling the next requests normally
+        self.failures = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # send the headers and the body of a response at once, instead of waiting for a delayed ACK in between
+            wbufsize = -1
+
+            def setup(self):
+                with server._lock:
+                    server.connections += 1
+                super(Handler, self).setup()
+
+            def log_message(self, *_):
+                pass
+
+            def flush_headers(self):
+                with server._lock:
+                    server.bytes_sent += sum(len(line) for line in getattr(self, '_headers_buffer', []))
+                super(Handler, self).flush_headers()
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw_body = self.rfile.read(length) if length else b''
+                body = json.loads(raw_body) if raw_body else None
+                with server._lock:
+                    server.requests.append((self.command, self.path))
+                    server.bytes_received += len(self.raw_requestline) + len(bytes(self.headers)) + len(raw_body)
+                if server.latency:
+                    time.sleep(server.latency)
+                status, headers, response = server._respond(self.command, self.path, self.headers, body)
+                content = json.dumps(response).encode() if response is not None else b''
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                if self.headers.get('Connection', '').lower() == 'close':
+                    self.send_header('Connection', 'close')
+                self.end_headers()
+                self.wfile.write(content)
+                with server._lock:
+                    server.bytes_sent += len(content)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+        self.server = _Server(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{0}/v6'.format(self.server.server_address[1])
+        self._thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_counters(self):
+        """Forget the logged requests, connections and bytes."""
+        with self._lock:
+            self.requests = []
+            self.connections = 0
+            self.bytes_received = 0
+            self.bytes_sent = 0
+
+    def _respond(self, method, path, headers, body):
+        with self._lock:
+            failure = self.failures.pop(0) if self.failures else None
+            if failure is None and self.error_rate and path != '/v6/auth' and self._random.random() < self.error_rate:
+                failure = (503, {'Retry-After': '0'})
+        if failure:
+            status, failure_headers = failure
+            return status, failure_headers, {'error': 'Scripted failure'}
+        status, response = self.handle(method, path, headers, body)
+        return status, {}, response
+
+    def handle(self, method, path, headers, body):
+        """Answer a request, returning the status code and the JSON response."""
+        if path == '/v6/auth' and method == 'POST':
+            return 201, {'token': self.token}
+        if headers.get('Authorization') != 'Bearer {0}'.format(self.token):
+            return 401, {'error': 'Your access token has been revoked.'}
+
+        if path == '/v6/domains' and method == 'GET':
+            return 200, {'domains': [{'name': name, 'authCode': '', 'isTransferLocked': False}
+                                     for name in self.zones]}
+        match = re.match(r'^/v6/domains/([^/]+)(/dns|/nameservers)?$', path)
+        if not match or match.group(1) not in self.zones:
+            return 404, {'error': 'Domain not found'}
+        name, resource = match.groups()
+        entries = self.zones[name]
+
+        if resource is None and method == 'GET':
+            return 200, {'domain': {'name': name}}
+        if resource == '/nameservers' and method == 'GET':
+            return 200, {'nameservers': [{'hostname': hostname, 'ipv4': '', 'ipv6': ''}
+                                         for hostname in self.nameservers]}
+        if resource != '/dns':
+            return 405, {'error': 'Method not allowed'}
+        with self._lock:
+            if method == 'GET':
+                return 200, {'dnsEntries': list(entries)}
+            if method == 'POST':
+                if body['dnsEntry'] in entries:
+                    return 406, {'error': 'This DNS entry already exists'}
+                entries.append(body['dnsEntry'])
+                return 201, None
+            if method == 'PUT':
+                entries[:] = body['dnsEntries']
+                return 204, None
+            if method == 'PATCH':
+                for entry in entries:
+                    if all(entry[key] == body['dnsEntry'][key] for key in ('name', 'type', 'expire')):
+                        entry['content'] = body['dnsEntry']['content']
+                        return 204, None
+                return 404, {'error': 'DNS entry not found'}
+            if method == 'DELETE':
+                if body['dnsEntry'] not in entries:
+                    return 404, {'error': 'DNS entry not found'}
+                entries.remove(body['dnsEntry'])
+                return 204, None
+        return 405, {'error': 'Method not allowed'}
+
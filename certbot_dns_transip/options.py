@@ -0,0 +1,24 @@
+# -*- coding: UTF-8 -*-
+# File: options.py
+"""Default settings of the Transip API client, importable without loading the client."""
+
+from collections import namedtuple
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+# the number of times a request that failed with a temporary error is retried
+MAX_RETRIES = 4
+# the total number of seconds a run spends waiting between retries
+RETRY_BUDGET = 300.0
+
+HTTPOptions = namedtuple('HTTPOptions', ['pool_size', 'connect_timeout', 'read_timeout', 'keep_alive'])
+HTTPOptions.__new__.__defaults__ = (10, 10.0, 60.0, True)
+HTTPOptions.__doc__ = """
+Settings for the connections to the Transip API.
+
+pool_size: the maximum number of connections kept open.
+connect_timeout: seconds to wait for a connection.
+read_timeout: seconds to wait for (part of) a response.
+keep_alive: reuse connections for later requests.
+"""
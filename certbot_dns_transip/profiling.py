@@ -0,0 +1,119 @@
+# -*- coding: UTF-8 -*-
+# File: profiling.py
+"""Profiling of the plugin, imported only when profiling is enabled."""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+LOGGER = logging.getLogger(__name__)
+# from Python 3.12 on, cProfile uses sys.monitoring, which sees all threads and allows a single profiler
+ALL_THREADS = sys.version_info >= (3, 12)
+
+
+class Profiler:
+    """
+    Profiles calls with cProfile, in every thread they run in, and combines the profiles of a run.
+
+    Before Python 3.12, cProfile only sees the thread it was enabled in, so the calls made in worker threads are
+    profiled with `call` too. From Python 3.12 on, a profile sees all threads, and only one can be active at a
+    time. A call made while it is profiled already, by its own thread or from 3.12 on by any thread, is part of
+    that profile.
+    """
+
+    def __init__(self):
+        self._profiles = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._active = False
+
+    def _is_active(self):
+        return self._active if ALL_THREADS else getattr(self._local, 'active', False)
+
+    def _set_active(self, active):
+        if ALL_THREADS:
+            self._active = active
+        else:
+            self._local.active = active
+
+    def _start(self):
+        """Start a profile for a call, or return None when the call is profiled already."""
+        with self._lock:
+            if self._is_active():
+                return None
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as error:  # another profiler is active, like one that runs certbot itself
+                LOGGER.warning('Unable to profile the plugin: %s', error)
+                return None
+            self._set_active(True)
+            return profile
+
+    def call(self, function, *args, **kwargs):
+        """
+        Call a function, profiling it unless it is profiled already.
+
+        :returns: What the function returns.
+        """
+        profile = self._start()
+        if profile is None:
+            return function(*args, **kwargs)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.disable()
+            with self._lock:
+                self._set_active(False)
+                self._profiles.append(profile)
+
+    def stats(self, stream=None):
+        """
+        Get the combined profile of all calls.
+
+        :returns: The statistics, or None when nothing was profiled.
+        :rtype: `pstats.Stats`
+        """
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return None
+        return pstats.Stats(*profiles, stream=stream)
+
+    def write(self, directory):
+        """
+        Write the combined profile to a new file in a directory, for `pstats` or a viewer like snakeviz.
+
+        :param str directory: The directory, created when it doesn't exist.
+        :returns: The path of the file, or None when nothing was profiled.
+        :rtype: `str`
+        """
+        stats = self.stats()
+        if stats is None:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, 'certbot-dns-transip-{0}-{1}.prof'.format(time.strftime('%Y%m%d-%H%M%S'),
+                                                                                 os.getpid()))
+        stats.dump_stats(path)
+        return path
+
+    def summary(self, top):
+        """
+        Get the functions that took the longest, including the functions they called.
+
+        :param int top: The number of functions.
+        :rtype: `str`
+        """
+        output = io.StringIO()
+        stats = self.stats(output)
+        if stats is not None:
+            stats.sort_stats('cumulative').print_stats(top)
+        return output.getvalue()
@@ -0,0 +1,202 @@
+# -*- coding: UTF-8 -*-
+# File: propagation.py
+"""Check if TXT records are visible on the authoritative nameservers of a domain."""
+
+import logging
+import random
+import socket
+import struct
+import time
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+LOGGER = logging.getLogger(__name__)
+DNS_PORT = 53
+QUERY_TIMEOUT = 2.0
+TYPE_TXT = 16
+CLASS_IN = 1
+FLAG_TRUNCATED = 0x0200
+RCODE_MASK = 0x000f
+RCODE_NXDOMAIN = 3
+
+
+class DNSQueryError(Exception):
+    """Raised when a nameserver can not be queried, or returns an unusable answer."""
+
+
+def _encode_query(query_id, name):
+    question = b''.join(
+        struct.pack('!B', len(label)) + label for label in name.rstrip('.').encode('idna').split(b'.')
+    )
+    # no recursion desired, we only ask authoritative nameservers
+    return struct.pack('!HHHHHH', query_id, 0, 1, 0, 0, 0) + question + b'\x00' + struct.pack('!HH', TYPE_TXT, CLASS_IN)
+
+
+def _skip_name(message, offset):
+    while True:
+        length = message[offset]
+        if length & 0xc0 == 0xc0:  # compression pointer, ends the name
+            return offset + 2
+        offset += 1 + length
+        if length == 0:
+            return offset
+
+
+def _decode_txt_answers(message, query_id):
+    """
+    Get the TXT values from a DNS response.
+
+    :param bytes message: The DNS response.
+    :param int query_id: The ID of the query the response should answer.
+    :returns: The values of all TXT records in the answer section.
+    :rtype: `set` of `str`
+    :raises DNSQueryError: if the response is not a valid answer to the query.
+    """
+    try:
+        response_id, flags, questions, answers = struct.unpack('!HHHH', message[:8])
+        if response_id != query_id:
+            raise DNSQueryError('Response does not match the query')
+        if flags & RCODE_MASK == RCODE_NXDOMAIN:
+            return set()
+        if flags & RCODE_MASK:
+            raise DNSQueryError('Nameserver returned error code {0}'.format(flags & RCODE_MASK))
+
+        offset = 12
+        for _ in range(questions):
+            offset = _skip_name(message, offset) + 4
+        values = set()
+        for _ in range(answers):
+            offset = _skip_name(message, offset)
+            record_type, _, _, length = struct.unpack('!HHIH', message[offset:offset + 10])
+            offset += 10
+            if record_type == TYPE_TXT:
+                rdata, value = message[offset:offset + length], b''
+                while rdata:
+                    value += rdata[1:1 + rdata[0]]
+                    rdata = rdata[1 + rdata[0]:]
+                values.add(value.decode('utf-8', 'replace'))
+            offset += length
+        return values
+    except (IndexError, struct.error):
+        raise DNSQueryError('Malformed DNS response')
+
+
+def _receive_exactly(connection, length):
+    data = b''
+    while len(data) < length:
+        chunk = connection.recv(length - len(data))
+        if not chunk:
+            raise DNSQueryError('Connection closed by nameserver')
+        data += chunk
+    return data
+
+
+def query_txt(name, address, port=DNS_PORT, timeout=QUERY_TIMEOUT):
+    """
+    Query a nameserver directly for the TXT records of a name.
+
+    Uses UDP, and retries over TCP when the answer is truncated.
+
+    :param str name: The name to query.
+    :param str address: The IP address of the nameserver.
+    :param int port: The port of the nameserver.
+    :param float timeout: Seconds to wait for the answer.
+    :returns: The TXT values of the name.
+    :rtype: `set` of `str`
+    :raises DNSQueryError: if the nameserver doesn't answer, or the answer can't be used.
+    """
+    query_id = random.randint(0, 0xffff)
+    query = _encode_query(query_id, name)
+    family = socket.AF_INET6 if ':' in address else socket.AF_INET
+    try:
+        with socket.socket(family, socket.SOCK_DGRAM) as udp:
+            udp.settimeout(timeout)
+            udp.sendto(query, (address, port))
+            message = udp.recv(65535)
+        if len(message) < 4 or not struct.unpack('!H', message[2:4])[0] & FLAG_TRUNCATED:
+            return _decode_txt_answers(message, query_id)
+
+        with socket.create_connection((address, port), timeout=timeout) as tcp:
+            tcp.sendall(struct.pack('!H', len(query)) + query)
+            length = struct.unpack('!H', _receive_exactly(tcp, 2))[0]
+            return _decode_txt_answers(_receive_exactly(tcp, length), query_id)
+    except (OSError, socket.timeout) as error:
+        raise DNSQueryError('Error querying {0}: {1}'.format(address, error))
+
+
+def resolve_nameserver(hostname, port=DNS_PORT):
+    """
+    Get the IP addresses of a nameserver.
+
+    :param str hostname: The hostname (or IP address) of the nameserver.
+    :param int port: The port of the nameserver.
+    :returns: The IP addresses, or an empty list if the hostname can't be resolved.
+    :rtype: `list` of `str`
+    """
+    try:
+        addresses = socket.getaddrinfo(hostname, port, type=socket.SOCK_DGRAM)
+    except socket.gaierror as error:
+        LOGGER.warning('Unable to resolve nameserver %s: %s', hostname, error)
+        return []
+    return sorted(set(address[4][0] for address in addresses))
+
+
+def wait_for_txt_records(expected, timeout, interval, port=DNS_PORT, visible=None):
+    """
+    Wait until TXT records are visible on all the given nameservers.
+
+    :param dict expected: For every (record name, nameserver hostnames) tuple, the set of TXT values that should
+                          be visible on those nameservers.
+    :param float timeout: Maximum number of seconds to wait.
+    :param float interval: Seconds to wait between checks.
+    :param int port: The port of the nameservers.
+    :param dict visible: If given, the time (from `time.time`) every key of `expected` was seen to be visible on
+                         all its nameservers is added to it.
+    :returns: True when all records are visible, False when the timeout passed before that.
+    :rtype: `bool`
+    """
+    deadline = time.time() + timeout
+    addresses = {}
+    pending = []
+    for key, values in expected.items():
+        name, nameservers = key
+        for nameserver in nameservers:
+            if nameserver not in addresses:
+                addresses[nameserver] = resolve_nameserver(nameserver, port)
+            pending.extend((name, address, frozenset(values), key) for address in addresses[nameserver])
+    total = len(pending)
+    if not total:
+        LOGGER.warning('No nameservers to check, waiting %d seconds for DNS changes to propagate', timeout)
+        time.sleep(max(deadline - time.time(), 0))
+        return False
+
+    while True:
+        still_pending = []
+        for check in pending:
+            name, address, values, _ = check
+            try:
+                found = query_txt(name, address, port, min(QUERY_TIMEOUT, max(deadline - time.time(), 0.1)))
+            except DNSQueryError as error:
+                LOGGER.debug('Checking %s: %s', name, error)
+                found = set()
+            if not values <= found:
+                still_pending.append(check)
+        pending = still_pending
+        if visible is not None:
+            now = time.time()
+            pending_keys = set(key for _, _, _, key in pending)
+            for key in expected:
+                if key not in pending_keys:
+                    visible.setdefault(key, now)
+
+        LOGGER.debug('%d of %d TXT record checks passed', total - len(pending), total)
+        if not pending:
+            return True
+        now = time.time()
+        if now >= deadline:
+            LOGGER.debug('Not visible after %d seconds: %s', timeout,
+                         ', '.join('{0} at {1}'.format(name, address) for name, address, _, _ in pending))
+            return False
+        # the last check is made at the deadline
+        time.sleep(min(interval, deadline - now))
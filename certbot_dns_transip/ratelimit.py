@@ -0,0 +1,77 @@
+# -*- coding: UTF-8 -*-
+# File: ratelimit.py
+"""Rate limiting of Transip API requests, shared by all processes on a host."""
+
+import asyncio
+import logging
+import time
+
+from .cache import locked_json_file
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+LOGGER = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Token bucket kept in a locked file, so all processes using the same file and username share one limit.
+
+    The bucket holds at most `burst` tokens and is refilled at `requests_per_minute`. Every request takes a
+    token, waiting for one when the bucket is empty.
+    """
+
+    def __init__(self, path, username, requests_per_minute, burst=10):
+        self.path = path
+        self.username = username
+        self.rate = requests_per_minute / 60.0
+        self.burst = max(burst, 1)
+
+    def _take(self):
+        """
+        Take a token from the bucket if there is one.
+
+        :returns: 0 if a token was taken, otherwise the number of seconds until one is available.
+        :rtype: `float`
+        """
+        with locked_json_file(self.path) as buckets:
+            now = time.time()
+            bucket = buckets.get(self.username, {'tokens': self.burst, 'updated': now})
+            tokens = min(self.burst, bucket['tokens'] + max(now - bucket['updated'], 0) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            buckets[self.username] = {'tokens': tokens, 'updated': now}
+        return wait
+
+    def acquire(self):
+        """
+        Wait until a request may be sent.
+
+        :returns: The number of seconds waited.
+        :rtype: `float`
+        """
+        waited = 0.0
+        wait = self._take()
+        while wait:
+            time.sleep(wait)
+            waited += wait
+            wait = self._take()
+        if waited:
+            LOGGER.debug('Waited %.2f seconds for the rate limit', waited)
+        return waited
+
+    async def acquire_async(self):
+        """Like `acquire`, without blocking the event loop while waiting."""
+        waited = 0.0
+        wait = self._take()
+        while wait:
+            await asyncio.sleep(wait)
+            waited += wait
+            wait = self._take()
+        if waited:
+            LOGGER.debug('Waited %.2f seconds for the rate limit', waited)
+        return waited
@@ -0,0 +1,240 @@
+# -*- coding: UTF-8 -*-
+# File: rest.py
+"""Built-in client for the parts of the Transip v6 REST API used by the plugin, without python-transip."""
+
+import codecs
+import json
+import logging
+import secrets
+
+from . import __version__
+from .base import _TransipClientBase
+from .exceptions import TransipHTTPError, TransipParsingError
+from .keys import sign
+from .retry import entry_created, entry_deleted
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+LOGGER = logging.getLogger(__name__)
+# bytes read from the connection at a time when parsing a response
+CHUNK_SIZE = 64 * 1024
+_WHITESPACE = ' \t\n\r'
+
+
+def _iter_array(chunks, key):
+    """
+    Parse the items of an array in a JSON object while it is being received, like `{"domains": [{...}, ...]}`.
+
+    Only the item being parsed and the part of the response after it are kept in memory, so large responses
+    are never held as a whole, or as a whole parsed document.
+
+    :param chunks: The response body, as an iterable of bytes.
+    :param str key: The key of the array, which should be the first key of the object.
+    :returns: The items of the array.
+    :raises certbot_dns_transip.exceptions.TransipParsingError: if the response is not an object with the array.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = ''
+    position = 0
+    prefix = '"{0}"'.format(key)
+    done = False
+
+    def read():
+        chunk = next(chunks, None)
+        if chunk is None:
+            return text_decoder.decode(b'', final=True), True
+        return text_decoder.decode(chunk), False
+
+    # find the start of the array
+    while True:
+        start = buffer.find(prefix)
+        opening = buffer.find('[', start + len(prefix)) if start >= 0 else -1
+        if opening >= 0:
+            if buffer[start + len(prefix):opening].strip(_WHITESPACE) != ':':
+                raise TransipParsingError('Unexpected response of the Transip API')
+            position = opening + 1
+            break
+        if done:
+            raise TransipParsingError('Response of the Transip API has no {0}'.format(key))
+        text, done = read()
+        buffer += text
+
+    while True:
+        while position < len(buffer) and buffer[position] in _WHITESPACE + ',':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            for _ in chunks:
+                pass  # read the rest of the response, so the connection can be reused
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            # the item is not complete yet
+            if done:
+                raise TransipParsingError('Failed to parse the API response as JSON')
+            text, done = read()
+            buffer = buffer[position:] + text
+            position = 0
+            continue
+        yield item
+        position = end
+
+
+def _error_message(content):
+    try:
+        return json.loads(content.decode())['error']
+    except (ValueError, KeyError, TypeError):
+        return content.decode('utf-8', 'replace')
+
+
+class RequestsTransport:
+    """
+    Sends the requests of `TransipAPI` over a `requests.Session`.
+
+    Any object with the `request` method of this class can be used as transport instead.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    def request(self, method, url, headers, body=None):
+        """
+        Send a request.
+
+        :param str method: The HTTP method.
+        :param str url: The full URL.
+        :param dict headers: The request headers.
+        :param bytes body: The request body.
+        :returns: The status code, the (case insensitive) response headers, and the response body as an iterable
+            of bytes, which is read while it is being parsed.
+        :rtype: `tuple`
+        """
+        response = self.session.request(method, url, headers=headers, data=body, stream=True)
+        return response.status_code, response.headers, response.iter_content(CHUNK_SIZE)
+
+
+class TransipAPI:
+    """
+    The Transip API operations used by the plugin: logging in, listing domain names and DNS entries, and changing
+    DNS entries, with DNS entries as plain dicts.
+
+    Creating it with the RSA key of an account logs in, creating it with an access token doesn't. Failures
+    raise the exceptions of `certbot_dns_transip.exceptions`.
+    """
+
+    def __init__(self, api_url, transport, login=None, access_token=None, private_key=None, global_key=False):
+        self.api_url = api_url.rstrip('/')
+        self.transport = transport
+        self.headers = {'Accept': 'application/json',
+                        'User-Agent': 'certbot-dns-transip/{0}'.format(__version__.strip())}
+        if access_token is None:
+            access_token = self.request_access_token(login, private_key, global_key)
+        self.headers['Authorization'] = 'Bearer {0}'.format(access_token)
+
+    def request_access_token(self, login, private_key, global_key):
+        """
+        Request an access token, signing the request with the RSA key of the account.
+
+        :param str login: The Transip username.
+        :param private_key: The RSA key, see `certbot_dns_transip.keys.load_private_key`.
+        :param bool global_key: Whether the token may be used from any IP address.
+        :returns: The access token.
+        :rtype: `str`
+        """
+        # the API wants a nonce of 6 to 32 characters
+        body = json.dumps({'login': login, 'nonce': secrets.token_hex(16), 'read_only': False,
+                           'global_key': global_key}).encode()
+        headers = {'Accept': 'application/json', 'User-Agent': self.headers['User-Agent'],
+                   'Content-Type': 'application/json', 'Signature': sign(private_key, body)}
+        response = self._send('POST', '/auth', headers, body)
+        try:
+            return response['token']
+        except (KeyError, TypeError):
+            raise TransipParsingError('Failed to extract access token from the API response')
+
+    def _send(self, method, path, headers, body=None, array=None):
+        status, response_headers, chunks = self.transport.request(method, self.api_url + path, headers, body)
+        if not 200 <= status < 300:
+            raise TransipHTTPError(_error_message(b''.join(chunks)), status, response_headers)
+        if array is not None:
+            return _iter_array(chunks, array)
+        content = b''.join(chunks)
+        try:
+            return json.loads(content.decode()) if content else None
+        except ValueError:
+            raise TransipParsingError('Failed to parse the API response as JSON')
+
+    def _request(self, method, path, data=None, array=None):
+        headers = self.headers
+        body = None
+        if data is not None:
+            headers = dict(self.headers, **{'Content-Type': 'application/json'})
+            body = json.dumps(data, separators=(',', ':')).encode()
+        return self._send(method, path, headers, body, array)
+
+    def domain_names(self):
+        """The names of all domains in the account."""
+        return [domain['name'] for domain in self._request('GET', '/domains', array='domains')]
+
+    def dns_entries(self, domain_name):
+        """The DNS entries of a domain."""
+        return list(self._request('GET', '/domains/{0}/dns'.format(domain_name), array='dnsEntries'))
+
+    def add_dns_entry(self, domain_name, entry):
+        """Add a DNS entry to a domain."""
+        self._request('POST', '/domains/{0}/dns'.format(domain_name), {'dnsEntry': entry})
+
+    def replace_dns_entries(self, domain_name, entries):
+        """Replace all DNS entries of a domain."""
+        self._request('PUT', '/domains/{0}/dns'.format(domain_name), {'dnsEntries': entries})
+
+    def delete_dns_entry(self, domain_name, entry):
+        """Remove a DNS entry from a domain."""
+        self._request('DELETE', '/domains/{0}/dns'.format(domain_name), {'dnsEntry': entry})
+
+    def nameservers(self, domain_name):
+        """The hostnames of the nameservers of a domain."""
+        return [nameserver['hostname'] for nameserver in
+                self._request('GET', '/domains/{0}/nameservers'.format(domain_name), array='nameservers')]
+
+
+class _RestTransipClient(_TransipClientBase):
+    """
+    Transip API client using the built-in `TransipAPI` instead of python-transip.
+
+    The requests go through the `transport`, by default the shared session of the client. Domains are not
+    fetched as objects before changing their DNS entries, so a domain costs one request less than with
+    python-transip.
+    """
+
+    def __init__(self, *args, **kwargs):
+        transport = kwargs.pop('transport', None)
+        super(_RestTransipClient, self).__init__(*args, **kwargs)
+        self.transport = transport or RequestsTransport(self.session)
+
+    def _new_client(self, **kwargs):
+        return TransipAPI(self.api_url, self.transport, **kwargs)
+
+    def _share_session(self, client):
+        pass  # the transport was given when the client was created
+
+    def _fetch_domain_names(self):
+        return self._request(self.client.domain_names)
+
+    def _fetch_nameservers(self, canonical_domain):
+        return self._request(self.client.nameservers, canonical_domain)
+
+    def _dns_entries(self, canonical_domain):
+        return self._request(self.client.dns_entries, canonical_domain)
+
+    def _create_entry(self, canonical_domain, entry):
+        self._request(self.client.add_dns_entry, canonical_domain, entry, applied=entry_created)
+
+    def _replace_entries(self, canonical_domain, entries):
+        self._request(self.client.replace_dns_entries, canonical_domain, entries)
+
+    def _delete_entry(self, canonical_domain, entry):
+        self._request(self.client.delete_dns_entry, canonical_domain, entry, applied=entry_deleted)
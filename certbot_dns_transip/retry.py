@@ -0,0 +1,173 @@
+# -*- coding: UTF-8 -*-
+# File: retry.py
+"""Retrying of Transip API calls that failed because of rate limiting or temporary errors."""
+
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import requests
+
+from .exceptions import TransipHTTPError, TransipIOError
+from .options import MAX_RETRIES, RETRY_BUDGET
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+LOGGER = logging.getLogger(__name__)
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+RETRY_EXCEPTIONS = (
+    TransipHTTPError,
+    TransipIOError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+
+
+def _retry_after(headers):
+    """
+    Get the number of seconds the server asked to wait, from the Retry-After or X-Rate-Limit-Reset header.
+
+    :param headers: The response headers (with case insensitive access).
+    :returns: The number of seconds, or None when the server didn't say.
+    :rtype: `float`
+    """
+    value = headers.get('Retry-After')
+    if value:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            try:
+                return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    value = headers.get('X-Rate-Limit-Reset')
+    if value:
+        try:
+            return max(float(value) - time.time(), 0.0)
+        except ValueError:
+            pass
+    return None
+
+
+def entry_created(error):
+    """Whether the error of a retried create shows that an earlier attempt created the DNS entry."""
+    return (isinstance(error, TransipHTTPError) and error.response_code in (406, 409) and
+            'already exists' in str(error).lower())
+
+
+def entry_deleted(error):
+    """Whether the error of a retried delete shows that an earlier attempt removed the DNS entry."""
+    return isinstance(error, TransipHTTPError) and error.response_code == 404
+
+
+class RetryPolicy:
+    """
+    Retry failed calls with jittered exponential backoff.
+
+    Calls are retried on connection errors and on responses with status 429 or 5xx. The delay before a retry
+    is the time the server asked to wait, or a random delay of at most `backoff * 2 ** retry` (capped at
+    `max_backoff`) seconds. A call is given up when `retries` retries were done, or when waiting would pass
+    its `deadline`. All calls share a `budget` of seconds to spend waiting, so a run of certbot stops
+    retrying when the API stays unavailable. Retries are counted in `metrics`, when given.
+
+    An attempt that seemed to fail may still have been applied, when only its response was lost. Calls that are
+    not idempotent, like creating or deleting a DNS entry, pass a function that recognizes the error such a
+    call gets on a retry, like `entry_created` and `entry_deleted`, which then counts as success.
+    """
+
+    def __init__(self, retries=MAX_RETRIES, backoff=1.0, max_backoff=30.0, deadline=120.0, budget=RETRY_BUDGET,
+                 metrics=None):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.budget = budget
+        self.metrics = metrics
+        self._lock = threading.Lock()
+
+    def _delay(self, error, retry, started):
+        """
+        Decide on retrying a failed call.
+
+        :param Exception error: The error of the last attempt.
+        :param int retry: The number of retries done so far.
+        :param float started: The `time.monotonic` at which the first attempt started.
+        :returns: The number of seconds to wait before retrying, or None to give up.
+        :rtype: `float`
+        """
+        if retry >= self.retries:
+            return None
+        delay = None
+        if isinstance(error, TransipHTTPError):
+            if error.response_code not in RETRY_STATUS_CODES:
+                return None
+            delay = _retry_after(getattr(error, 'headers', None) or {})
+        if delay is None:
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry))
+        if time.monotonic() - started + delay > self.deadline:
+            return None
+        with self._lock:
+            if delay > self.budget:
+                return None
+            self.budget -= delay
+        return delay
+
+    def _log(self, name, error, retry, attempt_started, delay):
+        if self.metrics is not None:
+            self.metrics.count_retry(name)
+        LOGGER.info('%s failed after %.2f seconds (attempt %d): %s, retrying in %.2f seconds',
+                    name, time.monotonic() - attempt_started, retry + 1, error, delay)
+
+    def _applied(self, name, error, retry, applied):
+        if retry and applied is not None and applied(error):
+            LOGGER.info('%s was applied by an earlier attempt: %s', name, error)
+            return True
+        return False
+
+    def call(self, name, operation, *args, applied=None, **kwargs):
+        """
+        Call an operation, retrying it when it fails with a temporary error.
+
+        :param str name: The name of the operation, for logging.
+        :param operation: The function to call.
+        :param applied: For an operation that is not idempotent, tells from the error of a retry whether an
+            earlier attempt was applied.
+        :returns: The result of the operation, or None when an earlier attempt was applied.
+        """
+        started = time.monotonic()
+        retry = 0
+        while True:
+            attempt_started = time.monotonic()
+            try:
+                return operation(*args, **kwargs)
+            except RETRY_EXCEPTIONS as error:
+                if self._applied(name, error, retry, applied):
+                    return None
+                delay = self._delay(error, retry, started)
+                if delay is None:
+                    raise
+                self._log(name, error, retry, attempt_started, delay)
+            time.sleep(delay)
+            retry += 1
+
+    async def call_async(self, name, operation, *args, applied=None, **kwargs):
+        """Like `call`, for a coroutine function."""
+        started = time.monotonic()
+        retry = 0
+        while True:
+            attempt_started = time.monotonic()
+            try:
+                return await operation(*args, **kwargs)
+            except RETRY_EXCEPTIONS as error:
+                if self._applied(name, error, retry, applied):
+                    return None
+                delay = self._delay(error, retry, started)
+                if delay is None:
+                    raise
+                self._log(name, error, retry, attempt_started, delay)
+            await asyncio.sleep(delay)
+            retry += 1
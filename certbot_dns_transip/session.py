@@ -0,0 +1,46 @@
+# -*- coding: UTF-8 -*-
+# File: session.py
+"""The pool of HTTP connections shared by all requests to the Transip API in a run."""
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .cassette import CassetteAdapter
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+
+class _TimeoutSession(requests.Session):
+    """Session applying default timeouts, as python-transip sends its requests without one."""
+
+    def __init__(self, timeout):
+        super(_TimeoutSession, self).__init__()
+        self.timeout = timeout
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super(_TimeoutSession, self).send(request, **kwargs)
+
+
+def create_session(options, cassette=None):
+    """
+    Create a session with a pool of connections for the Transip API.
+
+    :param HTTPOptions options: The connection settings.
+    :param cassette: The cassette to record the responses to, or to replay them from.
+    :type cassette: `certbot_dns_transip.cassette.Cassette`
+    :returns: The session.
+    :rtype: `requests.Session`
+    """
+    session = _TimeoutSession((options.connect_timeout, options.read_timeout))
+    if cassette is None:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=options.pool_size)
+    else:
+        adapter = CassetteAdapter(cassette, pool_connections=1, pool_maxsize=options.pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not options.keep_alive:
+        session.headers['Connection'] = 'close'
+    return session
@@ -0,0 +1,154 @@
+# -*- coding: UTF-8 -*-
+# File: stats.py
+"""How long the TXT records of every domain took to propagate, to choose how long to poll for them next time."""
+
+import argparse
+import math
+import sys
+import time
+
+from certbot import errors
+from certbot.plugins import dns_common
+
+from .cache import locked_json_file
+
+__author__ = '''Wim Fournier <wim@fournier.nl>'''
+__docformat__ = 'plaintext'
+
+# the number of most recent propagation times kept for every domain
+SAMPLES = 20
+# domains with fewer propagation times are polled for the maximum time
+MIN_SAMPLES = 3
+PERCENTILE = 95.0
+# seconds to poll at least, however fast a domain was before
+FLOOR = 10
+
+
+def _percentile(values, percentile):
+    """The nearest-rank percentile of a non-empty list of numbers."""
+    values = sorted(values)
+    rank = int(math.ceil(percentile / 100.0 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+class PropagationStats:
+    """
+    The most recent propagation times of every domain, kept in a file.
+
+    A propagation time is the number of seconds between adding the TXT records of a domain, and the records
+    being visible on all nameservers of the domain.
+    """
+
+    def __init__(self, path, samples=SAMPLES):
+        self.path = path
+        self.samples = samples
+
+    def record(self, durations):
+        """
+        Add propagation times.
+
+        :param dict durations: The seconds the records of every domain took to propagate.
+        """
+        now = time.time()
+        with locked_json_file(self.path) as stats:
+            for domain, seconds in durations.items():
+                samples = stats.setdefault(domain, [])
+                samples.append([now, round(seconds, 3)])
+                del samples[:-self.samples]
+
+    def get(self):
+        """
+        Get the propagation times of all domains.
+
+        :returns: For every domain, the (time, seconds) lists of its propagation times, oldest first.
+        :rtype: `dict`
+        """
+        with locked_json_file(self.path) as stats:
+            return dict(stats)
+
+    def reset(self, domains=None):
+        """
+        Forget the propagation times of some or all domains.
+
+        :param list domains: The domains to forget, None for all.
+        :returns: The domains that were forgotten.
+        :rtype: `list`
+        """
+        with locked_json_file(self.path) as stats:
+            forget = [domain for domain in stats if domains is None or domain in domains]
+            for domain in forget:
+                del stats[domain]
+        return sorted(forget)
+
+    def wait_seconds(self, domains, percentile, floor, ceiling):
+        """
+        Get the number of seconds to poll for the records of some domains, before giving up on them.
+
+        Every domain needs the given percentile of its propagation times, or `ceiling` when there are fewer
+        than `MIN_SAMPLES` of them. The slowest domain decides, within `floor` and `ceiling`.
+
+        :param list domains: The domains.
+        :param float percentile: The percentile of the propagation times to wait, like 95.
+        :param float floor: The minimum number of seconds.
+        :param float ceiling: The maximum number of seconds.
+        :rtype: `float`
+        """
+        stats = self.get()
+        return max([_wait_seconds(stats.get(domain, []), percentile, floor, ceiling) for domain in domains] or
+                   [ceiling])
+
+
+def _wait_seconds(samples, percentile, floor, ceiling):
+    if len(samples) < MIN_SAMPLES:
+        return ceiling
+    return min(max(_percentile([seconds for _, seconds in samples], percentile), floor), ceiling)
+
+
+def _show(stats, args, output):
+    output.write('{0:<30} {1:>7} {2:>8} {3:>8} {4:>8} {5:>8}\n'.format(
+        'domain', 'samples', 'median', 'p{0:g}'.format(args.percentile), 'max', 'wait'))
+    for domain in sorted(stats):
+        seconds = [sample_seconds for _, sample_seconds in stats[domain]]
+        output.write('{0:<30} {1:>7} {2:>8.1f} {3:>8.1f} {4:>8.1f} {5:>8.1f}\n'.format(
+            domain, len(seconds), _percentile(seconds, 50), _percentile(seconds, args.percentile), max(seconds),
+            _wait_seconds(stats[domain], args.percentile, args.floor, args.ceiling)))
+
+
+def main(argv=None, output=None):
+    """Entry point of the `certbot-dns-transip-propagation` command."""
+    parser = argparse.ArgumentParser(
+        description='Show or reset the propagation times of the domains, which the adaptive propagation mode of '
+                    'the plugin uses to choose how long to wait.')
+    parser.add_argument('--credentials', required=True,
+                        help='The credentials INI file of the plugin. It should set dns_transip_propagation_stats.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    show = subparsers.add_parser('show', help='Show the propagation times, and the wait they lead to.')
+    show.add_argument('--percentile', type=float, default=PERCENTILE,
+                      help='The percentile of the propagation times to wait (default: %(default)s).')
+    show.add_argument('--floor', type=float, default=FLOOR,
+                      help='The minimum number of seconds to wait (default: %(default)s).')
+    show.add_argument('--ceiling', type=float, default=240,
+                      help='The maximum number of seconds to wait (default: %(default)s).')
+    reset = subparsers.add_parser('reset', help='Forget the propagation times.')
+    reset.add_argument('domains', nargs='*', help='The domains to forget (default: all).')
+    args = parser.parse_args(argv)
+    output = output or sys.stdout
+
+    try:
+        credentials = dns_common.CredentialsConfiguration(args.credentials, lambda name: 'dns_transip_' + name)
+        credentials.require({'propagation_stats': 'propagation stats file'})
+        stats = PropagationStats(credentials.conf('propagation_stats'))
+        if args.command == 'show':
+            _show(stats.get(), args, output)
+        else:
+            forgotten = stats.reset(args.domains or None)
+            output.write('Forgot the propagation times of {0} domains\n'.format(len(forgotten)))
+    except (errors.PluginError, OSError) as error:
+        sys.stderr.write('{0}\n'.format(error))
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
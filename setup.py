@@ -39,6 +39,12 @@ setup(
         'certbot.plugins': [
             'dns-transip = certbot_dns_transip.dns_transip:Authenticator',
         ],
+        'console_scripts': [
+            'certbot-dns-transip-gc = certbot_dns_transip.gc:main',
+            'certbot-dns-transip-broker = certbot_dns_transip.broker:main',
+            'certbot-dns-transip-propagation = certbot_dns_transip.stats:main',
+            'certbot-dns-transip-bulk = certbot_dns_transip.bulk:main',
+        ],
     },
     classifiers=[
         'Development Status :: 4 - Beta',
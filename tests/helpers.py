@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""Fixtures shared by the tests of the Transip API client."""
+
+import logging
+from tempfile import mktemp
+
+from certbot_dns_transip.client import _TransipClient
+from certbot_dns_transip.retry import RetryPolicy
+
+USERNAME = 'foobar'
+KEY_FILE = mktemp()
+
+
+# wrap the class we want to test, to remove the client init in __init__ (as it will break)
+class TransipClientTest(_TransipClient):
+    def __init__(self, **kwargs):
+        kwargs.setdefault('retry_policy', RetryPolicy(backoff=0))  # retry without waiting
+        super(TransipClientTest, self).__init__(username=USERNAME, key_file=KEY_FILE, global_key=False, **kwargs)
+        self.logger = logging.getLogger(__name__)
+
+
+class DomainMock:
+    def __init__(self, name):
+        self.name = name
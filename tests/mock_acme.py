@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""A stand-in for the ACME server, checking the dns-01 challenges against the DNS entries of a mock Transip server."""
+
+import os
+import threading
+
+from acme import challenges, errors as acme_errors, messages
+from cryptography import x509
+
+
+class MockACMEClient:
+    """
+    Stands in for `acme.client.ClientV2`, for the calls that validate domains, checking the dns-01 challenges
+    against the DNS entries of a `MockTransipServer`.
+
+    Like Let's Encrypt, the server reuses the valid authorization of a domain in later orders, and a challenge is
+    only valid when it was answered and its TXT record exists when the authorizations are polled. Orders are
+    never finalized.
+    """
+
+    def __init__(self, transip_server, account_key):
+        self.transip_server = transip_server
+        self.account_key = account_key
+        self.orders = 0
+        self.answered = []
+        self._authorizations = {}
+        self._lock = threading.Lock()
+
+    def new_order(self, csr_pem):
+        """Create an order for the domains of a CSR."""
+        csr = x509.load_pem_x509_csr(csr_pem)
+        domains = csr.extensions.get_extension_for_class(
+            x509.SubjectAlternativeName).value.get_values_for_type(x509.DNSName)
+        with self._lock:
+            self.orders += 1
+            authorizations = [self._authorization(domain) for domain in domains]
+            return messages.OrderResource(
+                body=messages.Order(identifiers=[authzr.body.identifier for authzr in authorizations],
+                                    status=messages.STATUS_PENDING,
+                                    authorizations=[authzr.uri for authzr in authorizations]),
+                authorizations=authorizations, uri='https://acme.invalid/order/{0}'.format(self.orders),
+                csr_pem=csr_pem)
+
+    def _authorization(self, domain):
+        authzr = self._authorizations.get(domain)
+        if authzr is None or authzr.body.status == messages.STATUS_INVALID:
+            challb = messages.ChallengeBody(chall=challenges.DNS01(token=os.urandom(16)),
+                                            uri='https://acme.invalid/challenge/' + domain,
+                                            status=messages.STATUS_PENDING)
+            # like in ACME, a wildcard is validated for the domain it covers
+            wildcard = domain.startswith('*.')
+            identifier = messages.Identifier(typ=messages.IDENTIFIER_FQDN, value=domain[2:] if wildcard else domain)
+            authzr = messages.AuthorizationResource(
+                body=messages.Authorization(identifier=identifier, challenges=[challb], wildcard=wildcard or None,
+                                            status=messages.STATUS_PENDING),
+                uri='https://acme.invalid/authz/' + domain)
+            self._authorizations[domain] = authzr
+        return authzr
+
+    def answer_challenge(self, challb, response):  # pylint: disable=unused-argument
+        """Tell the server a challenge is ready to be validated."""
+        with self._lock:
+            self.answered.append(challb.uri)
+
+    def poll_authorizations(self, orderr, deadline):  # pylint: disable=unused-argument
+        """
+        Validate the pending authorizations of an order.
+
+        :raises acme.errors.ValidationError: if any of the authorizations is invalid.
+        """
+        with self._lock:
+            authorizations = [self._validate(authzr.uri.rsplit('/', 1)[1]) for authzr in orderr.authorizations]
+        failed = [authzr for authzr in authorizations if authzr.body.status != messages.STATUS_VALID]
+        if failed:
+            raise acme_errors.ValidationError(failed)
+        return orderr.update(authorizations=authorizations, body=orderr.body.update(status=messages.STATUS_READY))
+
+    def _validate(self, domain):
+        authzr = self._authorizations[domain]
+        if authzr.body.status != messages.STATUS_PENDING:
+            return authzr
+        challb = authzr.body.challenges[0]
+        name = challb.chall.validation_domain_name(authzr.body.identifier.value)
+        valid = challb.uri in self.answered and challb.chall.validation(self.account_key) in self._txt_values(name)
+        status = messages.STATUS_VALID if valid else messages.STATUS_INVALID
+        error = None if valid else messages.Error.with_code('unauthorized', detail='No TXT record found at ' + name)
+        authzr = authzr.update(body=authzr.body.update(
+            status=status, challenges=[challb.update(status=status, error=error)]))
+        self._authorizations[domain] = authzr
+        return authzr
+
+    def _txt_values(self, name):
+        for zone, entries in self.transip_server.zones.items():
+            if name.endswith('.' + zone):
+                label = name[:-len(zone) - 1]
+                return set(entry['content'] for entry in entries if entry['type'] == 'TXT' and entry['name'] == label)
+        return set()
@@ -0,0 +1,150 @@
+from unittest import TestCase
+
+import time
+
+import mock
+from certbot.errors import PluginError
+
+from certbot_dns_transip.aio import _AsyncTransipClient
+from certbot_dns_transip.mock_server import MockTransipServer, TOKEN
+
+DOMAINS = ['example.com', 'example.org', 'example.net']
+
+
+class Test_AsyncTransipClient(TestCase):
+    def setUp(self):
+        self.stub = MockTransipServer(DOMAINS)
+        self.addCleanup(self.stub.close)
+        self.transip_client = _AsyncTransipClient(username='foobar', key_file='key', global_key=False)
+        self.transip_client.client = mock.MagicMock(headers={'Authorization': 'Bearer ' + TOKEN})
+        self.transip_client.api_url = self.stub.url
+
+    @staticmethod
+    def _records(*names):
+        return [(name, '_acme-challenge.' + name, 'content ' + name) for name in names]
+
+    def test_add_and_del_txt_records(self):
+        records = self._records('example.com', 'www.example.com', 'example.org')
+        self.transip_client.add_txt_records(records)
+
+        self.assertEqual(self.stub.zones['example.com'], [
+            {'name': '_acme-challenge', 'type': 'TXT', 'content': 'content example.com', 'expire': 1},
+            {'name': '_acme-challenge.www', 'type': 'TXT', 'content': 'content www.example.com', 'expire': 1},
+        ])
+        self.assertEqual(self.stub.zones['example.org'], [
+            {'name': '_acme-challenge', 'type': 'TXT', 'content': 'content example.org', 'expire': 1},
+        ])
+        self.assertEqual(sorted(self.stub.requests), [
+            ('GET', '/v6/domains'),
+            ('GET', '/v6/domains/example.com/dns'),
+            ('GET', '/v6/domains/example.org/dns'),
+            ('POST', '/v6/domains/example.com/dns'),
+            ('POST', '/v6/domains/example.com/dns'),
+            ('POST', '/v6/domains/example.org/dns'),
+        ])
+
+        # the records are already there
+        self.transip_client.add_txt_records(records)
+        self.assertEqual(len(self.stub.requests), 6)
+
+        self.assertEqual(self.transip_client.del_txt_records(records), dict.fromkeys(records))
+        self.assertEqual(self.stub.zones, dict.fromkeys(DOMAINS, []))
+
+    def test_changes_of_other_processes_kept(self):
+        self.transip_client.add_txt_records(self._records('example.com'))
+        other_run = {'name': '_acme-challenge.mail', 'type': 'TXT', 'content': 'other run', 'expire': 1}
+        self.stub.zones['example.com'].append(other_run)
+
+        self.transip_client.add_txt_records(self._records('www.example.com', 'shop.example.com'))
+        self.assertEqual(len(self.stub.zones['example.com']), 4)
+        self.assertIn(other_run, self.stub.zones['example.com'])
+
+    def test_changes_during_update_kept(self):
+        other_run = {'name': '_acme-challenge.mail', 'type': 'TXT', 'content': 'other run', 'expire': 1}
+        handle = self.stub.handle
+
+        def handle_and_change(method, path, headers, body):
+            response = handle(method, path, headers, body)
+            if method == 'GET' and path == '/v6/domains/example.com/dns':
+                # another process adds its record right after the entries were read
+                self.stub.zones['example.com'].append(other_run)
+            return response
+
+        with mock.patch.object(self.stub, 'handle', handle_and_change):
+            self.transip_client.add_txt_records(self._records('example.com', 'www.example.com'))
+        self.assertEqual(len(self.stub.zones['example.com']), 3)
+        self.assertIn(other_run, self.stub.zones['example.com'])
+
+    def test_changes_during_cleanup_kept(self):
+        records = self._records('example.com', 'www.example.com')
+        self.transip_client.add_txt_records(records)
+        other_run = {'name': '_acme-challenge.mail', 'type': 'TXT', 'content': 'other run', 'expire': 1}
+        handle = self.stub.handle
+        changed = []
+
+        def handle_and_change(method, path, headers, body):
+            response = handle(method, path, headers, body)
+            if path == '/v6/domains/example.com/dns' and not changed:
+                # another process adds its record right after the first request of the cleanup
+                changed.append(path)
+                self.stub.zones['example.com'].append(other_run)
+            return response
+
+        with mock.patch.object(self.stub, 'handle', handle_and_change):
+            self.assertEqual(self.transip_client.del_txt_records(records), dict.fromkeys(records))
+        self.assertEqual(self.stub.zones['example.com'], [other_run])
+
+    def test_single_record(self):
+        record = self._records('example.net')[0]
+        self.transip_client.add_txt_record(*record)
+        self.assertEqual(len(self.stub.zones['example.net']), 1)
+        self.transip_client.del_txt_record(*record)
+        self.assertEqual(self.stub.zones['example.net'], [])
+        # known to be gone already
+        self.transip_client.del_txt_record(*record)
+
+        transip_client = _AsyncTransipClient(username='foobar', key_file='key', global_key=False)
+        transip_client.client = self.transip_client.client
+        transip_client.api_url = self.stub.url
+        self.assertRaises(PluginError, transip_client.del_txt_record, *record)
+
+    def test_errors(self):
+        self.transip_client.add_txt_records(self._records('example.com'))
+        del self.stub.zones['example.org']
+        records = self._records('example.com', 'example.org')
+
+        with self.assertRaises(PluginError) as context:
+            self.transip_client.add_txt_records(records)
+        self.assertEqual(str(context.exception),
+                         'Error adding TXT records using the Transip API: example.org: 404: Domain not found')
+
+        results = self.transip_client.del_txt_records(records)
+        self.assertIsNone(results[records[0]])
+        self.assertIn('404: Domain not found', results[records[1]])
+
+    def test_token_rejected(self):
+        self.stub.token = 'renewed'
+        with mock.patch('certbot_dns_transip.rest.TransipAPI.request_access_token',
+                        return_value='renewed') as request_access_token, \
+                mock.patch('certbot_dns_transip.base.load_private_key', return_value=mock.sentinel.key):
+            self.transip_client.add_txt_records(self._records('example.com'))
+        request_access_token.assert_called_once_with('foobar', mock.sentinel.key, False)
+        self.assertEqual(len(self.stub.zones['example.com']), 1)
+
+    def test_zones_updated_concurrently(self):
+        self.transip_client._get_domains()  # pylint: disable=protected-access
+        self.stub.latency = 0.1
+        names = ['example.com', 'www.example.com', 'example.org', 'www.example.org', 'example.net']
+
+        start = time.perf_counter()
+        self.transip_client.add_txt_records(self._records(*names))
+        duration = time.perf_counter() - start
+
+        # example.com and example.org take a read and two creates, example.net a read and a create
+        self.assertLess(duration, 0.45)
+        self.assertEqual(self.stub.connections, 3 + 1)
+
+    def test_concurrency_bounded(self):
+        self.transip_client.max_workers = 1
+        self.transip_client.add_txt_records(self._records(*DOMAINS))
+        self.assertEqual(self.stub.connections, 2)  # one for the listing, one for the updates
@@ -0,0 +1,296 @@
+"""Micro-benchmarks for the hot paths of the plugin, with generous bounds to catch regressions."""
+from unittest import TestCase
+
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import mock
+from acme import challenges, messages
+from certbot import achallenges
+from certbot.plugins import dns_test_common
+from certbot.tests import acme_util
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from certbot_dns_transip.bulk import BulkValidator, Certificate, _plugin_config
+from certbot_dns_transip.client import _TransipClient
+from certbot_dns_transip.dns_transip import Authenticator
+from certbot_dns_transip.mock_server import MockTransipServer
+from tests.helpers import DomainMock
+from tests.mock_acme import MockACMEClient
+
+LOGGER = logging.getLogger(__name__)
+
+
+class BenchmarkFindDomain(TestCase):
+    domain_count = 10000
+    lookup_count = 1000
+
+    def test_find_domain(self):
+        transip_client = _TransipClient(username='foobar', key_file='key', global_key=False)
+        transip_client.client = mock.MagicMock()
+        transip_client.client.domains.list.return_value = [
+            DomainMock(name='domain{0}.example{1}.com'.format(index, index % 7)) for index in range(self.domain_count)
+        ]
+        lookups = ['_acme-challenge.www{0}.domain{1}.example{2}.com'.format(index, index * 7, index * 7 % 7)
+                   for index in range(self.lookup_count)]
+
+        start = time.perf_counter()
+        for _ in range(2):  # the second pass is served from the memoized results
+            for lookup in lookups:
+                transip_client._find_domain(lookup)  # pylint: disable=protected-access
+        duration = time.perf_counter() - start
+
+        LOGGER.info('%d lookups in %d domains took %.4f seconds', 2 * self.lookup_count, self.domain_count, duration)
+        self.assertEqual(transip_client.client.domains.list.call_count, 1)
+        self.assertLess(duration, 1)
+
+
+class BenchmarkImport(TestCase):
+    """Certbot imports every installed plugin when it starts, also when it doesn't use it."""
+
+    # modules that should only be imported when the plugin makes its first API call
+    client_modules = ['distutils', 'certbot_dns_transip.base', 'certbot_dns_transip.client',
+                      'certbot_dns_transip.session']
+
+    def test_import_time(self):
+        # certbot itself is imported first, so only the plugin and the modules it adds to certbot's are timed
+        code = ('import sys, certbot.plugins.dns_common; certbot_modules = set(sys.modules); '
+                'import certbot_dns_transip.dns_transip; print(" ".join(set(sys.modules) - certbot_modules))')
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        modules = process.stdout.split()
+        microseconds = [int(line.split('|')[1]) for line in process.stderr.splitlines()
+                        if line.split('|')[-1].strip() == 'certbot_dns_transip.dns_transip']
+
+        LOGGER.info('Importing the plugin took %.4f seconds', microseconds[0] / 1e6)
+        self.assertFalse([module for module in modules if module.split('.')[0] in ('transip', 'requests')])
+        for module in self.client_modules:
+            self.assertNotIn(module, modules)
+        self.assertLess(microseconds[0], 100000)
+
+
+class BenchmarkConcurrentZones(TestCase):
+    zone_count = 8
+    latency = 0.02
+
+    def _transip_client(self, max_workers):
+        def slow(result=None):
+            def call(*_):
+                time.sleep(self.latency)
+                return result
+            return call
+
+        domain = mock.MagicMock()
+        domain.dns.list.side_effect = slow([])
+        domain.dns.create.side_effect = slow()
+        domain.dns.delete.side_effect = slow()
+        transip_client = _TransipClient(username='foobar', key_file='key', global_key=False, max_workers=max_workers)
+        transip_client.client = mock.MagicMock()
+        transip_client.client.domains.list.return_value = [
+            DomainMock(name='example{0}.com'.format(index)) for index in range(self.zone_count)]
+        transip_client.client.domains.get.side_effect = slow(domain)
+        return transip_client
+
+    def _run(self, max_workers):
+        records = [('example{0}.com'.format(index), '_acme-challenge.example{0}.com'.format(index), 'content')
+                   for index in range(self.zone_count)]
+        transip_client = self._transip_client(max_workers)
+        transip_client._get_domains()  # pylint: disable=protected-access
+
+        start = time.perf_counter()
+        transip_client.add_txt_records(records)
+        transip_client.del_txt_records(records)
+        duration = time.perf_counter() - start
+        LOGGER.info('%d zones with %d workers took %.3f seconds', self.zone_count, max_workers, duration)
+        return duration
+
+    def test_scaling(self):
+        durations = dict((max_workers, self._run(max_workers)) for max_workers in (1, 2, 4, 8))
+        # every zone costs 4 calls, which run one after another with a single worker
+        self.assertGreaterEqual(durations[1], self.zone_count * 4 * self.latency)
+        self.assertLess(durations[8], durations[1] / 3)
+        self.assertLess(durations[4], durations[2])
+
+
+class BenchmarkEndToEnd(TestCase):
+    """
+    Run `Authenticator.perform` and `cleanup` against the mock Transip server, reporting API calls, bytes and time.
+
+    Run with `python -m pytest tests/test_benchmark.py --log-cli-level=INFO` to see the report.
+    """
+
+    # (SANs, zones) of the certificates to benchmark
+    certificates = [(1, 1), (10, 1), (10, 5), (100, 1), (100, 20)]
+    backend = 'transip'
+    # requests per zone apart from those of its records, python-transip gets the domain before reading it
+    calls_per_zone = 2
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.mkdtemp()
+        cls.key_file = os.path.join(cls.tempdir, 'transip.key')
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        with open(cls.key_file, 'wb') as handle:
+            handle.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                           serialization.NoEncryption()))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tempdir)
+
+    def _authenticator(self, server):
+        path = os.path.join(self.tempdir, 'transip.ini')
+        dns_test_common.write({'transip_username': 'foobar', 'transip_key_file': self.key_file,
+                               'transip_api_url': server.url}, path)
+        config = mock.MagicMock(transip_credentials=path, transip_propagation_seconds=0,
+                                transip_propagation_mode='sleep', transip_max_workers=None,
+                                transip_backend=self.backend, transip_pool_size=10, transip_connect_timeout=10.0,
+                                transip_read_timeout=60.0, transip_no_keep_alive=False, transip_max_retries=4,
+                                transip_retry_budget=300.0)
+        return Authenticator(config, 'transip')
+
+    def _run(self, sans, zones, **server_options):
+        zone_names = ['zone{0}.example'.format(index) for index in range(zones)]
+        names = [zone_names[index] if index < zones else 'san{0}.{1}'.format(index, zone_names[index % zones])
+                 for index in range(sans)]
+        server = MockTransipServer(zone_names, seed=0, **server_options)
+        self.addCleanup(server.close)
+        authenticator = self._authenticator(server)
+        achalls = [achallenges.KeyAuthorizationAnnotatedChallenge(
+            challb=acme_util.DNS01, identifier=messages.Identifier(typ=messages.IDENTIFIER_FQDN, value=name),
+            account_key=dns_test_common.KEY) for name in names]
+
+        start = time.perf_counter()
+        with mock.patch('certbot_dns_transip.dns_transip.display_util.notify'):
+            authenticator.perform(achalls)
+        self.assertEqual(sum(len(entries) for entries in server.zones.values()), sans)
+        authenticator.cleanup(achalls)
+        duration = time.perf_counter() - start
+
+        self.assertEqual(sum(len(entries) for entries in server.zones.values()), 0)
+        result = {'api_calls': len(server.requests), 'bytes': server.bytes_received + server.bytes_sent,
+                  'seconds': duration}
+        LOGGER.info('%s backend, %3d SANs in %2d zones: %4d API calls, %7d bytes, %.3f seconds', self.backend,
+                    sans, zones, result['api_calls'], result['bytes'], duration)
+        return result
+
+    def test_certificates(self):
+        results = dict(((sans, zones), self._run(sans, zones)) for sans, zones in self.certificates)
+        for (sans, zones), result in results.items():
+            # a login and the domain listing, a few calls for every zone, and a create and a delete for every SAN
+            self.assertLessEqual(result['api_calls'], 2 + self.calls_per_zone * zones + 2 * sans, (sans, zones))
+            self.assertLess(result['seconds'], 10)
+
+    def test_errors_retried(self):
+        result = self._run(10, 5, error_rate=0.3)
+        self.assertGreater(result['api_calls'], self._run(10, 5)['api_calls'])
+
+    def test_account_size(self):
+        small, large = self._run(10, 5), self._run(10, 5, account_size=2000)
+        self.assertEqual(small['api_calls'], large['api_calls'])
+        self.assertGreater(large['bytes'], small['bytes'] + 2000 * 50)
+
+    def test_wildcard_and_apex(self):
+        server = MockTransipServer(['example.com'])
+        self.addCleanup(server.close)
+        other_run = {'name': '_acme-challenge', 'type': 'TXT', 'content': 'other run', 'expire': 1}
+        server.zones['example.com'].append(dict(other_run))
+        authenticator = self._authenticator(server)
+        # the challenges of example.com and *.example.com, both at _acme-challenge.example.com
+        achalls = [achallenges.KeyAuthorizationAnnotatedChallenge(
+            challb=acme_util.chall_to_challb(challenges.DNS01(token=token), messages.STATUS_PENDING),
+            identifier=messages.Identifier(typ=messages.IDENTIFIER_FQDN, value='example.com'),
+            account_key=dns_test_common.KEY) for token in (b'a' * 16, b'b' * 16)]
+
+        with mock.patch('certbot_dns_transip.dns_transip.display_util.notify'):
+            authenticator.perform(achalls)
+        self.assertEqual(len(server.zones['example.com']), 3)
+        self.assertEqual([request for request in server.requests if request[0] != 'GET'],
+                         [('POST', '/v6/auth')] + [('POST', '/v6/domains/example.com/dns')] * 2)
+
+        server.reset_counters()
+        authenticator.cleanup(achalls)
+        self.assertEqual(server.zones['example.com'], [other_run])
+        self.assertEqual([request for request in server.requests if request[0] != 'GET'],
+                         [('DELETE', '/v6/domains/example.com/dns')] * 2)
+
+
+class BenchmarkEndToEndAsyncio(BenchmarkEndToEnd):
+    backend = 'asyncio'
+    calls_per_zone = 1
+
+
+class BenchmarkEndToEndRest(BenchmarkEndToEnd):
+    backend = 'rest'
+    calls_per_zone = 1
+
+
+class BenchmarkBulkValidation(TestCase):
+    """
+    Validate the domains of many certificates one after another, like separate certbot runs, and all at once.
+
+    Run with `python -m pytest tests/test_benchmark.py --log-cli-level=INFO` to see the report.
+    """
+
+    certificate_count = 10
+    zone_count = 3
+    propagation_seconds = 0.2
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.mkdtemp()
+        cls.key_file = os.path.join(cls.tempdir, 'transip.key')
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        with open(cls.key_file, 'wb') as handle:
+            handle.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                           serialization.NoEncryption()))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tempdir)
+
+    def _run(self, batches):
+        zone_names = ['zone{0}.example'.format(index) for index in range(self.zone_count)]
+        certificates = []
+        for index in range(self.certificate_count):
+            domain = 'site{0}.{1}'.format(index, zone_names[index % self.zone_count])
+            certificates.append(Certificate(name=domain, domains=[domain, 'www.' + domain], server=None, account=None,
+                                            credentials=None, lineage=False))
+        server = MockTransipServer(zone_names, seed=0)
+        self.addCleanup(server.close)
+        acme = MockACMEClient(server, dns_test_common.KEY)
+        path = os.path.join(self.tempdir, 'transip.ini')
+        dns_test_common.write({'dns_transip_username': 'foobar', 'dns_transip_key_file': self.key_file,
+                               'dns_transip_api_url': server.url}, path)
+
+        results = {}
+        start = time.perf_counter()
+        with mock.patch('certbot_dns_transip.dns_transip.display_util.notify'):
+            for batch in (certificates[index::batches] for index in range(batches)):
+                authenticator = Authenticator(_plugin_config(path, propagation_seconds=self.propagation_seconds),
+                                              'dns-transip')
+                results.update(BulkValidator(acme, dns_test_common.KEY, authenticator).validate(batch))
+        duration = time.perf_counter() - start
+
+        self.assertEqual(results, dict.fromkeys(certificate.name for certificate in certificates))
+        LOGGER.info('%d certificates in %d zones, in %d batches: %4d API calls, %.3f seconds',
+                    self.certificate_count, self.zone_count, batches, len(server.requests), duration)
+        return len(server.requests), duration
+
+    def test_bulk(self):
+        sequential_calls, sequential = self._run(self.certificate_count)
+        bulk_calls, bulk = self._run(1)
+        # every certificate waits for propagation, or all of them wait once
+        self.assertGreaterEqual(sequential, self.certificate_count * self.propagation_seconds)
+        self.assertLess(bulk, sequential / 4)
+        # a login and the domain listing, a few calls for every zone, and a create and a delete for both names of
+        # a certificate
+        self.assertLessEqual(bulk_calls, 2 + 2 * self.zone_count + 4 * self.certificate_count)
+        # every sequential run logs in and lists the domains again
+        self.assertGreater(sequential_calls, bulk_calls + 2 * self.certificate_count)
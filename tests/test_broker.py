@@ -0,0 +1,215 @@
+from unittest import TestCase
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+import mock
+import transip
+from acme import messages
+from certbot import achallenges
+from certbot.errors import PluginError
+from certbot.plugins import dns_test_common
+from certbot.tests import acme_util
+
+from certbot_dns_transip.broker import Broker, BrokerClient, _send_request, main
+from certbot_dns_transip.client import _TransipClient
+from certbot_dns_transip.dns_transip import Authenticator
+from certbot_dns_transip.mock_server import MockTransipServer, TOKEN
+
+DOMAINS = ['example.com', 'example.org', 'example.net']
+
+
+def _records(*names):
+    return [(name, '_acme-challenge.' + name, 'content ' + name) for name in names]
+
+
+class TestBroker(TestCase):
+    def setUp(self):
+        self.stub = MockTransipServer(DOMAINS)
+        self.addCleanup(self.stub.close)
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.path = os.path.join(self.tempdir, 'broker.sock')
+
+        transip_client = _TransipClient(username='foobar', key_file='key', global_key=False, max_workers=4)
+        client = transip.TransIP(login='foobar', access_token=TOKEN)
+        client._url = self.stub.url  # pylint: disable=protected-access
+        transip_client.client = client
+        self.broker = Broker(transip_client, self.path, window=0.2)
+        self.broker.start()
+        self.addCleanup(self.broker.close)
+        thread = threading.Thread(target=self.broker.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.broker.shutdown)
+        self.create_client = mock.MagicMock()
+
+    def _broker_client(self, username='foobar'):
+        return BrokerClient(self.path, username, self.create_client, timeout=10)
+
+    def _concurrently(self, method, batches):
+        results = [None] * len(batches)
+
+        def run(index):
+            try:
+                results[index] = getattr(self._broker_client(), method)(batches[index])
+            except PluginError as error:
+                results[index] = error
+
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(len(batches))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_requests_coalesced(self):
+        batches = [_records('www{0}.example.com'.format(index), 'www{0}.example.org'.format(index))
+                   for index in range(8)]
+        self.assertEqual(self._concurrently('add_txt_records', batches), [None] * 8)
+        self.assertEqual(len(self.stub.zones['example.com']), 8)
+        self.assertEqual(len(self.stub.zones['example.org']), 8)
+        # a single update of each domain for the requests of all processes
+        self.assertEqual(sorted(request for request in self.stub.requests if request[0] != 'GET'),
+                         [('PUT', '/v6/domains/example.com/dns'), ('PUT', '/v6/domains/example.org/dns')])
+
+        self.stub.reset_counters()
+        results = self._concurrently('del_txt_records', batches)
+        self.assertEqual(results, [dict.fromkeys(batch) for batch in batches])
+        self.assertEqual(self.stub.zones, dict.fromkeys(DOMAINS, []))
+        self.assertEqual(len([request for request in self.stub.requests if request[0] != 'GET']), 2)
+        self.create_client.assert_not_called()
+
+    def test_results_per_request(self):
+        # the zone of example.net is gone, also when the domains are fetched again for www.example.invalid
+        self.stub.zones.pop('example.net')
+        with mock.patch.object(self.broker.transip_client, '_fetch_domain_names', return_value=DOMAINS):
+            results = self._concurrently('add_txt_records', [_records('example.com'), _records('example.net'),
+                                                             _records('www.example.invalid')])
+        self.assertIsNone(results[0])
+        self.assertIn('Error adding TXT records to example.net using the Transip API: 404', str(results[1]))
+        self.assertIn('Unable to determine base domain for www.example.invalid', str(results[2]))
+        self.assertEqual(len(self.stub.zones['example.com']), 1)
+
+        results = self._broker_client().del_txt_records(_records('example.com', 'example.net'))
+        self.assertIsNone(results[_records('example.com')[0]])
+        self.assertIn('example.net', results[_records('example.net')[0]])
+
+    def test_other_user(self):
+        direct_client = self.create_client.return_value
+        broker_client = self._broker_client('other')
+        broker_client.add_txt_records(_records('example.com'))
+        broker_client.del_txt_records(_records('example.com'))
+
+        self.create_client.assert_called_once_with()
+        direct_client.add_txt_records.assert_called_once_with(_records('example.com'))
+        direct_client.del_txt_records.assert_called_once_with(_records('example.com'))
+        self.assertEqual(self.stub.requests, [])
+
+    def test_invalid_request(self):
+        for request in ({}, {'action': 'rename', 'username': 'foobar', 'records': []},
+                        {'action': 'add', 'username': 'foobar', 'records': [['example.com', 1]]}):
+            self.assertIn('Invalid request', _send_request(self.path, request, 10)['error'])
+
+    def test_second_broker(self):
+        self.assertRaises(PluginError, Broker(self.broker.transip_client, self.path).start)
+
+
+class TestBrokerClient(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.path = os.path.join(self.tempdir, 'broker.sock')
+
+    def test_no_broker(self):
+        create_client = mock.MagicMock()
+        broker_client = BrokerClient(self.path, 'foobar', create_client)
+        broker_client.add_txt_records(_records('example.com'))
+        broker_client.get_nameservers('example.com')
+
+        # a socket left behind by a broker that was killed
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+            stale.bind(self.path)
+        broker_client = BrokerClient(self.path, 'foobar', create_client)
+        broker_client.del_txt_records(_records('example.com'))
+
+        self.assertEqual(create_client.call_count, 2)
+        self.assertEqual(create_client.return_value.mock_calls, [
+            mock.call.add_txt_records(_records('example.com')),
+            mock.call.get_nameservers('example.com'),
+            mock.call.del_txt_records(_records('example.com')),
+        ])
+
+    def test_main_without_socket(self):
+        path = os.path.join(self.tempdir, 'transip.ini')
+        dns_test_common.write({'dns_transip_username': 'foobar', 'dns_transip_key_file': 'key'}, path)
+        self.assertEqual(main(['--credentials', path]), 2)
+
+
+class TestAuthenticatorBroker(TestCase):
+    def setUp(self):
+        self.stub = MockTransipServer(DOMAINS)
+        self.addCleanup(self.stub.close)
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+
+    def _authenticator(self, socket_path, propagation_mode):
+        path = os.path.join(self.tempdir, 'transip.ini')
+        dns_test_common.write({'transip_username': 'foobar', 'transip_key_file': 'key',
+                               'transip_broker_socket': socket_path}, path)
+        config = mock.MagicMock(transip_credentials=path, transip_propagation_seconds=0,
+                                transip_propagation_mode=propagation_mode, transip_poll_interval=1)
+        return Authenticator(config, 'transip')
+
+    def _start_broker(self, socket_path):
+        transip_client = _TransipClient(username='foobar', key_file='key', global_key=False)
+        client = transip.TransIP(login='foobar', access_token=TOKEN)
+        client._url = self.stub.url  # pylint: disable=protected-access
+        transip_client.client = client
+        broker = Broker(transip_client, socket_path, window=0)
+        broker.start()
+        self.addCleanup(broker.close)
+        thread = threading.Thread(target=broker.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(broker.shutdown)
+
+    def test_perform_and_cleanup(self):
+        socket_path = os.path.join(self.tempdir, 'broker.sock')
+        authenticator = self._authenticator(socket_path, 'sleep')
+        achalls = [achallenges.KeyAuthorizationAnnotatedChallenge(
+            challb=acme_util.DNS01, identifier=messages.Identifier(typ=messages.IDENTIFIER_FQDN, value=name),
+            account_key=dns_test_common.KEY) for name in ('example.com', 'www.example.org')]
+        self._start_broker(socket_path)
+
+        with mock.patch('certbot_dns_transip.dns_transip.Authenticator._create_transip_client') as create_client, \
+                mock.patch('certbot_dns_transip.dns_transip.display_util.notify'):
+            authenticator.perform(achalls)
+            self.assertEqual(len(self.stub.zones['example.com']), 1)
+            self.assertEqual(len(self.stub.zones['example.org']), 1)
+            authenticator.cleanup(achalls)
+        self.assertEqual(self.stub.zones, dict.fromkeys(DOMAINS, []))
+        create_client.assert_not_called()
+
+    def test_poll_mode(self):
+        socket_path = os.path.join(self.tempdir, 'broker.sock')
+        authenticator = self._authenticator(socket_path, 'poll')
+        achalls = [achallenges.KeyAuthorizationAnnotatedChallenge(
+            challb=acme_util.DNS01, identifier=messages.Identifier(typ=messages.IDENTIFIER_FQDN, value='example.com'),
+            account_key=dns_test_common.KEY)]
+        self._start_broker(socket_path)
+
+        with mock.patch('certbot_dns_transip.dns_transip.Authenticator._create_transip_client') as create_client, \
+                mock.patch('certbot_dns_transip.dns_transip.propagation.wait_for_txt_records', return_value=True), \
+                mock.patch('certbot_dns_transip.dns_transip.display_util.notify'):
+            create_client.return_value.get_nameservers.return_value = ['ns0.transip.net']
+            authenticator.perform(achalls)
+            self.assertEqual(len(self.stub.zones['example.com']), 1)
+            authenticator.cleanup(achalls)
+
+        # the nameservers are asked directly, the records are still removed by the broker
+        self.assertEqual(self.stub.zones['example.com'], [])
+        self.assertEqual(create_client.return_value.mock_calls, [mock.call.get_nameservers('example.com')])
@@ -0,0 +1,216 @@
+from unittest import TestCase
+
+import datetime
+import os
+import shutil
+import tempfile
+
+import mock
+from acme import messages
+from certbot import errors
+from certbot.plugins import dns_test_common
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509.oid import NameOID
+
+from certbot_dns_transip.bulk import (BulkValidator, Certificate, _plugin_config, default_account, load_account, main,
+                                      read_lineage)
+from certbot_dns_transip.dns_transip import Authenticator
+from certbot_dns_transip.mock_server import MockTransipServer
+from tests.mock_acme import MockACMEClient
+
+SERVER = 'https://acme.invalid/directory'
+
+
+def _certificate(name, *domains):
+    return Certificate(name=name, domains=list(domains), server=SERVER, account=None, credentials=None,
+                       lineage=False)
+
+
+def _write_lineage(config_dir, name, domains, days, authenticator='dns-transip', renew_before=None):
+    key = ec.generate_private_key(ec.SECP256R1())
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, domains[0])])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    builder = x509.CertificateBuilder().subject_name(subject).issuer_name(subject).public_key(key.public_key())
+    builder = builder.serial_number(x509.random_serial_number()).not_valid_before(now).not_valid_after(
+        now + datetime.timedelta(days=days))
+    cert = builder.add_extension(x509.SubjectAlternativeName([x509.DNSName(domain) for domain in domains]),
+                                 critical=False).sign(key, hashes.SHA256())
+    os.makedirs(os.path.join(config_dir, 'live', name), exist_ok=True)
+    os.makedirs(os.path.join(config_dir, 'renewal'), exist_ok=True)
+    cert_path = os.path.join(config_dir, 'live', name, 'cert.pem')
+    with open(cert_path, 'wb') as handle:
+        handle.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(os.path.join(config_dir, 'renewal', name + '.conf'), 'w') as handle:
+        if renew_before is not None:
+            handle.write('renew_before_expiry = {0}\n'.format(renew_before))
+        handle.write('cert = {0}\n\n[renewalparams]\naccount = 0123abcd\nserver = {1}\nauthenticator = {2}\n'
+                     'dns_transip_credentials = /etc/letsencrypt/transip.ini\n'.format(cert_path, SERVER,
+                                                                                        authenticator))
+
+
+def _write_account(config_dir, account='0123abcd'):
+    account_dir = os.path.join(config_dir, 'accounts', 'acme.invalid', 'directory', account)
+    os.makedirs(account_dir)
+    with open(os.path.join(account_dir, 'private_key.json'), 'w') as handle:
+        handle.write(dns_test_common.KEY.json_dumps())
+    with open(os.path.join(account_dir, 'regr.json'), 'w') as handle:
+        handle.write(messages.RegistrationResource(body=messages.Registration(),
+                                                   uri='https://acme.invalid/account/1').json_dumps())
+
+
+class TestBulkValidator(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.mkdtemp()
+        cls.key_file = os.path.join(cls.tempdir, 'transip.key')
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        with open(cls.key_file, 'wb') as handle:
+            handle.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                           serialization.NoEncryption()))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tempdir)
+
+    def setUp(self):
+        self.stub = MockTransipServer(['example.com', 'example.org'])
+        self.addCleanup(self.stub.close)
+        self.acme = MockACMEClient(self.stub, dns_test_common.KEY)
+        self.credentials = os.path.join(self.tempdir, 'transip.ini')
+        dns_test_common.write({'dns_transip_username': 'foobar', 'dns_transip_key_file': self.key_file,
+                               'dns_transip_api_url': self.stub.url}, self.credentials)
+        patcher = mock.patch('certbot_dns_transip.dns_transip.display_util.notify')
+        self.notify = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _validator(self, authenticator=None):
+        if authenticator is None:
+            authenticator = Authenticator(_plugin_config(self.credentials, propagation_seconds=0), 'dns-transip')
+        return BulkValidator(self.acme, dns_test_common.KEY, authenticator)
+
+    def test_validate(self):
+        certificates = [_certificate('example.com', 'example.com', 'www.example.com'),
+                        _certificate('www.example.com', 'www.example.com', '*.example.org'),
+                        _certificate('example.org', 'example.org', 'mail.example.org')]
+        results = self._validator().validate(certificates)
+
+        self.assertEqual(results, dict.fromkeys(['example.com', 'www.example.com', 'example.org']))
+        # every name is validated once, with a single wait for all certificates
+        self.assertEqual(len(self.acme.answered), 5)
+        self.assertEqual(self.notify.call_count, 1)
+        self.assertEqual(self.stub.zones, {'example.com': [], 'example.org': []})
+
+        # the valid authorizations are reused
+        authenticator = mock.MagicMock()
+        self.assertEqual(self._validator(authenticator).validate(certificates[:1]), {'example.com': None})
+        authenticator.perform.assert_not_called()
+
+    def test_validate_without_display(self):
+        # certbot hasn't set up its display, so the wait is logged instead
+        self.notify.side_effect = ValueError('display not set')
+        with self.assertLogs('certbot_dns_transip.dns_transip', 'INFO') as logs:
+            results = self._validator().validate([_certificate('example.com', 'example.com')])
+
+        self.assertEqual(results, {'example.com': None})
+        self.assertIn('Waiting 0 seconds for DNS changes to propagate', logs.output[-1])
+
+    def test_failed_validation(self):
+        authenticator = mock.MagicMock()
+
+        def perform(achalls):
+            # the record of www.example.org is missing
+            for achall in achalls:
+                label = achall.validation_domain_name(achall.identifier.value).rsplit('.', 2)[0]
+                zone = '.'.join(achall.identifier.value.rsplit('.', 2)[-2:])
+                if achall.identifier.value != 'www.example.org':
+                    self.stub.zones[zone].append({'name': label, 'type': 'TXT', 'expire': 60,
+                                                  'content': achall.validation(achall.account_key)})
+            return [achall.response(achall.account_key) for achall in achalls]
+
+        authenticator.perform.side_effect = perform
+        results = self._validator(authenticator).validate([
+            _certificate('example.com', 'example.com', 'www.example.com'),
+            _certificate('example.org', 'example.org', 'www.example.org')])
+
+        self.assertIsNone(results['example.com'])
+        self.assertIn('www.example.org: urn:ietf:params:acme:error:unauthorized', results['example.org'])
+        self.assertEqual(len(authenticator.cleanup.call_args[0][0]), 4)
+
+    def test_perform_failed(self):
+        authenticator = mock.MagicMock()
+        authenticator.perform.side_effect = errors.PluginError('Unable to add')
+        self.assertRaises(errors.PluginError, self._validator(authenticator).validate,
+                          [_certificate('example.com', 'example.com')])
+        authenticator.cleanup.assert_called_once_with(mock.ANY)
+
+
+class TestMain(TestCase):
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config_dir)
+
+    def test_read_lineage(self):
+        _write_lineage(self.config_dir, 'example.com', ['example.com', 'www.example.com'], 40)
+        certificate, due = read_lineage(self.config_dir, 'example.com')
+        self.assertEqual(certificate, Certificate(name='example.com', domains=['example.com', 'www.example.com'],
+                                                  server=SERVER, account='0123abcd',
+                                                  credentials='/etc/letsencrypt/transip.ini', lineage=True))
+        # 30 days before it expires, by default
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.assertGreater(due, now + datetime.timedelta(days=9))
+        self.assertLess(due, now + datetime.timedelta(days=11))
+
+        _write_lineage(self.config_dir, 'example.com', ['example.com'], 40, renew_before='6 weeks')
+        self.assertLess(read_lineage(self.config_dir, 'example.com')[1], now)
+        _write_lineage(self.config_dir, 'example.com', ['example.com'], 40, renew_before='soon')
+        self.assertRaises(errors.Error, read_lineage, self.config_dir, 'example.com')
+
+        _write_lineage(self.config_dir, 'other.example', ['other.example'], 10, authenticator='manual')
+        self.assertRaises(errors.Error, read_lineage, self.config_dir, 'other.example')
+        self.assertRaises(errors.Error, read_lineage, self.config_dir, 'missing.example')
+
+    def test_load_account(self):
+        self.assertRaises(errors.Error, default_account, self.config_dir, SERVER)
+        self.assertRaises(errors.Error, load_account, self.config_dir, SERVER, '0123abcd')
+        _write_account(self.config_dir)
+        self.assertEqual(default_account(self.config_dir, SERVER), '0123abcd')
+        key, regr = load_account(self.config_dir, SERVER, '0123abcd')
+        self.assertEqual(key, dns_test_common.KEY)
+        self.assertEqual(regr.uri, 'https://acme.invalid/account/1')
+
+        _write_account(self.config_dir, 'fedc3210')
+        self.assertRaises(errors.Error, default_account, self.config_dir, SERVER)
+
+    @mock.patch('certbot_dns_transip.bulk.subprocess.run')
+    @mock.patch('certbot_dns_transip.bulk.BulkValidator')
+    @mock.patch('certbot_dns_transip.bulk._acme_client')
+    def test_main(self, acme_client, validator, run):
+        _write_account(self.config_dir)
+        _write_lineage(self.config_dir, 'example.com', ['example.com', 'www.example.com'], 10)
+        _write_lineage(self.config_dir, 'example.org', ['example.org'], 80)
+        _write_lineage(self.config_dir, 'example.net', ['example.net'], 10)
+        validator.return_value.validate.side_effect = lambda certificates: dict(
+            (certificate.name, 'Invalid' if certificate.name == 'example.net' else None)
+            for certificate in certificates)
+        run.return_value.returncode = 0
+
+        self.assertEqual(main(['--config-dir', self.config_dir, '--cert-name', 'example.com', '--cert-name',
+                               'example.org', '--cert-name', 'example.net', '--credentials', '/etc/transip.ini',
+                               '--domains', 'shop.example.com, www.shop.example.com', '--server', SERVER,
+                               '--', '--quiet']), 1)
+
+        # a single validation for the certificates of the same account, skipping the one that isn't due
+        validator.return_value.validate.assert_called_once_with(mock.ANY)
+        self.assertEqual([certificate.name for certificate in validator.return_value.validate.call_args[0][0]],
+                         ['example.com', 'example.net', 'shop.example.com'])
+        acme_client.assert_called_once_with(SERVER, dns_test_common.KEY, mock.ANY)
+        self.assertEqual([call[0][0] for call in run.call_args_list], [
+            ['certbot', '--non-interactive', '--config-dir', self.config_dir, 'renew', '--cert-name', 'example.com',
+             '--quiet'],
+            ['certbot', '--non-interactive', '--config-dir', self.config_dir, 'certonly', '--cert-name',
+             'shop.example.com', '--authenticator', 'dns-transip', '--dns-transip-credentials', '/etc/transip.ini',
+             '--server', SERVER, '--account', '0123abcd', '-d', 'shop.example.com', '-d', 'www.shop.example.com',
+             '--quiet'],
+        ])
@@ -0,0 +1,90 @@
+from unittest import TestCase
+
+import os
+import stat
+import shutil
+import tempfile
+
+from certbot_dns_transip.cache import DomainCache, TokenCache, locked_json_file
+
+
+class TestLockedJsonFile(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'cache.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_created_private(self):
+        with locked_json_file(self.path) as data:
+            data['foo'] = 'bar'
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+
+    def test_permissions_restricted(self):
+        with open(self.path, 'w') as cache_file:
+            cache_file.write('{}')
+        os.chmod(self.path, 0o644)
+        with locked_json_file(self.path):
+            pass
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+
+    def test_roundtrip(self):
+        with locked_json_file(self.path) as data:
+            data['foo'] = 'bar'
+        with locked_json_file(self.path) as data:
+            self.assertEqual(data, {'foo': 'bar'})
+
+    def test_corrupt_content_ignored(self):
+        with open(self.path, 'w') as cache_file:
+            cache_file.write('{not json')
+        with locked_json_file(self.path) as data:
+            self.assertEqual(data, {})
+
+
+class TestTokenCache(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = TokenCache(os.path.join(self.tempdir, 'tokens.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_keyed_by_user_and_key_type(self):
+        with self.cache.entry('foo', False) as entry:
+            entry.update(token='whitelisted', expires=1)
+        with self.cache.entry('foo', True) as entry:
+            self.assertEqual(entry, {})
+            entry.update(token='global', expires=1)
+        with self.cache.entry('bar', False) as entry:
+            self.assertEqual(entry, {})
+        with self.cache.entry('foo', False) as entry:
+            self.assertEqual(entry, {'token': 'whitelisted', 'expires': 1})
+
+    def test_cleared_entry_removed(self):
+        with self.cache.entry('foo', False) as entry:
+            entry.update(token='token', expires=1)
+        with self.cache.entry('foo', False) as entry:
+            entry.clear()
+        with locked_json_file(self.cache.path) as data:
+            self.assertEqual(data, {})
+
+
+class TestDomainCache(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = DomainCache(os.path.join(self.tempdir, 'domains.json'), ttl=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_store_and_get(self):
+        self.assertIsNone(self.cache.get('foo'))
+        self.cache.store('foo', ['example.com'])
+        self.assertEqual(self.cache.get('foo'), ['example.com'])
+        self.assertIsNone(self.cache.get('bar'))
+
+    def test_expired(self):
+        self.cache.store('foo', ['example.com'])
+        self.cache.ttl = 0
+        self.assertIsNone(self.cache.get('foo'))
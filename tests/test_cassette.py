@@ -0,0 +1,143 @@
+from unittest import TestCase
+
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+import transip
+from certbot.errors import PluginError
+
+from certbot_dns_transip.aio import _AsyncTransipClient
+from certbot_dns_transip.cassette import REDACTED, Cassette
+from certbot_dns_transip.client import _TransipClient
+from certbot_dns_transip.mock_server import MockTransipServer, TOKEN
+from certbot_dns_transip.rest import TransipAPI, _RestTransipClient
+
+DOMAINS = ['example.com', 'example.org']
+RECORDS = [('example.com', '_acme-challenge.example.com', 'content'),
+           ('www.example.com', '_acme-challenge.www.example.com', 'content'),
+           ('example.org', '_acme-challenge.example.org', 'content')]
+
+
+class TestCassette(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+
+    def test_redacted(self):
+        path = os.path.join(self.tempdir, 'transip.cassette')
+        cassette = Cassette(path, 'record')
+        content = json.dumps({'domains': [{'name': 'example.com', 'authCode': 'secret'}], 'token': 'secret'})
+        cassette.record('GET', '/v6/domains', 200, {'Authorization': 'secret', 'Retry-After': '1'}, content.encode(),
+                        0.25)
+        cassette.close()
+
+        with open(path) as handle:
+            recorded = handle.read()
+        self.assertNotIn('secret', recorded)
+        status, headers, content = Cassette(path, 'replay').replay('GET', '/v6/domains')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers, {'retry-after': '1'})
+        self.assertEqual(json.loads(content.decode()),
+                         {'domains': [{'name': 'example.com', 'authCode': REDACTED}], 'token': REDACTED})
+
+    def test_replay_order(self):
+        path = os.path.join(self.tempdir, 'transip.cassette.gz')
+        cassette = Cassette(path, 'record')
+        for index in range(2):
+            cassette.record('GET', '/v6/domains/example.com/dns', 200, {}, json.dumps({'index': index}).encode(), 0)
+        cassette.close()
+
+        cassette = Cassette(path, 'replay')
+        contents = [cassette.replay('GET', '/v6/domains/example.com/dns')[2] for _ in range(3)]
+        self.assertEqual(contents, [b'{"index": 0}', b'{"index": 1}', b'{"index": 1}'])
+        self.assertEqual(cassette.replay('GET', '/v6/domains/example.org/dns')[0], 404)
+
+    def test_mode(self):
+        self.assertRaises(ValueError, Cassette, os.path.join(self.tempdir, 'transip.cassette'), 'play')
+
+
+class Test_TransipClientCassette(TestCase):
+    client_class = _TransipClient
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.path = os.path.join(self.tempdir, 'transip.cassette')
+
+    def _client(self, cassette, url=None):
+        transip_client = self.client_class(username='foobar', key_file='key', global_key=False, cassette=cassette)
+        if url:
+            client = transip.TransIP(login='foobar', access_token=TOKEN)
+            client._url = url  # pylint: disable=protected-access
+            transip_client.client = client
+            transip_client.api_url = url
+        return transip_client
+
+    def _record(self, **server_options):
+        stub = MockTransipServer(DOMAINS, **server_options)
+        cassette = Cassette(self.path, 'record')
+        try:
+            transip_client = self._client(cassette, stub.url)
+            transip_client.add_txt_records(RECORDS)
+            self.assertEqual(transip_client.del_txt_records(RECORDS), dict.fromkeys(RECORDS))
+        finally:
+            cassette.close()
+            stub.close()
+        return stub
+
+    def test_replay(self):
+        stub = self._record(account_size=2500)
+        with open(self.path) as handle:
+            self.assertEqual(len(handle.readlines()), len(stub.requests))
+
+        # the server is gone, all responses come from the cassette
+        transip_client = self._client(Cassette(self.path, 'replay', timing=0))
+        transip_client.add_txt_records(RECORDS)
+        self.assertEqual(transip_client.del_txt_records(RECORDS), dict.fromkeys(RECORDS))
+        self.assertEqual(len(transip_client._get_domains()), 2500)  # pylint: disable=protected-access
+
+    def test_timing(self):
+        self._record()
+        # every response took 0.05 seconds
+        with open(self.path) as handle:
+            interactions = [json.loads(line) for line in handle]
+        with open(self.path, 'w') as handle:
+            for interaction in interactions:
+                interaction['elapsed'] = 0.05
+                handle.write(json.dumps(interaction) + '\n')
+
+        def replay(timing):
+            transip_client = self._client(Cassette(self.path, 'replay', timing=timing))
+            with mock.patch('certbot_dns_transip.cassette.time.sleep') as sleep, \
+                    mock.patch('certbot_dns_transip.cassette.asyncio.sleep', new_callable=mock.AsyncMock) as async_sleep:
+                transip_client.add_txt_records(RECORDS)
+            return [call[0][0] for call in sleep.call_args_list + async_sleep.call_args_list]
+
+        self.assertEqual(replay(0), [])
+        delays = replay(2)
+        # at least listing the domains and adding the records of both domains
+        self.assertGreaterEqual(len(delays), 3)
+        self.assertEqual(delays, [0.1] * len(delays))
+
+    def test_unknown_domain(self):
+        self._record()
+        transip_client = self._client(Cassette(self.path, 'replay', timing=0))
+        self.assertRaises(PluginError, transip_client.add_txt_records, [('example.net', '_acme-challenge', 'content')])
+
+
+class Test_AsyncTransipClientCassette(Test_TransipClientCassette):
+    client_class = _AsyncTransipClient
+
+
+class Test_RestTransipClientCassette(Test_TransipClientCassette):
+    client_class = _RestTransipClient
+
+    def _client(self, cassette, url=None):
+        transip_client = self.client_class(username='foobar', key_file='key', global_key=False, cassette=cassette,
+                                           api_url=url)
+        if url:
+            transip_client.client = TransipAPI(url, transip_client.transport, access_token=TOKEN)
+        return transip_client
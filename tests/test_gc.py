@@ -0,0 +1,160 @@
+from unittest import TestCase
+
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+
+import transip
+from certbot.plugins import dns_test_common
+
+from certbot_dns_transip.cache import ChallengeRegistry
+from certbot_dns_transip.client import _TransipClient
+from certbot_dns_transip.gc import GarbageCollector, main
+from certbot_dns_transip.mock_server import MockTransipServer, TOKEN
+
+DOMAINS = ['example.com', 'example.org', 'example.net']
+
+
+def _entry(name, content, record_type='TXT'):
+    return {'name': name, 'expire': 60, 'type': record_type, 'content': content}
+
+
+class TestGarbageCollector(TestCase):
+    def setUp(self):
+        self.stub = MockTransipServer(DOMAINS)
+        self.addCleanup(self.stub.close)
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.registry = ChallengeRegistry(os.path.join(self.tempdir, 'challenges.json'))
+        self.stub.zones['example.com'].extend([
+            _entry('@', '10.0.0.1', 'A'), _entry('_acme-challenge', 'apex'), _entry('_acme-challenge.www', 'www')])
+        self.stub.zones['example.org'].append(_entry('_acme-challenge', 'org'))
+        self.stub.zones['example.net'].append(_entry('www', 'not a challenge'))
+
+    def _transip_client(self):
+        transip_client = _TransipClient(username='foobar', key_file='key', global_key=False)
+        client = transip.TransIP(login='foobar', access_token=TOKEN)
+        client._url = self.stub.url  # pylint: disable=protected-access
+        transip_client.client = client
+        return transip_client
+
+    def _collect(self, **kwargs):
+        collector = GarbageCollector(self._transip_client(), self.registry, **kwargs)
+        self.stub.reset_counters()
+        failures = collector.run()
+        output = io.StringIO()
+        collector.report(failures, output)
+        return failures, output.getvalue()
+
+    def _names(self, zone):
+        return sorted(entry['name'] for entry in self.stub.zones[zone])
+
+    def test_first_seen_are_kept(self):
+        failures, output = self._collect()
+
+        self.assertEqual(failures, {})
+        self.assertEqual(self._names('example.com'), ['@', '_acme-challenge', '_acme-challenge.www'])
+        self.assertEqual(sorted(self.registry.get('foobar')), ['_acme-challenge.example.com apex',
+                                                              '_acme-challenge.example.org org',
+                                                              '_acme-challenge.www.example.com www'])
+        self.assertIn('Removed 0 of 3 challenge records in 3 domains', output)
+        self.assertFalse([request for request in self.stub.requests if request[0] != 'GET'])
+
+    def test_old_records_removed(self):
+        self.registry.add('foobar', ['_acme-challenge.example.com apex', '_acme-challenge.www.example.com www',
+                                     '_acme-challenge.example.org org', '_acme-challenge.example.org gone'])
+        failures, output = self._collect(max_age=0)
+
+        self.assertEqual(failures, {})
+        self.assertEqual(self._names('example.com'), ['@'])
+        self.assertEqual(self._names('example.org'), [])
+        self.assertEqual(self._names('example.net'), ['www'])
+        # a delete of every stale record, without reading the domains again
+        self.assertEqual(sorted(request for request in self.stub.requests if request[0] != 'GET'),
+                         [('DELETE', '/v6/domains/example.com/dns')] * 2 + [('DELETE', '/v6/domains/example.org/dns')])
+        self.assertEqual(self.registry.get('foobar'), {})
+        self.assertIn('Removed _acme-challenge.www.example.com TXT www from example.com: seen', output)
+        self.assertIn('Removed 3 of 3 challenge records in 3 domains', output)
+
+    def test_dry_run(self):
+        failures, output = self._collect(unowned=True, dry_run=True)
+
+        self.assertEqual(failures, {})
+        self.assertEqual(self._names('example.com'), ['@', '_acme-challenge', '_acme-challenge.www'])
+        self.assertFalse([request for request in self.stub.requests if request[0] != 'GET'])
+        self.assertIn('Would remove _acme-challenge.example.org TXT org from example.org: not owned by any run',
+                      output)
+        self.assertIn('Would remove 3 of 3 challenge records in 3 domains', output)
+
+    def test_owned_records(self):
+        hostname = socket.gethostname()
+        ended = os.fork()
+        if not ended:
+            os._exit(0)  # pylint: disable=protected-access
+        os.waitpid(ended, 0)
+        self.registry.add('foobar', ['_acme-challenge.example.com apex'], {'host': hostname, 'pid': os.getpid()})
+        self.registry.add('foobar', ['_acme-challenge.www.example.com www'], {'host': hostname, 'pid': ended})
+        self.registry.add('foobar', ['_acme-challenge.example.org org'], {'host': 'other-host', 'pid': ended})
+
+        failures, output = self._collect(unowned=True)
+
+        self.assertEqual(failures, {})
+        self.assertEqual(self._names('example.com'), ['@', '_acme-challenge'])
+        self.assertEqual(self._names('example.org'), ['_acme-challenge'])
+        self.assertIn('run {0} has ended'.format(ended), output)
+        self.assertEqual(sorted(self.registry.get('foobar')), ['_acme-challenge.example.com apex',
+                                                              '_acme-challenge.example.org org'])
+
+    def test_failed_domain(self):
+        self.registry.add('foobar', ['_acme-challenge.example.com apex', '_acme-challenge.example.org org'])
+        transip_client = self._transip_client()
+        transip_client.get_domain_names()
+        self.stub.zones.pop('example.org')
+        collector = GarbageCollector(transip_client, self.registry, max_age=0)
+
+        failures = collector.run()
+        output = io.StringIO()
+        collector.report(failures, output)
+
+        self.assertEqual(list(failures), ['example.org'])
+        self.assertIn('Failed to clean up example.org: ', output.getvalue())
+        self.assertEqual(list(self.registry.get('foobar')), ['_acme-challenge.example.org org'])
+
+    def _credentials(self):
+        path = os.path.join(self.tempdir, 'transip.ini')
+        token_cache = os.path.join(self.tempdir, 'tokens.json')
+        with open(token_cache, 'w') as handle:
+            json.dump({'foobar/whitelisted': {'token': TOKEN, 'expires': time.time() + 3600}}, handle)
+        dns_test_common.write({'dns_transip_username': 'foobar', 'dns_transip_key_file': 'key',
+                               'dns_transip_token_cache': token_cache, 'dns_transip_api_url': self.stub.url,
+                               'dns_transip_challenge_registry': self.registry.path}, path)
+        return path
+
+    def test_main(self):
+        self.assertEqual(main(['--credentials', self._credentials(), '--unowned', '--domain', 'example.org']), 0)
+        self.assertEqual(self._names('example.org'), [])
+        self.assertEqual(self._names('example.com'), ['@', '_acme-challenge', '_acme-challenge.www'])
+
+    def test_main_backends(self):
+        for backend in ('rest', 'asyncio'):
+            self.registry.remove('foobar', list(self.registry.get('foobar')))
+            self.stub.zones['example.com'].append(_entry('_acme-challenge', backend))
+            self.stub.reset_counters()
+
+            self.assertEqual(main(['--credentials', self._credentials(), '--unowned', '--backend', backend]), 0)
+            self.assertEqual(self._names('example.com'), ['@'])
+            self.assertEqual(self._names('example.org'), [])
+            # one delete per stale record, after a single read of every domain
+            self.assertEqual(sorted(request for request in self.stub.requests if request[1].endswith('/dns')),
+                             [('DELETE', '/v6/domains/example.com/dns')] * (3 if backend == 'rest' else 1) +
+                             [('DELETE', '/v6/domains/example.org/dns')] * (1 if backend == 'rest' else 0) +
+                             [('GET', '/v6/domains/{0}/dns'.format(domain)) for domain in sorted(DOMAINS)])
+
+    def test_main_without_registry(self):
+        path = os.path.join(self.tempdir, 'transip.ini')
+        dns_test_common.write({'dns_transip_username': 'foobar', 'dns_transip_key_file': 'key'}, path)
+        self.assertEqual(main(['--credentials', path]), 2)
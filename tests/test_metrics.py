@@ -0,0 +1,182 @@
+from unittest import TestCase
+
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+import transip
+from certbot.plugins import dns_test_common
+
+from certbot_dns_transip.aio import _AsyncTransipClient
+from certbot_dns_transip.client import _TransipClient
+from certbot_dns_transip.dns_transip import Authenticator
+from certbot_dns_transip.exceptions import TransipHTTPError
+from certbot_dns_transip.metrics import Metrics
+from certbot_dns_transip.mock_server import MockTransipServer, TOKEN
+from certbot_dns_transip.rest import TransipAPI, _RestTransipClient
+from certbot_dns_transip.retry import RetryPolicy
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.metrics = Metrics()
+        self.metrics.observe('DomainService.list', 0.07)
+        self.metrics.observe('DomainService.list', 0.3, '503')
+        self.metrics.count_retry('DomainService.list')
+        self.metrics.observe('propagation', 240.0)
+
+    def test_as_dict(self):
+        operation = self.metrics.as_dict()['operations']['DomainService.list']
+        self.assertEqual(operation['count'], 2)
+        self.assertAlmostEqual(operation['seconds'], 0.37)
+        self.assertEqual(operation['max'], 0.3)
+        self.assertEqual(operation['errors'], {'503': 1})
+        self.assertEqual(operation['retries'], 1)
+        self.assertEqual(operation['buckets']['0.05'], 0)
+        self.assertEqual(operation['buckets']['0.1'], 1)
+        self.assertEqual(operation['buckets']['0.5'], 2)
+        self.assertEqual(operation['buckets']['300.0'], 2)
+
+    def test_timer(self):
+        with self.metrics.timer('DnsEntryService.create'):
+            pass
+        with self.assertRaises(TransipHTTPError):
+            with self.metrics.timer('DnsEntryService.create'):
+                raise TransipHTTPError('Too many requests', 429)
+        with self.assertRaises(ValueError):
+            with self.metrics.timer('DnsEntryService.create'):
+                raise ValueError()
+        operation = self.metrics.as_dict()['operations']['DnsEntryService.create']
+        self.assertEqual(operation['count'], 3)
+        self.assertEqual(operation['errors'], {'429': 1, 'ValueError': 1})
+
+    def test_summary(self):
+        self.assertEqual(self.metrics.summary(), '3 operations in 240.37 seconds '
+                                                 '(propagation 1x 240.00s, DomainService.list 2x 0.37s), '
+                                                 '1 retries, 1 errors')
+
+    def test_prometheus(self):
+        lines = self.metrics.prometheus().splitlines()
+        self.assertIn('# TYPE certbot_dns_transip_operation_duration_seconds histogram', lines)
+        self.assertIn('certbot_dns_transip_operation_duration_seconds_bucket{operation="DomainService.list",le="0.1"} 1',
+                      lines)
+        self.assertIn('certbot_dns_transip_operation_duration_seconds_bucket'
+                      '{operation="DomainService.list",le="+Inf"} 2', lines)
+        self.assertIn('certbot_dns_transip_operation_duration_seconds_count{operation="propagation"} 1', lines)
+        self.assertIn('certbot_dns_transip_operation_errors_total{operation="DomainService.list",error="503"} 1', lines)
+        self.assertIn('certbot_dns_transip_operation_retries_total{operation="DomainService.list"} 1', lines)
+
+    def test_write(self):
+        path = os.path.join(self.tempdir, 'transip.json')
+        self.metrics.write(path)
+        with open(path) as handle:
+            self.assertEqual(json.load(handle)['operations']['propagation']['count'], 1)
+
+        path = os.path.join(self.tempdir, 'transip.prom')
+        self.metrics.write(path)
+        with open(path) as handle:
+            self.assertEqual(handle.read(), self.metrics.prometheus())
+        self.assertEqual(sorted(os.listdir(self.tempdir)), ['transip.json', 'transip.prom'])
+
+
+class TestClientMetrics(TestCase):
+    def setUp(self):
+        self.stub = MockTransipServer(['example.com', 'example.org'])
+        self.addCleanup(self.stub.close)
+        self.metrics = Metrics()
+        self.records = [('example.com', '_acme-challenge.example.com', 'content'),
+                        ('example.org', '_acme-challenge.example.org', 'content')]
+
+    def _client(self, client_class):
+        transip_client = client_class(username='foobar', key_file='key', global_key=False, metrics=self.metrics,
+                                      retry_policy=RetryPolicy(backoff=0, metrics=self.metrics))
+        client = transip.TransIP(login='foobar', access_token=TOKEN)
+        client._url = self.stub.url  # pylint: disable=protected-access
+        transip_client.client = client
+        transip_client.api_url = self.stub.url
+        return transip_client
+
+    def test_sync(self):
+        self.stub.failures = [(503, {})]
+        transip_client = self._client(_TransipClient)
+        transip_client.add_txt_records(self.records)
+        transip_client.del_txt_records(self.records)
+
+        operations = self.metrics.as_dict()['operations']
+        self.assertEqual(operations['DomainService.list']['count'], 2)
+        self.assertEqual(operations['DomainService.list']['errors'], {'503': 1})
+        self.assertEqual(operations['DomainService.list']['retries'], 1)
+        self.assertEqual(operations['DnsEntryService.create']['count'], 2)
+        self.assertEqual(operations['DnsEntryService.delete']['count'], 2)
+        self.assertEqual(sum(operation['count'] for operation in operations.values()), len(self.stub.requests))
+
+    def test_asyncio(self):
+        self.stub.failures = [(503, {})]
+        transip_client = self._client(_AsyncTransipClient)
+        transip_client.add_txt_records(self.records)
+        transip_client.del_txt_records(self.records)
+
+        operations = self.metrics.as_dict()['operations']
+        self.assertEqual(operations['GET /domains']['errors'], {'503': 1})
+        self.assertEqual(operations['GET /domains']['retries'], 1)
+        self.assertEqual(operations['POST /domains/{domain}/dns']['count'], 2)
+        self.assertEqual(operations['DELETE /domains/{domain}/dns']['count'], 2)
+        self.assertEqual(sum(operation['count'] for operation in operations.values()), len(self.stub.requests))
+
+    def test_rest(self):
+        self.stub.failures = [(503, {})]
+        transip_client = self._client(_RestTransipClient)
+        transip_client.client = TransipAPI(self.stub.url, transip_client.transport, access_token=TOKEN)
+        transip_client.add_txt_records(self.records)
+        transip_client.del_txt_records(self.records)
+
+        operations = self.metrics.as_dict()['operations']
+        self.assertEqual(operations['TransipAPI.domain_names']['errors'], {'503': 1})
+        self.assertEqual(operations['TransipAPI.domain_names']['retries'], 1)
+        self.assertEqual(operations['TransipAPI.add_dns_entry']['count'], 2)
+        self.assertEqual(operations['TransipAPI.delete_dns_entry']['count'], 2)
+        self.assertEqual(sum(operation['count'] for operation in operations.values()), len(self.stub.requests))
+
+
+class TestAuthenticatorMetrics(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.metrics_file = os.path.join(self.tempdir, 'transip.prom')
+        path = os.path.join(self.tempdir, 'transip.ini')
+        dns_test_common.write({'transip_username': 'foobar', 'transip_key_file': 'key',
+                               'transip_metrics_file': self.metrics_file}, path)
+        self.config = mock.MagicMock(transip_credentials=path, transip_propagation_seconds=0,
+                                     transip_propagation_mode='sleep', transip_metrics=False)
+        self.auth = Authenticator(self.config, 'transip')
+        self.achall = dns_test_common.BaseAuthenticatorTest.achall
+
+    def test_run_summary(self):
+        with mock.patch('certbot_dns_transip.client._TransipClient') as client_class, \
+                mock.patch('certbot_dns_transip.dns_transip.display_util.notify'):
+            client_class.return_value.del_txt_records.return_value = {}
+            self.auth.perform([self.achall])
+            with self.assertLogs('certbot_dns_transip.dns_transip', 'INFO') as logs:
+                self.auth.cleanup([self.achall])
+
+        metrics = client_class.call_args[1]['metrics']
+        self.assertIsInstance(metrics, Metrics)
+        self.assertEqual(metrics.as_dict()['operations']['propagation']['count'], 1)
+        self.assertIn('Transip API: 1 operations', logs.output[0])
+        with open(self.metrics_file) as handle:
+            self.assertIn('operation="propagation"', handle.read())
+
+    def test_disabled(self):
+        os.unlink(self.config.transip_credentials)
+        dns_test_common.write({'transip_username': 'foobar', 'transip_key_file': 'key'},
+                              self.config.transip_credentials)
+        with mock.patch('certbot_dns_transip.client._TransipClient') as client_class, \
+                mock.patch('certbot_dns_transip.dns_transip.display_util.notify'):
+            client_class.return_value.del_txt_records.return_value = {}
+            self.auth.perform([self.achall])
+            self.auth.cleanup([self.achall])
+        self.assertIsNone(client_class.call_args[1]['metrics'])
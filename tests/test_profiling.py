@@ -0,0 +1,144 @@
+from unittest import TestCase
+
+import os
+import pstats
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import mock
+from acme import messages
+from certbot import achallenges
+from certbot.plugins import dns_test_common
+from certbot.tests import acme_util
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from certbot_dns_transip.dns_transip import PROFILE_DIR_ENV, Authenticator
+from certbot_dns_transip.mock_server import MockTransipServer
+from certbot_dns_transip.profiling import Profiler
+
+
+def _busy(count):
+    return sum(range(count))
+
+
+def _functions(path):
+    return set(function for _, _, function in pstats.Stats(path).stats)
+
+
+class TestProfiler(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+
+    def test_threads_combined(self):
+        profiler = Profiler()
+
+        def run():
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                return list(executor.map(lambda count: profiler.call(_busy, count), range(8)))
+
+        self.assertEqual(profiler.call(run), [_busy(count) for count in range(8)])
+        self.assertEqual(profiler.call(profiler.call, _busy, 10), _busy(10))
+
+        path = profiler.write(os.path.join(self.tempdir, 'profiles'))
+        self.assertTrue(path.endswith('.prof'))
+        self.assertTrue({'run', '_busy'} <= _functions(path))
+        # the calls in the worker threads are profiled too
+        calls = [stat[1] for (_, _, function), stat in pstats.Stats(path).stats.items() if function == '_busy']
+        self.assertEqual(calls, [9])
+        self.assertIn('(run)', profiler.summary(5))
+
+    def test_other_profiler_active(self):
+        profiler = Profiler()
+        with mock.patch('cProfile.Profile.enable', side_effect=ValueError('Another profiling tool is already active')):
+            with self.assertLogs('certbot_dns_transip.profiling', 'WARNING'):
+                self.assertEqual(profiler.call(_busy, 10), _busy(10))
+        self.assertIsNone(profiler.stats())
+
+    def test_nothing_profiled(self):
+        profiler = Profiler()
+        self.assertIsNone(profiler.write(self.tempdir))
+        self.assertEqual(profiler.summary(5), '')
+        self.assertEqual(os.listdir(self.tempdir), [])
+
+
+class TestAuthenticatorProfiling(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.mkdtemp()
+        cls.key_file = os.path.join(cls.tempdir, 'transip.key')
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        with open(cls.key_file, 'wb') as handle:
+            handle.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                           serialization.NoEncryption()))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tempdir)
+
+    def setUp(self):
+        self.stub = MockTransipServer(['example.com', 'example.org', 'example.net', 'example.info'])
+        self.addCleanup(self.stub.close)
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        self.achalls = [achallenges.KeyAuthorizationAnnotatedChallenge(
+            challb=acme_util.DNS01, identifier=messages.Identifier(typ=messages.IDENTIFIER_FQDN, value=name),
+            account_key=dns_test_common.KEY) for name in ('example.com', 'www.example.org')]
+
+    def _run(self, max_workers=2, **credentials):
+        path = os.path.join(self.tempdir, 'transip.ini')
+        credentials.update(transip_username='foobar', transip_key_file=self.key_file, transip_api_url=self.stub.url)
+        dns_test_common.write(credentials, path)
+        config = mock.MagicMock(transip_credentials=path, transip_propagation_seconds=0,
+                                transip_propagation_mode='sleep', transip_max_workers=max_workers,
+                                transip_backend='transip',
+                                transip_pool_size=10, transip_connect_timeout=10.0, transip_read_timeout=60.0,
+                                transip_no_keep_alive=False, transip_max_retries=4, transip_retry_budget=300.0,
+                                transip_metrics=False)
+        authenticator = Authenticator(config, 'transip')
+        with mock.patch('certbot_dns_transip.dns_transip.display_util.notify'):
+            authenticator.perform(self.achalls)
+        authenticator.cleanup(self.achalls)
+
+    def test_profile_written(self):
+        with self.assertLogs('certbot_dns_transip.dns_transip', 'INFO') as logs:
+            self._run(transip_profile_dir=self.profile_dir, transip_profile_top=10)
+
+        profiles = os.listdir(self.profile_dir)
+        self.assertEqual(len(profiles), 1)
+        functions = _functions(os.path.join(self.profile_dir, profiles[0]))
+        # the login, the zone updates in the worker threads, and the removal of the records
+        self.assertTrue({'_add_records', 'load_private_key', '_add_zone_records', '_del_zone_records'} <= functions)
+        self.assertIn('the 10 functions that took the longest', logs.output[-1])
+        self.assertIn('filename:lineno(function)', logs.output[-1])
+
+    def test_several_workers(self):
+        self.achalls = [achallenges.KeyAuthorizationAnnotatedChallenge(
+            challb=acme_util.DNS01, identifier=messages.Identifier(typ=messages.IDENTIFIER_FQDN, value=name),
+            account_key=dns_test_common.KEY) for name in sorted(self.stub.zones)]
+        self._run(max_workers=4, transip_profile_dir=self.profile_dir)
+
+        profiles = os.listdir(self.profile_dir)
+        self.assertEqual(len(profiles), 1)
+        # the updates of all domains, made at the same time in the worker threads
+        self.assertIn('_add_zone_records', _functions(os.path.join(self.profile_dir, profiles[0])))
+
+    def test_nothing_profiled(self):
+        with mock.patch('cProfile.Profile.enable', side_effect=ValueError('Another profiling tool is already active')):
+            with self.assertLogs('certbot_dns_transip.dns_transip', 'WARNING') as logs:
+                self._run(transip_profile_dir=self.profile_dir)
+        self.assertIn('Nothing was profiled', logs.output[-1])
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+    def test_environment(self):
+        with mock.patch.dict(os.environ, {PROFILE_DIR_ENV: os.path.join(self.profile_dir, 'runs')}):
+            self._run()
+        self.assertEqual(len(os.listdir(os.path.join(self.profile_dir, 'runs'))), 1)
+
+    def test_disabled(self):
+        with mock.patch.dict(os.environ, clear=True), mock.patch('cProfile.Profile') as profile:
+            self._run()
+        profile.assert_not_called()
+        self.assertEqual(os.listdir(self.profile_dir), [])
@@ -0,0 +1,173 @@
+from unittest import TestCase
+
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import mock
+
+from certbot_dns_transip import propagation
+
+NAME = '_acme-challenge.example.com'
+
+
+class _StubNameserver:
+    """A local authoritative nameserver answering TXT queries from a dict, over UDP and TCP."""
+
+    def __init__(self):
+        self.records = {}
+        self.truncate = False
+        self.queries = 0
+        stub = self
+
+        class UDPHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                query, udp = self.request
+                stub.queries += 1
+                udp.sendto(stub.answer(query, truncate=stub.truncate), self.client_address)
+
+        class TCPHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                length = struct.unpack('!H', self.request.recv(2))[0]
+                answer = stub.answer(self.request.recv(length))
+                self.request.sendall(struct.pack('!H', len(answer)) + answer)
+
+        while True:  # find a port that is free for both UDP and TCP
+            self.udp = socketserver.ThreadingUDPServer(('127.0.0.1', 0), UDPHandler)
+            self.port = self.udp.server_address[1]
+            try:
+                self.tcp = socketserver.ThreadingTCPServer(('127.0.0.1', self.port), TCPHandler)
+                break
+            except OSError:
+                self.udp.server_close()
+        for server in (self.udp, self.tcp):
+            threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def answer(self, query, truncate=False):
+        query_id = struct.unpack('!H', query[:2])[0]
+        offset, labels = 12, []
+        while query[offset]:
+            labels.append(query[offset + 1:offset + 1 + query[offset]].decode())
+            offset += 1 + query[offset]
+        question = query[12:offset + 5]
+        values = [] if truncate else self.records.get('.'.join(labels), [])
+        flags = 0x8400 | (propagation.FLAG_TRUNCATED if truncate else 0)
+        message = struct.pack('!HHHHHH', query_id, flags, 1, len(values), 0, 0) + question
+        for value in values:
+            value = value.encode()
+            rdata = b''.join(struct.pack('!B', len(value[i:i + 255])) + value[i:i + 255]
+                             for i in range(0, len(value), 255))
+            message += struct.pack('!HHHIH', 0xc00c, propagation.TYPE_TXT, propagation.CLASS_IN, 60, len(rdata)) + rdata
+        return message
+
+    def close(self):
+        for server in (self.udp, self.tcp):
+            server.shutdown()
+            server.server_close()
+
+
+class TestQueryTxt(TestCase):
+    def setUp(self):
+        self.nameserver = _StubNameserver()
+        self.addCleanup(self.nameserver.close)
+
+    def test_values(self):
+        self.nameserver.records[NAME] = ['foo', 'bar' * 100]
+        self.assertEqual(propagation.query_txt(NAME, '127.0.0.1', self.nameserver.port), {'foo', 'bar' * 100})
+
+    def test_no_values(self):
+        self.assertEqual(propagation.query_txt(NAME, '127.0.0.1', self.nameserver.port), set())
+
+    def test_truncated_retried_over_tcp(self):
+        self.nameserver.records[NAME] = ['foo']
+        self.nameserver.truncate = True
+        self.assertEqual(propagation.query_txt(NAME, '127.0.0.1', self.nameserver.port), {'foo'})
+
+    def test_no_answer(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as silent:
+            silent.bind(('127.0.0.1', 0))
+            self.assertRaises(propagation.DNSQueryError, propagation.query_txt,
+                              NAME, '127.0.0.1', silent.getsockname()[1], timeout=0.1)
+
+    def test_malformed_answer(self):
+        self.assertRaises(propagation.DNSQueryError, propagation._decode_txt_answers, b'\x00\x01', 1)
+
+
+class TestWaitForTxtRecords(TestCase):
+    def setUp(self):
+        self.nameserver = _StubNameserver()
+        self.addCleanup(self.nameserver.close)
+        self.expected = {(NAME, ('127.0.0.1',)): {'foo', 'bar'}}
+
+    def _wait(self, timeout=1.0):
+        start = time.time()
+        result = propagation.wait_for_txt_records(self.expected, timeout, 0.05, port=self.nameserver.port)
+        return result, time.time() - start
+
+    def test_early_success(self):
+        self.nameserver.records[NAME] = ['foo', 'bar', 'other']
+        result, duration = self._wait()
+        self.assertTrue(result)
+        self.assertLess(duration, 0.5)
+        self.assertEqual(self.nameserver.queries, 1)
+
+    def test_timeout(self):
+        result, duration = self._wait(timeout=0.3)
+        self.assertFalse(result)
+        self.assertGreater(duration, 0.2)
+        self.assertLess(duration, 1)
+
+    def test_checked_at_deadline(self):
+        # visible before the timeout, but after the last full interval
+        timer = threading.Timer(0.1, self.nameserver.records.__setitem__, (NAME, ['foo', 'bar']))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        start = time.time()
+        self.assertTrue(propagation.wait_for_txt_records(self.expected, 0.3, 10, port=self.nameserver.port))
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(self.nameserver.queries, 2)
+
+    def test_partial_visibility(self):
+        self.nameserver.records[NAME] = ['foo']
+        self.assertFalse(self._wait(timeout=0.2)[0])
+
+        timer = threading.Timer(0.2, self.nameserver.records.__setitem__, (NAME, ['foo', 'bar']))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        result, duration = self._wait()
+        self.assertTrue(result)
+        self.assertGreater(duration, 0.15)
+
+    def test_visible_records_not_queried_again(self):
+        self.expected[('_acme-challenge.www.example.com', ('127.0.0.1',))] = {'baz'}
+        self.nameserver.records[NAME] = ['foo', 'bar']
+        timer = threading.Timer(0.2, self.nameserver.records.__setitem__, ('_acme-challenge.www.example.com', ['baz']))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        queries = []
+        with mock.patch('certbot_dns_transip.propagation.query_txt', wraps=propagation.query_txt) as query_txt:
+            self.assertTrue(self._wait()[0])
+            queries = [call[0][0] for call in query_txt.call_args_list]
+        self.assertEqual(queries.count(NAME), 1)
+        self.assertGreater(queries.count('_acme-challenge.www.example.com'), 1)
+
+    def test_visible_times(self):
+        self.expected[('_acme-challenge.www.example.com', ('127.0.0.1',))] = {'baz'}
+        self.nameserver.records[NAME] = ['foo', 'bar']
+        timer = threading.Timer(0.2, self.nameserver.records.__setitem__, ('_acme-challenge.www.example.com', ['baz']))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        start = time.time()
+        visible = {}
+        self.assertTrue(propagation.wait_for_txt_records(self.expected, 1.0, 0.05, port=self.nameserver.port,
+                                                         visible=visible))
+        self.assertLess(visible[(NAME, ('127.0.0.1',))] - start, 0.15)
+        self.assertGreater(visible[('_acme-challenge.www.example.com', ('127.0.0.1',))] - start, 0.15)
+
+    def test_unresolvable_nameservers(self):
+        with mock.patch('certbot_dns_transip.propagation.resolve_nameserver', return_value=[]):
+            result, duration = self._wait(timeout=0.2)
+        self.assertFalse(result)
+        self.assertGreater(duration, 0.15)
@@ -0,0 +1,89 @@
+from unittest import TestCase
+
+import asyncio
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import mock
+
+from certbot_dns_transip.dns_transip import _client_options
+from certbot_dns_transip.ratelimit import RateLimiter
+from tests.helpers import DomainMock, TransipClientTest
+
+PROCESSES = 4
+REQUESTS = 10
+REQUESTS_PER_MINUTE = 1200
+BURST = 2
+
+
+def _worker(path, queue):
+    rate_limiter = RateLimiter(path, 'foobar', REQUESTS_PER_MINUTE, burst=BURST)
+    for _ in range(REQUESTS):
+        rate_limiter.acquire()
+        queue.put(time.time())
+
+
+class TestRateLimiter(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.path = os.path.join(self.tempdir, 'ratelimit.json')
+
+    def test_burst(self):
+        rate_limiter = RateLimiter(self.path, 'foobar', 600, burst=3)
+        self.assertEqual([rate_limiter.acquire() for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(rate_limiter.acquire(), 0.1, delta=0.02)
+
+    def test_shared_by_username(self):
+        RateLimiter(self.path, 'foobar', 600, burst=1).acquire()
+        self.assertEqual(RateLimiter(self.path, 'other', 600, burst=1).acquire(), 0)
+        self.assertGreater(RateLimiter(self.path, 'foobar', 600, burst=1).acquire(), 0)
+
+    def test_acquire_async(self):
+        rate_limiter = RateLimiter(self.path, 'foobar', 600, burst=1)
+        start = time.perf_counter()
+        asyncio.run(rate_limiter.acquire_async())
+        asyncio.run(rate_limiter.acquire_async())
+        self.assertGreaterEqual(time.perf_counter() - start, 0.09)
+
+    def test_rate_limit_option(self):
+        def options(rate_limit):
+            values = {'username': 'foobar', 'key_file': 'key', 'rate_limit_file': self.path, 'rate_limit': rate_limit}
+            credentials = mock.MagicMock()
+            credentials.conf.side_effect = values.get
+            return _client_options(credentials)
+
+        self.assertEqual(options('60')['rate_limiter'].rate, 1)
+        for rate_limit in ('0', '-10', 'nan', 'often'):
+            self.assertRaises(ValueError, options, rate_limit)
+
+    def test_processes_share_limit(self):
+        context = multiprocessing.get_context()
+        queue = context.Queue()
+        processes = [context.Process(target=_worker, args=(self.path, queue)) for _ in range(PROCESSES)]
+        start = time.time()
+        for process in processes:
+            process.start()
+        times = sorted(queue.get(timeout=30) for _ in range(PROCESSES * REQUESTS))
+        for process in processes:
+            process.join()
+
+        rate = REQUESTS_PER_MINUTE / 60.0
+        # after the burst, the processes together can't go faster than the rate
+        self.assertGreaterEqual(times[-1] - start, (PROCESSES * REQUESTS - BURST) / rate * 0.95)
+        for index, timestamp in enumerate(times):
+            self.assertLessEqual(index + 1, BURST + (timestamp - start) * rate + 1)
+
+
+class Test_TransipClientRateLimit(TestCase):
+    def test_every_request_limited(self):
+        rate_limiter = mock.MagicMock()
+        transip_client = TransipClientTest(rate_limiter=rate_limiter)
+        transip_client.client = mock.MagicMock()
+        transip_client.client.domains.list.return_value = [DomainMock(name='example.com')]
+        transip_client.add_txt_records([('example.com', '_acme-challenge.example.com', 'content')])
+        # listing the domains, getting the domain, listing its entries and creating the record
+        self.assertEqual(rate_limiter.acquire.call_count, 4)
@@ -0,0 +1,198 @@
+from unittest import TestCase
+
+import base64
+import json
+import subprocess
+import sys
+
+import mock
+from certbot.errors import PluginError
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+from certbot_dns_transip.exceptions import TransipHTTPError, TransipParsingError
+from certbot_dns_transip.mock_server import MockTransipServer, TOKEN
+from certbot_dns_transip.rest import TransipAPI, _iter_array, _RestTransipClient
+
+DOMAINS = ['example.com', 'example.org', 'example.net']
+
+
+def _chunks(data, size):
+    return [data[index:index + size] for index in range(0, len(data), size)]
+
+
+class TestIterArray(TestCase):
+    def test_chunked(self):
+        domains = [{'name': 'dömain{0}.example'.format(index), 'tags': ['a', {'b': '[]'}]} for index in range(50)]
+        data = json.dumps({'domains': domains}, ensure_ascii=False, indent=1).encode()
+        # split in the middle of multibyte characters, strings and numbers
+        for size in (1, 7, 1000, len(data)):
+            self.assertEqual(list(_iter_array(_chunks(data, size), 'domains')), domains)
+
+    def test_empty(self):
+        self.assertEqual(list(_iter_array([b'{"dnsEntries": [ ]}'], 'dnsEntries')), [])
+
+    def test_invalid(self):
+        for data in (b'{"domains": null}', b'{"error": "none"}', b'{"domains": [{"name": "example.com"}',
+                     b'{"domains": [{"name": ]}'):
+            self.assertRaises(TransipParsingError, list, _iter_array(_chunks(data, 5), 'domains'))
+
+
+class TestTransipAPI(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def setUp(self):
+        self.transport = mock.MagicMock()
+        self.transport.request.return_value = (201, {}, [b'{"token": "', b'abc"}'])
+
+    def test_login(self):
+        api = TransipAPI('https://api.example/v6/', self.transport, login='foobar', private_key=self.key,
+                         global_key=True)
+
+        self.assertEqual(api.headers['Authorization'], 'Bearer abc')
+        method, url, headers, body = self.transport.request.call_args[0]
+        self.assertEqual((method, url), ('POST', 'https://api.example/v6/auth'))
+        self.assertEqual(json.loads(body.decode())['login'], 'foobar')
+        self.assertTrue(json.loads(body.decode())['global_key'])
+        # raises when the signature doesn't match the body
+        self.key.public_key().verify(base64.b64decode(headers['Signature']), body, padding.PKCS1v15(),
+                                     hashes.SHA512())
+
+    def test_error(self):
+        api = TransipAPI('https://api.example/v6', self.transport, access_token=TOKEN)
+        self.transport.request.return_value = (429, {'Retry-After': '3'}, [b'{"error": "Too many requests"}'])
+
+        with self.assertRaises(TransipHTTPError) as context:
+            api.dns_entries('example.com')
+        self.assertEqual(context.exception.response_code, 429)
+        self.assertEqual(str(context.exception), '429: Too many requests')
+        self.assertEqual(context.exception.headers, {'Retry-After': '3'})
+        self.transport.request.assert_called_once_with(
+            'GET', 'https://api.example/v6/domains/example.com/dns',
+            {'Accept': 'application/json', 'User-Agent': api.headers['User-Agent'], 'Authorization': 'Bearer ' + TOKEN},
+            None)
+
+
+class Test_RestTransipClient(TestCase):
+    def setUp(self):
+        self.stub = MockTransipServer(DOMAINS)
+        self.addCleanup(self.stub.close)
+        patcher = mock.patch('certbot_dns_transip.base.load_private_key', return_value=mock.sentinel.key)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.transip_client = _RestTransipClient(username='foobar', key_file='key', global_key=False,
+                                                 api_url=self.stub.url)
+        self.transip_client.client = TransipAPI(self.stub.url, self.transip_client.transport, access_token=TOKEN)
+
+    @staticmethod
+    def _records(*names):
+        return [(name, '_acme-challenge.' + name, 'content ' + name) for name in names]
+
+    def test_add_and_del_txt_records(self):
+        records = self._records('example.com', 'www.example.com', 'example.org')
+        self.transip_client.add_txt_records(records)
+
+        self.assertEqual(self.stub.zones['example.com'], [
+            {'name': '_acme-challenge', 'type': 'TXT', 'content': 'content example.com', 'expire': 1},
+            {'name': '_acme-challenge.www', 'type': 'TXT', 'content': 'content www.example.com', 'expire': 1},
+        ])
+        self.assertEqual(self.stub.requests, [
+            ('GET', '/v6/domains'),
+            ('GET', '/v6/domains/example.com/dns'),
+            ('POST', '/v6/domains/example.com/dns'),
+            ('POST', '/v6/domains/example.com/dns'),
+            ('GET', '/v6/domains/example.org/dns'),
+            ('POST', '/v6/domains/example.org/dns'),
+        ])
+
+        self.assertEqual(self.transip_client.del_txt_records(records), dict.fromkeys(records))
+        self.assertEqual(self.stub.zones, dict.fromkeys(DOMAINS, []))
+
+    def test_changes_of_other_processes_kept(self):
+        self.transip_client.add_txt_records(self._records('example.com'))
+        other_run = {'name': '_acme-challenge.mail', 'type': 'TXT', 'content': 'other run', 'expire': 1}
+        self.stub.zones['example.com'].append(other_run)
+
+        self.transip_client.add_txt_records(self._records('www.example.com', 'shop.example.com'))
+        self.assertEqual(len(self.stub.zones['example.com']), 4)
+        self.assertIn(other_run, self.stub.zones['example.com'])
+
+    def test_changes_during_update_kept(self):
+        other_run = {'name': '_acme-challenge.mail', 'type': 'TXT', 'content': 'other run', 'expire': 1}
+        handle = self.stub.handle
+
+        def handle_and_change(method, path, headers, body):
+            response = handle(method, path, headers, body)
+            if method == 'GET' and path == '/v6/domains/example.com/dns':
+                # another process adds its record right after the entries were read
+                self.stub.zones['example.com'].append(other_run)
+            return response
+
+        with mock.patch.object(self.stub, 'handle', handle_and_change):
+            self.transip_client.add_txt_records(self._records('example.com', 'www.example.com'))
+        self.assertEqual(len(self.stub.zones['example.com']), 3)
+        self.assertIn(other_run, self.stub.zones['example.com'])
+
+    def test_changes_during_cleanup_kept(self):
+        records = self._records('example.com', 'www.example.com')
+        self.transip_client.add_txt_records(records)
+        other_run = {'name': '_acme-challenge.mail', 'type': 'TXT', 'content': 'other run', 'expire': 1}
+        handle = self.stub.handle
+        changed = []
+
+        def handle_and_change(method, path, headers, body):
+            response = handle(method, path, headers, body)
+            if path == '/v6/domains/example.com/dns' and not changed:
+                # another process adds its record right after the first request of the cleanup
+                changed.append(path)
+                self.stub.zones['example.com'].append(other_run)
+            return response
+
+        with mock.patch.object(self.stub, 'handle', handle_and_change):
+            self.assertEqual(self.transip_client.del_txt_records(records), dict.fromkeys(records))
+        self.assertEqual(self.stub.zones['example.com'], [other_run])
+
+    def test_single_record(self):
+        record = self._records('example.net')[0]
+        self.transip_client.add_txt_record(*record)
+        self.assertEqual(len(self.stub.zones['example.net']), 1)
+        self.transip_client.del_txt_record(*record)
+        self.assertEqual(self.stub.zones['example.net'], [])
+
+        self.transip_client.reset_snapshots()
+        self.assertRaises(PluginError, self.transip_client.del_txt_record, *record)
+
+    def test_nameservers(self):
+        self.assertEqual(self.transip_client.get_nameservers('www.example.org'), self.stub.nameservers)
+
+    def test_token_rejected(self):
+        self.stub.token = 'renewed'
+        with mock.patch('certbot_dns_transip.rest.TransipAPI.request_access_token', return_value='renewed') as login:
+            self.transip_client.add_txt_records(self._records('example.com'))
+        login.assert_called_once_with('foobar', mock.sentinel.key, False)
+        self.assertEqual(len(self.stub.zones['example.com']), 1)
+
+    def test_custom_transport(self):
+        transport = mock.MagicMock()
+        transport.request.side_effect = [
+            (200, {}, [b'{"domains": [{"name": "example.com"}]}']),
+            (200, {}, [b'{"dnsEntries": []}']),
+            (201, {}, []),
+        ]
+        transip_client = _RestTransipClient(username='foobar', key_file='key', global_key=False, transport=transport)
+        with mock.patch('certbot_dns_transip.rest.TransipAPI.request_access_token', return_value='abc'):
+            transip_client.add_txt_records(self._records('example.com'))
+        self.assertEqual([call[0][:2] for call in transport.request.call_args_list], [
+            ('GET', 'https://api.transip.nl/v6/domains'),
+            ('GET', 'https://api.transip.nl/v6/domains/example.com/dns'),
+            ('POST', 'https://api.transip.nl/v6/domains/example.com/dns'),
+        ])
+        self.assertEqual(self.stub.requests, [])
+
+    def test_python_transip_not_imported(self):
+        code = 'import sys, certbot_dns_transip.aio, certbot_dns_transip.rest; print("transip" in sys.modules)'
+        process = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, universal_newlines=True,
+                                 check=True)
+        self.assertEqual(process.stdout.strip(), 'False')
@@ -0,0 +1,212 @@
+from unittest import TestCase
+
+import email.utils
+import time
+
+import mock
+import transip
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from certbot_dns_transip.aio import _AsyncTransipClient
+from certbot_dns_transip.client import _TransipClient
+from certbot_dns_transip.exceptions import TransipHTTPError, TransipIOError
+from certbot_dns_transip.retry import RetryPolicy, entry_created, entry_deleted
+from certbot_dns_transip.mock_server import MockTransipServer, TOKEN
+from certbot_dns_transip.rest import TransipAPI, _RestTransipClient
+
+
+def _error(status, headers=None):
+    return TransipHTTPError('failure', status, headers or {})
+
+
+class TestRetryPolicy(TestCase):
+    def setUp(self):
+        patcher = mock.patch('certbot_dns_transip.retry.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.operation = mock.MagicMock(return_value='result')
+
+    def _delays(self):
+        return [call[0][0] for call in self.sleep.call_args_list]
+
+    def test_success_after_retries(self):
+        self.operation.side_effect = [_error(503), _error(429), TransipIOError('reset'), 'result']
+        self.assertEqual(RetryPolicy(backoff=1).call('test', self.operation, 'arg'), 'result')
+        self.assertEqual(self.operation.call_count, 4)
+        self.operation.assert_called_with('arg')
+        for retry, delay in enumerate(self._delays()):
+            self.assertLessEqual(delay, 2 ** retry)
+
+    def test_backoff_capped(self):
+        self.operation.side_effect = [_error(503)] * 6 + ['result']
+        RetryPolicy(retries=6, backoff=1, max_backoff=3, deadline=1000).call('test', self.operation)
+        self.assertTrue(all(delay <= 3 for delay in self._delays()))
+
+    def test_retry_after_seconds(self):
+        self.operation.side_effect = [_error(429, {'Retry-After': '7'}), 'result']
+        RetryPolicy().call('test', self.operation)
+        self.assertEqual(self._delays(), [7])
+
+    def test_retry_after_date(self):
+        date = email.utils.formatdate(time.time() + 30, usegmt=True)
+        self.operation.side_effect = [_error(503, {'Retry-After': date}), 'result']
+        RetryPolicy().call('test', self.operation)
+        self.assertAlmostEqual(self._delays()[0], 30, delta=2)
+
+    def test_rate_limit_reset(self):
+        self.operation.side_effect = [_error(429, {'X-Rate-Limit-Reset': str(time.time() + 20)}), 'result']
+        RetryPolicy().call('test', self.operation)
+        self.assertAlmostEqual(self._delays()[0], 20, delta=1)
+
+    def test_not_retried(self):
+        self.operation.side_effect = _error(404)
+        self.assertRaises(TransipHTTPError, RetryPolicy().call, 'test', self.operation)
+        self.operation.side_effect = ValueError('bug')
+        self.assertRaises(ValueError, RetryPolicy().call, 'test', self.operation)
+        self.assertEqual(self.operation.call_count, 2)
+
+    def test_retries_exhausted(self):
+        self.operation.side_effect = _error(503)
+        self.assertRaises(TransipHTTPError, RetryPolicy(retries=2).call, 'test', self.operation)
+        self.assertEqual(self.operation.call_count, 3)
+
+    def test_deadline(self):
+        self.operation.side_effect = _error(429, {'Retry-After': '100'})
+        self.assertRaises(TransipHTTPError, RetryPolicy(deadline=60).call, 'test', self.operation)
+        self.sleep.assert_not_called()
+
+    def test_budget_shared_between_calls(self):
+        retry_policy = RetryPolicy(budget=10)
+        self.operation.side_effect = [_error(429, {'Retry-After': '6'}), 'result', _error(429, {'Retry-After': '6'})]
+        retry_policy.call('test', self.operation)
+        self.assertRaises(TransipHTTPError, retry_policy.call, 'test', self.operation)
+        self.assertEqual(retry_policy.budget, 4)
+
+    def test_applied_by_earlier_attempt(self):
+        self.operation.side_effect = [_error(503), TransipHTTPError('This DNS entry already exists', 406)]
+        self.assertIsNone(RetryPolicy().call('test', self.operation, applied=entry_created))
+        self.operation.side_effect = [TransipIOError('reset'), _error(404)]
+        self.assertIsNone(RetryPolicy().call('test', self.operation, applied=entry_deleted))
+        self.assertEqual(self.operation.call_count, 4)
+
+    def test_applied_first_attempt(self):
+        # without an earlier attempt, the error is real
+        self.operation.side_effect = _error(404)
+        self.assertRaises(TransipHTTPError, RetryPolicy().call, 'test', self.operation, applied=entry_deleted)
+        self.operation.side_effect = [_error(503), _error(404)]
+        self.assertRaises(TransipHTTPError, RetryPolicy().call, 'test', self.operation, applied=entry_created)
+
+    def test_retries_logged(self):
+        self.operation.side_effect = [_error(503), 'result']
+        with self.assertLogs('certbot_dns_transip.retry', 'INFO') as logs:
+            RetryPolicy().call('DnsEntryService.create', self.operation)
+        self.assertRegex(logs.output[0], r'DnsEntryService.create failed after \d+\.\d\d seconds \(attempt 1\): '
+                                         r'503: failure, retrying in \d+\.\d\d seconds')
+
+
+class TestRetryAgainstStub(TestCase):
+    # the domain listing, getting the domain, reading its entries and creating both records
+    requests = 5
+    records = [(name, '_acme-challenge.' + name, 'content') for name in ('example.com', 'www.example.com')]
+
+    @classmethod
+    def setUpClass(cls):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        cls.pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                    serialization.NoEncryption()).decode()
+
+    def setUp(self):
+        self.stub = MockTransipServer(['example.com'])
+        self.addCleanup(self.stub.close)
+
+    def _transip_client(self):
+        transip_client = _TransipClient(username='foobar', key_file='key', global_key=False, api_url=self.stub.url,
+                                        retry_policy=RetryPolicy(backoff=0.01))
+        client = transip.TransIP(login='foobar', access_token=TOKEN)
+        client._url = self.stub.url  # pylint: disable=protected-access
+        transip_client.client = client
+        return transip_client
+
+    def test_scripted_failures(self):
+        transip_client = self._transip_client()
+        self.stub.failures = [(429, {'Retry-After': '0.2'}), (503, {}), (502, {})]
+
+        start = time.perf_counter()
+        transip_client.add_txt_records(self.records)
+        duration = time.perf_counter() - start
+
+        self.assertGreaterEqual(duration, 0.2)
+        self.assertEqual(len(self.stub.zones['example.com']), 2)
+        self.assertEqual(len(self.stub.requests), 3 + self.requests)
+
+    def test_login_retried(self):
+        transip_client = self._transip_client()
+        transip_client.private_key = self.pem
+        transip_client._token_expires = 0  # pylint: disable=protected-access
+        self.stub.failures = [(503, {}), (429, {'Retry-After': '0'})]
+
+        transip_client.add_txt_records(self.records)
+
+        self.assertEqual([request for request in self.stub.requests if request[1] == '/v6/auth'],
+                         [('POST', '/v6/auth')] * 3)
+        self.assertEqual(len(self.stub.zones['example.com']), 2)
+
+    def _lose_response(self, method):
+        handle = self.stub.handle
+        lost = []
+
+        def lose_response(request_method, path, headers, body):
+            status, response = handle(request_method, path, headers, body)
+            if request_method == method and not lost:
+                lost.append(path)
+                return 504, {'error': 'Gateway timeout'}
+            return status, response
+
+        self.stub.handle = lose_response
+
+    def test_create_applied(self):
+        transip_client = self._transip_client()
+        self._lose_response('POST')
+        transip_client.add_txt_records(self.records[:1])
+        self.assertEqual(len(self.stub.zones['example.com']), 1)
+        self.assertEqual([method for method, _ in self.stub.requests].count('POST'), 2)
+
+    def test_delete_applied(self):
+        transip_client = self._transip_client()
+        transip_client.add_txt_records(self.records[:1])
+        self._lose_response('DELETE')
+        self.assertEqual(transip_client.del_txt_records(self.records[:1]), {self.records[0]: None})
+        self.assertEqual(self.stub.zones['example.com'], [])
+        self.assertEqual([method for method, _ in self.stub.requests].count('DELETE'), 2)
+
+    def test_retries_exhausted(self):
+        transip_client = self._transip_client()
+        transip_client._get_domains()  # pylint: disable=protected-access
+        self.stub.failures = [(503, {})] * 10
+        self.assertEqual(transip_client.del_txt_records(self.records)[self.records[0]],
+                         'Error removing TXT records from example.com using the Transip API: 503: Scripted failure')
+        self.assertEqual(len(self.stub.requests), 1 + 5)
+
+
+class TestAsyncRetryAgainstStub(TestRetryAgainstStub):
+    # the asyncio backend doesn't need to get the domain first
+    requests = 4
+
+    def _transip_client(self):
+        transip_client = _AsyncTransipClient(username='foobar', key_file='key', global_key=False,
+                                             retry_policy=RetryPolicy(backoff=0.01))
+        transip_client.client = transip.TransIP(login='foobar', access_token=TOKEN)
+        transip_client.api_url = self.stub.url
+        return transip_client
+
+
+class TestRestRetryAgainstStub(TestRetryAgainstStub):
+    # the built-in REST client doesn't need to get the domain first
+    requests = 4
+
+    def _transip_client(self):
+        transip_client = _RestTransipClient(username='foobar', key_file='key', global_key=False, api_url=self.stub.url,
+                                            retry_policy=RetryPolicy(backoff=0.01))
+        transip_client.client = TransipAPI(self.stub.url, transip_client.transport, access_token=TOKEN)
+        return transip_client
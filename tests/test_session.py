@@ -0,0 +1,84 @@
+from unittest import TestCase
+
+import transip
+from certbot.errors import PluginError
+
+from certbot_dns_transip.aio import _AsyncTransipClient
+from certbot_dns_transip.client import _TransipClient
+from certbot_dns_transip.retry import RetryPolicy
+from certbot_dns_transip.options import HTTPOptions
+from certbot_dns_transip.mock_server import MockTransipServer, TOKEN
+from certbot_dns_transip.rest import TransipAPI, _RestTransipClient
+
+DOMAINS = ['example.com', 'example.org', 'example.net']
+RECORDS = [(name, '_acme-challenge.' + name, 'content') for name in DOMAINS + ['www.example.com']]
+
+
+class TestSession(TestCase):
+    def setUp(self):
+        self.stub = MockTransipServer(DOMAINS)
+        self.addCleanup(self.stub.close)
+
+    def _transip_client(self, **kwargs):
+        transip_client = _TransipClient(username='foobar', key_file='key', global_key=False, **kwargs)
+        client = transip.TransIP(login='foobar', access_token=TOKEN)
+        client._url = self.stub.url  # pylint: disable=protected-access
+        transip_client.client = client
+        return transip_client
+
+    def test_connection_reused(self):
+        transip_client = self._transip_client()
+        transip_client.add_txt_records(RECORDS)
+        transip_client.del_txt_records(RECORDS)
+        self.assertGreater(len(self.stub.requests), 10)
+        self.assertEqual(self.stub.connections, 1)
+
+    def test_pool_shared_by_workers(self):
+        transip_client = self._transip_client(max_workers=3, http_options=HTTPOptions(pool_size=3))
+        for _ in range(3):
+            transip_client.add_txt_records(RECORDS)
+            transip_client.del_txt_records(RECORDS)
+        self.assertLessEqual(self.stub.connections, 3)
+
+    def test_no_keep_alive(self):
+        transip_client = self._transip_client(http_options=HTTPOptions(keep_alive=False))
+        transip_client.add_txt_records(RECORDS)
+        self.assertEqual(self.stub.connections, len(self.stub.requests))
+
+    def test_read_timeout(self):
+        transip_client = self._transip_client(http_options=HTTPOptions(read_timeout=0.1),
+                                              retry_policy=RetryPolicy(retries=0))
+        transip_client._get_domains()  # pylint: disable=protected-access
+        self.stub.latency = 0.5
+        self.assertRaises(PluginError, transip_client.add_txt_records, RECORDS)
+
+
+class TestAsyncSession(TestSession):
+    def _transip_client(self, **kwargs):
+        transip_client = _AsyncTransipClient(username='foobar', key_file='key', global_key=False, **kwargs)
+        transip_client.client = transip.TransIP(login='foobar', access_token=TOKEN)
+        transip_client.api_url = self.stub.url
+        return transip_client
+
+    def test_connection_reused(self):
+        transip_client = self._transip_client(max_workers=1)
+        transip_client.add_txt_records(RECORDS)
+        transip_client.del_txt_records(RECORDS)
+        # the connections of an event loop are closed when it ends
+        self.assertEqual(self.stub.connections, 3)
+
+    def test_pool_shared_by_workers(self):
+        transip_client = self._transip_client(max_workers=3, http_options=HTTPOptions(pool_size=3))
+        for _ in range(3):
+            transip_client.add_txt_records(RECORDS)
+            transip_client.del_txt_records(RECORDS)
+        # at most 3 connections for every batch, and one for the domain listing
+        self.assertLessEqual(self.stub.connections, 3 * 6 + 1)
+
+
+class TestRestSession(TestSession):
+    def _transip_client(self, **kwargs):
+        transip_client = _RestTransipClient(username='foobar', key_file='key', global_key=False, api_url=self.stub.url,
+                                            **kwargs)
+        transip_client.client = TransipAPI(self.stub.url, transip_client.transport, access_token=TOKEN)
+        return transip_client
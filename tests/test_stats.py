@@ -0,0 +1,69 @@
+from unittest import TestCase
+
+import io
+import os
+import shutil
+import tempfile
+
+from certbot.plugins import dns_test_common
+
+from certbot_dns_transip.stats import PropagationStats, main
+
+
+class TestPropagationStats(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.stats = PropagationStats(os.path.join(self.tempdir, 'propagation.json'), samples=5)
+
+    def test_recent_samples_kept(self):
+        for seconds in range(8):
+            self.stats.record({'example.com': seconds, 'example.org': 100})
+        self.assertEqual([seconds for _, seconds in self.stats.get()['example.com']], [3, 4, 5, 6, 7])
+        self.assertEqual(len(self.stats.get()['example.org']), 5)
+
+    def test_wait_seconds(self):
+        for seconds in (3, 4, 30, 5, 2):
+            self.stats.record({'fast.example': 1, 'usual.example': seconds, 'slow.example': seconds * 100})
+        self.stats.record({'new.example': 1})
+
+        self.assertEqual(self.stats.wait_seconds(['fast.example'], 95, 10, 240), 10)
+        self.assertEqual(self.stats.wait_seconds(['usual.example'], 95, 10, 240), 30)
+        self.assertEqual(self.stats.wait_seconds(['usual.example'], 50, 1, 240), 4)
+        self.assertEqual(self.stats.wait_seconds(['slow.example'], 95, 10, 240), 240)
+        # too little history, or none at all
+        self.assertEqual(self.stats.wait_seconds(['new.example'], 95, 10, 240), 240)
+        self.assertEqual(self.stats.wait_seconds(['other.example'], 95, 10, 240), 240)
+        # the slowest domain decides
+        self.assertEqual(self.stats.wait_seconds(['fast.example', 'usual.example'], 95, 10, 240), 30)
+
+    def test_reset(self):
+        self.stats.record({'example.com': 1, 'example.org': 2, 'example.net': 3})
+        self.assertEqual(self.stats.reset(['example.org', 'other.example']), ['example.org'])
+        self.assertEqual(sorted(self.stats.get()), ['example.com', 'example.net'])
+        self.assertEqual(self.stats.reset(), ['example.com', 'example.net'])
+        self.assertEqual(self.stats.get(), {})
+
+    def test_main(self):
+        path = os.path.join(self.tempdir, 'transip.ini')
+        dns_test_common.write({'dns_transip_username': 'foobar', 'dns_transip_propagation_stats': self.stats.path},
+                              path)
+        for seconds in (12, 15, 45):
+            self.stats.record({'example.com': seconds, 'example.org': 1})
+
+        output = io.StringIO()
+        self.assertEqual(main(['--credentials', path, 'show', '--ceiling', '40'], output), 0)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0].split(), ['domain', 'samples', 'median', 'p95', 'max', 'wait'])
+        self.assertEqual(lines[1].split(), ['example.com', '3', '15.0', '45.0', '45.0', '40.0'])
+        self.assertEqual(lines[2].split(), ['example.org', '3', '1.0', '1.0', '1.0', '10.0'])
+
+        output = io.StringIO()
+        self.assertEqual(main(['--credentials', path, 'reset', 'example.org'], output), 0)
+        self.assertIn('Forgot the propagation times of 1 domains', output.getvalue())
+        self.assertEqual(list(self.stats.get()), ['example.com'])
+
+    def test_main_without_stats(self):
+        path = os.path.join(self.tempdir, 'transip.ini')
+        dns_test_common.write({'dns_transip_username': 'foobar'}, path)
+        self.assertEqual(main(['--credentials', path, 'show']), 2)